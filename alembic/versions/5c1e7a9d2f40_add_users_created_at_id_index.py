@@ -0,0 +1,40 @@
+"""add users created_at, id index
+
+Revision ID: 5c1e7a9d2f40
+Revises: 37a049d4d0bc
+Create Date: 2026-10-17 12:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5c1e7a9d2f40"
+down_revision: Union[str, None] = "37a049d4d0bc"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # built concurrently (outside the migration transaction) to not lock the table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_users_created_at_id",
+            "user_users",
+            ["created_at", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_user_users_created_at_id",
+            table_name="user_users",
+            postgresql_concurrently=True,
+        )
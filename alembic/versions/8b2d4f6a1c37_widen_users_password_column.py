@@ -0,0 +1,42 @@
+"""widen users password column
+
+Revision ID: 8b2d4f6a1c37
+Revises: 5c1e7a9d2f40
+Create Date: 2026-10-17 13:10:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "8b2d4f6a1c37"
+down_revision: Union[str, None] = "5c1e7a9d2f40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # argon2 hashes do not fit in 60 chars (bcrypt)
+    op.alter_column(
+        "user_users",
+        "password",
+        existing_type=sa.String(length=60),
+        type_=sa.String(length=255),
+        existing_nullable=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column(
+        "user_users",
+        "password",
+        existing_type=sa.String(length=255),
+        type_=sa.String(length=60),
+        existing_nullable=False,
+    )
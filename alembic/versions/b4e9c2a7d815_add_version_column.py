@@ -0,0 +1,33 @@
+"""add version column
+
+Revision ID: b4e9c2a7d815
+Revises: 8b2d4f6a1c37
+Create Date: 2026-10-17 13:40:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b4e9c2a7d815"
+down_revision: Union[str, None] = "8b2d4f6a1c37"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # a constant server default does not rewrite the table
+    op.add_column(
+        "user_users",
+        sa.Column("version", sa.BigInteger(), server_default="1", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("user_users", "version")
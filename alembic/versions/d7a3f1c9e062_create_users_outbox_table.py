@@ -0,0 +1,49 @@
+"""create users outbox table
+
+Revision ID: d7a3f1c9e062
+Revises: b4e9c2a7d815
+Create Date: 2026-10-17 14:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "d7a3f1c9e062"
+down_revision: Union[str, None] = "b4e9c2a7d815"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "user_users_outbox",
+        sa.Column("event_type", sa.String(length=32), nullable=False),
+        sa.Column("aggregate_id", sa.BigInteger(), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("ulid", sa.String(length=32), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("verified_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("modified_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("version", sa.BigInteger(), server_default="1", nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_user_users_outbox_ulid"),
+        "user_users_outbox",
+        ["ulid"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_user_users_outbox_ulid"), table_name="user_users_outbox")
+    op.drop_table("user_users_outbox")
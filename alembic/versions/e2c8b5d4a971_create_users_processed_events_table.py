@@ -0,0 +1,60 @@
+"""create users processed events table
+
+Revision ID: e2c8b5d4a971
+Revises: d7a3f1c9e062
+Create Date: 2026-10-17 16:05:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e2c8b5d4a971"
+down_revision: Union[str, None] = "d7a3f1c9e062"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "user_users_processed_events",
+        sa.Column("message_id", sa.String(length=64), nullable=False),
+        sa.Column("id", sa.BigInteger(), nullable=False),
+        sa.Column("ulid", sa.String(length=32), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("verified_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("modified_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("version", sa.BigInteger(), server_default="1", nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_user_users_processed_events_message_id"),
+        "user_users_processed_events",
+        ["message_id"],
+        unique=True,
+    )
+    op.create_index(
+        op.f("ix_user_users_processed_events_ulid"),
+        "user_users_processed_events",
+        ["ulid"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        op.f("ix_user_users_processed_events_ulid"),
+        table_name="user_users_processed_events",
+    )
+    op.drop_index(
+        op.f("ix_user_users_processed_events_message_id"),
+        table_name="user_users_processed_events",
+    )
+    op.drop_table("user_users_processed_events")
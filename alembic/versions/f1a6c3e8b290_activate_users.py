@@ -0,0 +1,44 @@
+"""activate users
+
+Revision ID: f1a6c3e8b290
+Revises: e2c8b5d4a971
+Create Date: 2026-10-17 14:20:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f1a6c3e8b290"
+down_revision: Union[str, None] = "e2c8b5d4a971"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # inactive users can not log in anymore; nothing ever activated users, so every
+    # existing user only holds the old default (false)
+    op.execute(sa.text("UPDATE user_users SET is_active = true"))
+    op.alter_column(
+        "user_users",
+        "is_active",
+        existing_type=sa.Boolean(),
+        server_default=sa.true(),
+        existing_nullable=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.alter_column(
+        "user_users",
+        "is_active",
+        existing_type=sa.Boolean(),
+        server_default=None,
+        existing_nullable=False,
+    )
@@ -0,0 +1,105 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+
+measure the cpu cost of password hashing policies on this machine, to tune
+HASHING_BCRYPT_ROUNDS / HASHING_ARGON2_* and HASHING_MAX_WORKERS.
+
+usage:
+    python -m benchmarks.hashing --bcrypt-rounds 10 11 12 13 --iterations 20
+    python -m benchmarks.hashing --argon2-memory-cost 19456 65536 --argon2-time-cost 2 3
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from tabulate import tabulate
+
+from common_libs.hashing import build_crypt_context
+
+
+def measure(context, iterations: int) -> tuple[float, float]:
+    """median hash and verify time (ms) of a crypt context"""
+    secret = "benchmark-password"
+    hashed = context.hash(secret)
+    hash_times, verify_times = [], []
+    for _ in range(iterations):
+        started_at = time.perf_counter()
+        context.hash(secret)
+        hash_times.append(time.perf_counter() - started_at)
+
+        started_at = time.perf_counter()
+        context.verify(secret, hashed)
+        verify_times.append(time.perf_counter() - started_at)
+    return statistics.median(hash_times) * 1000, statistics.median(verify_times) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[1])
+    parser.add_argument(
+        "--bcrypt-rounds", type=int, nargs="*", default=[10, 11, 12, 13]
+    )
+    parser.add_argument("--argon2-time-cost", type=int, nargs="*", default=[])
+    parser.add_argument("--argon2-memory-cost", type=int, nargs="*", default=[65536])
+    parser.add_argument("--argon2-parallelism", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="hashing workers used to estimate the logins/s of one service worker",
+    )
+    args = parser.parse_args()
+
+    policies = [
+        (f"bcrypt rounds={rounds}", dict(schemes=["bcrypt"], bcrypt_rounds=rounds))
+        for rounds in args.bcrypt_rounds
+    ]
+    policies += [
+        (
+            f"argon2 t={time_cost} m={memory_cost}KiB p={args.argon2_parallelism}",
+            dict(
+                schemes=["argon2"],
+                argon2_time_cost=time_cost,
+                argon2_memory_cost=memory_cost,
+                argon2_parallelism=args.argon2_parallelism,
+            ),
+        )
+        for time_cost in args.argon2_time_cost
+        for memory_cost in args.argon2_memory_cost
+    ]
+
+    rows = []
+    for name, policy in policies:
+        hash_ms, verify_ms = measure(build_crypt_context(**policy), args.iterations)
+        rows.append(
+            [
+                name,
+                f"{hash_ms:.1f}",
+                f"{verify_ms:.1f}",
+                f"{args.workers * 1000 / verify_ms:.0f}",
+            ]
+        )
+
+    print(
+        tabulate(
+            rows,
+            [
+                "policy",
+                "hash ms (p50)",
+                "verify ms (p50)",
+                f"logins/s ({args.workers} workers)",
+            ],
+            tablefmt="github",
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
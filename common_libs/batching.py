@@ -0,0 +1,89 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import asyncio
+import typing
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent callers into small batches.
+
+    A batch is flushed once it holds `max_batch_size` items or `max_delay`
+    seconds after its first item arrived, whichever comes first. The flush
+    function receives the list of items and must return one result per item
+    (in the same order); every caller gets back the result of its own item.
+    If the flush function raises, the exception is raised to every caller of
+    that batch.
+    """
+
+    def __init__(
+        self,
+        flush: typing.Callable[[list], typing.Awaitable[list]],
+        max_batch_size: int = 100,
+        max_delay: float = 0.05,
+    ) -> None:
+        """
+        Initializes the MicroBatcher instance.
+
+        Args:
+            flush: coroutine function applying a batch, returns a result per item.
+            max_batch_size (int): flush as soon as this many items are pending (default: 100).
+            max_delay (float): seconds to wait for more items before flushing (default: 0.05).
+        """
+        self.flush = flush
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._pending: list[tuple[typing.Any, asyncio.Future]] = []
+        self._timer: typing.Optional[asyncio.TimerHandle] = None
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    async def submit(self, item: typing.Any) -> typing.Any:
+        """add an item to the current batch and wait for its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush_pending()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush_pending)
+
+        return await future
+
+    def _flush_pending(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._run(batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _run(self, batch: list[tuple[typing.Any, asyncio.Future]]) -> None:
+        try:
+            results = await self.flush([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def close(self) -> None:
+        """flush pending items and wait for running flushes to finish"""
+        self._flush_pending()
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
@@ -0,0 +1,235 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import time
+import typing
+
+from passlib.context import CryptContext
+
+from common_libs import tracing
+from common_libs.metrics import HASHING_DURATION, HASHING_REJECTED
+
+
+class HashingQueueFullError(RuntimeError):
+    """Raised when the hashing executor has no free slot for a new job."""
+
+
+# crypt context used inside process pool workers, built once per worker
+# from the parent's policy string (CryptContext objects are not picklable).
+_process_crypt_context: typing.Optional[CryptContext] = None
+
+
+def _init_process_worker(policy: str) -> None:
+    global _process_crypt_context
+    _process_crypt_context = CryptContext.from_string(policy)
+
+
+def _process_hash(secret: str) -> str:
+    return _process_crypt_context.hash(secret)
+
+
+def _process_verify(secret: str, hashed: str) -> bool:
+    return _process_crypt_context.verify(secret, hashed)
+
+
+def _process_verify_and_update(
+    secret: str, hashed: str
+) -> tuple[bool, typing.Optional[str]]:
+    return _process_crypt_context.verify_and_update(secret, hashed)
+
+
+def build_crypt_context(
+    schemes: typing.Sequence[str] = ("bcrypt",),
+    bcrypt_rounds: int = 12,
+    argon2_time_cost: int = 3,
+    argon2_memory_cost: int = 65536,
+    argon2_parallelism: int = 4,
+) -> CryptContext:
+    """
+    Build the passlib context of a hashing policy.
+
+    The first scheme hashes new secrets, hashes of the other schemes are only
+    verified and reported as outdated by `needs_update`. Hashes of the first
+    scheme are outdated too if they were made with a lower cost (e.g. after
+    raising `bcrypt_rounds`), so they are upgraded on the next verification.
+    argon2 needs the optional `argon2-cffi` package.
+
+    Args:
+        schemes: enabled schemes, in order of preference (default: bcrypt).
+        bcrypt_rounds (int): log2 of the bcrypt iterations (default: 12).
+        argon2_time_cost (int): argon2 iterations (default: 3).
+        argon2_memory_cost (int): argon2 memory in KiB (default: 64MiB).
+        argon2_parallelism (int): argon2 lanes (default: 4).
+    """
+    settings = {}
+    if "bcrypt" in schemes:
+        settings.update(bcrypt__rounds=bcrypt_rounds, bcrypt__min_rounds=bcrypt_rounds)
+    if "argon2" in schemes:
+        settings.update(
+            argon2__time_cost=argon2_time_cost,
+            argon2__memory_cost=argon2_memory_cost,
+            argon2__parallelism=argon2_parallelism,
+        )
+    return CryptContext(schemes=list(schemes), deprecated="auto", **settings)
+
+
+class PasswordHashingExecutor:
+    """
+    Runs password hashing and verification off the asyncio event loop.
+
+    Every job is submitted to a bounded thread or process pool. The number of
+    jobs that may be running or waiting at once is capped at
+    `max_workers + max_queue_size`; once that limit is reached new jobs are
+    rejected with `HashingQueueFullError` instead of piling up, so callers can
+    shed load (e.g. respond with HTTP 503) rather than stalling the worker.
+    """
+
+    POOL_TYPES = ("thread", "process")
+
+    def __init__(
+        self,
+        crypt_context: CryptContext,
+        pool_type: str = "thread",
+        max_workers: typing.Optional[int] = None,
+        max_queue_size: int = 64,
+    ) -> None:
+        """
+        Initializes the PasswordHashingExecutor instance.
+
+        Args:
+            crypt_context (CryptContext): passlib context used for hashing and verification.
+            pool_type (str): "thread" or "process" (default: "thread").
+            max_workers (int): number of pool workers (default: number of cpus).
+            max_queue_size (int): number of jobs allowed to wait for a free worker (default: 64).
+        """
+        if pool_type not in self.POOL_TYPES:
+            raise ValueError(
+                f"invalid hashing pool type: {pool_type}, expected one of {self.POOL_TYPES}"
+            )
+        self.crypt_context = crypt_context
+        self.pool_type = pool_type
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue_size = max_queue_size
+        self._executor: typing.Optional[concurrent.futures.Executor] = None
+        self._in_flight = 0
+
+    @property
+    def capacity(self) -> int:
+        """maximum number of running + waiting jobs."""
+        return self.max_workers + self.max_queue_size
+
+    @property
+    def in_flight(self) -> int:
+        """number of jobs currently running or waiting for a worker."""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """number of jobs waiting for a free worker."""
+        return max(0, self._in_flight - self.max_workers)
+
+    def _get_executor(self) -> concurrent.futures.Executor:
+        """create the pool lazily, so importing this module never forks processes."""
+        if self._executor is None:
+            if self.pool_type == "process":
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_process_worker,
+                    initargs=(self.crypt_context.to_string(),),
+                )
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="password-hashing",
+                )
+        return self._executor
+
+    def _release(self, operation: str, started_at: float) -> None:
+        self._in_flight -= 1
+        HASHING_DURATION.labels(operation).observe(time.perf_counter() - started_at)
+
+    async def _submit(
+        self,
+        thread_func: typing.Callable,
+        process_func: typing.Callable,
+        *args,
+    ) -> typing.Any:
+        if self._in_flight >= self.capacity:
+            HASHING_REJECTED.inc()
+            raise HashingQueueFullError(
+                f"password hashing executor is saturated ({self._in_flight}/{self.capacity} jobs)."
+            )
+
+        loop = asyncio.get_running_loop()
+        func = process_func if self.pool_type == "process" else thread_func
+        started_at = time.perf_counter()
+        future = self._get_executor().submit(func, *args)
+        self._in_flight += 1
+        # the slot is released when the job really finishes (not when the
+        # awaiting coroutine is cancelled), so the limit reflects pool load.
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(
+                self._release, thread_func.__name__, started_at
+            )
+        )
+        with tracing.span(
+            f"password_hashing {thread_func.__name__}",
+            attributes={"hashing.queue_depth": self.queue_depth},
+        ):
+            return await asyncio.wrap_future(future)
+
+    async def hash(self, secret: str) -> str:
+        """
+        Hash a secret in the pool.
+
+        Raises:
+            HashingQueueFullError: if the executor is saturated.
+        """
+        return await self._submit(self.crypt_context.hash, _process_hash, secret)
+
+    async def verify(self, secret: str, hashed: str) -> bool:
+        """
+        Verify a secret against a hash in the pool.
+
+        Raises:
+            HashingQueueFullError: if the executor is saturated.
+        """
+        return await self._submit(
+            self.crypt_context.verify, _process_verify, secret, hashed
+        )
+
+    async def verify_and_update(
+        self, secret: str, hashed: str
+    ) -> tuple[bool, typing.Optional[str]]:
+        """
+        Verify a secret against a hash and re-hash it if the hash is outdated
+        (deprecated scheme or lower cost than the current policy), in one job.
+
+        Returns:
+            `(is_valid, new_hash)`, `new_hash` is None unless the secret is
+            valid and its hash should be replaced.
+
+        Raises:
+            HashingQueueFullError: if the executor is saturated.
+        """
+        return await self._submit(
+            self.crypt_context.verify_and_update,
+            _process_verify_and_update,
+            secret,
+            hashed,
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        """shutdown the underlying pool, if it was created."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,139 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import collections
+import time
+import typing
+
+
+class LRUCache:
+    """
+    Bounded in-process LRU cache with per-entry ttl.
+
+    The cache is capped both by number of entries and by the total size of the
+    stored values (bytes/str values are measured by their length, other values
+    must be given an explicit size). The least recently used entries are
+    evicted once either limit is exceeded. Not thread-safe; meant to be used
+    from a single event loop.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 5.0,
+    ) -> None:
+        """
+        Initializes the LRUCache instance.
+
+        Args:
+            max_entries (int): maximum number of entries (default: 1024).
+            max_bytes (int): maximum total size of the values (default: 16MiB).
+            ttl (float): seconds an entry stays valid (default: 5.0).
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: collections.OrderedDict[
+            typing.Hashable, tuple[typing.Any, float, int]
+        ] = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        """total size of the stored values"""
+        return self._bytes
+
+    def get(self, key: typing.Hashable) -> typing.Any:
+        """
+        Return the value of a key, or None if the key is missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._pop(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(
+        self,
+        key: typing.Hashable,
+        value: typing.Any,
+        size: typing.Optional[int] = None,
+        ttl: typing.Optional[float] = None,
+    ) -> None:
+        """
+        Store a value, evicting least recently used entries if needed.
+
+        Args:
+            key: cache key.
+            value: value to store (must not be None).
+            size: size of the value, defaults to len(value) for bytes/str values.
+            ttl: entry ttl, defaults to the cache ttl.
+        """
+        if size is None:
+            size = len(value) if isinstance(value, (bytes, str)) else 0
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._pop(key)
+        self._entries[key] = (
+            value,
+            time.monotonic() + (self.ttl if ttl is None else ttl),
+            size,
+        )
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._pop(oldest_key)
+            self.evictions += 1
+
+    def delete(self, *keys: typing.Hashable) -> None:
+        """remove keys from the cache, missing keys are ignored"""
+        for key in keys:
+            if key in self._entries:
+                self._pop(key)
+
+    def clear(self) -> None:
+        """remove all entries (counters are kept)"""
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        """hit/miss/eviction counters and current usage"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def _pop(self, key: typing.Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
@@ -0,0 +1,239 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import asyncio
+import os
+import time
+import typing
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+# buckets in seconds, from sub-millisecond cache hits to slow requests
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route template and status code.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request duration by route template.",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests currently being handled."
+)
+
+DB_POOL_CHECKOUT_DURATION = Histogram(
+    "db_pool_checkout_duration_seconds",
+    "Time spent waiting for a database connection from the pool.",
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts_total",
+    "Pool checkouts that failed (pool exhausted for `pool_timeout` seconds).",
+)
+
+HASHING_DURATION = Histogram(
+    "password_hashing_duration_seconds",
+    "Password hashing jobs duration, including the wait for a free worker.",
+    ["operation"],
+    buckets=LATENCY_BUCKETS,
+)
+HASHING_QUEUE_DEPTH = Gauge(
+    "password_hashing_queue_depth", "Password hashing jobs waiting for a free worker."
+)
+HASHING_IN_FLIGHT = Gauge(
+    "password_hashing_in_flight", "Password hashing jobs running or waiting."
+)
+HASHING_REJECTED = Counter(
+    "password_hashing_rejected_total",
+    "Password hashing jobs rejected because the executor was saturated.",
+)
+
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "Cache lookups by cache and result (l1_hit, redis_hit, miss).",
+    ["cache", "result"],
+)
+
+RABBITMQ_CONSUMED = Counter(
+    "rabbitmq_messages_consumed_total", "Messages delivered to a consumer.", ["queue"]
+)
+RABBITMQ_ACKED = Counter(
+    "rabbitmq_messages_acked_total", "Messages handled successfully.", ["queue"]
+)
+RABBITMQ_NACKED = Counter(
+    "rabbitmq_messages_nacked_total",
+    "Messages that failed, by what happened to them (retry, park, requeue, drop).",
+    ["queue", "action"],
+)
+RABBITMQ_HANDLER_DURATION = Histogram(
+    "rabbitmq_handler_duration_seconds",
+    "Duration of the message handlers.",
+    ["queue"],
+    buckets=LATENCY_BUCKETS,
+)
+RABBITMQ_HANDLERS_IN_PROGRESS = Gauge(
+    "rabbitmq_handlers_in_progress", "Message handlers currently running.", ["queue"]
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay of the event loop in running a scheduled callback.",
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class PrometheusMiddleware:
+    """
+    ASGI middleware recording the count and duration of HTTP requests.
+
+    Requests are labelled with the route template (e.g. `/users/id/{user_id}`), not
+    the raw path, so the number of series stays bounded. It is a plain ASGI
+    middleware (no `BaseHTTPMiddleware`), which keeps the per-request cost to a few
+    microseconds and does not interfere with streaming responses.
+    """
+
+    def __init__(self, app, excluded_paths: typing.Iterable[str] = ("/metrics",)):
+        """
+        Args:
+            app: the wrapped ASGI application.
+            excluded_paths: paths that are not recorded (default: "/metrics").
+        """
+        self.app = app
+        self.excluded_paths = set(excluded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_PROGRESS.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - started_at
+            HTTP_REQUESTS_IN_PROGRESS.dec()
+            # set by the router once the request matched a route
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_DURATION.labels(scope["method"], route).observe(duration)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    `AsyncAdaptedQueuePool` recording the time spent waiting for a connection,
+    pass it as `poolclass` of `create_async_engine`.
+    """
+
+    def _do_get(self):
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_CHECKOUT_TIMEOUTS.inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_DURATION.observe(time.perf_counter() - started_at)
+
+
+def instrument_engine_pool(engine: AsyncEngine, name: str = "default") -> None:
+    """
+    Export the state of the connection pool of an engine as gauges. The values are
+    read from the pool when metrics are scraped, nothing is done per query.
+
+    Args:
+        engine (AsyncEngine): engine whose pool is exported.
+        name (str): value of the `engine` label (default: "default").
+    """
+    pool = engine.sync_engine.pool
+    gauges = {
+        "db_pool_size": ("Configured number of pooled connections.", pool.size),
+        "db_pool_checked_out": (
+            "Connections currently checked out (in use).",
+            pool.checkedout,
+        ),
+        "db_pool_checked_in": ("Idle connections in the pool.", pool.checkedin),
+        "db_pool_overflow": (
+            "Connections opened beyond the pool size (negative: not opened yet).",
+            pool.overflow,
+        ),
+    }
+    for metric, (documentation, func) in gauges.items():
+        Gauge(metric, documentation, ["engine"]).labels(name).set_function(func)
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """
+    Measure how late the event loop wakes up a sleeping task, runs until cancelled.
+    A growing lag means the loop is blocked by cpu-bound or synchronous code.
+
+    Args:
+        interval (float): seconds between two measures (default: 0.5).
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started_at = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - started_at - interval))
+
+
+def metrics_payload() -> tuple[bytes, str]:
+    """
+    Render the metrics in the prometheus text format. When the app runs with several
+    worker processes, set `PROMETHEUS_MULTIPROC_DIR` to aggregate all of them.
+
+    Returns:
+        the payload and its content type.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,189 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import contextvars
+import logging
+import random
+import time
+import typing
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class RequestQueryStats:
+    """Number and total duration of the queries run for one request."""
+
+    __slots__ = ("scope", "count", "duration")
+
+    def __init__(self, scope: typing.Optional[dict] = None) -> None:
+        self.scope = scope
+        self.count = 0
+        self.duration = 0.0
+
+    @property
+    def route(self) -> str:
+        """route template of the request, set by the router once it matched"""
+        if self.scope is None:
+            return "-"
+        return getattr(self.scope.get("route"), "path", self.scope.get("path", "-"))
+
+
+_request_stats: contextvars.ContextVar[typing.Optional[RequestQueryStats]] = (
+    contextvars.ContextVar("request_query_stats", default=None)
+)
+
+
+def parameters_shape(parameters: typing.Any, executemany: bool = False) -> str:
+    """
+    Describe the bound parameters of a statement without their values (which may
+    hold personal data), e.g. `(int, str)` or `500 x {id: int, name: str}`.
+    """
+    if executemany and isinstance(parameters, (list, tuple)):
+        first = parameters[0] if parameters else ()
+        return f"{len(parameters)} x {parameters_shape(first)}"
+    if isinstance(parameters, dict):
+        fields = ", ".join(
+            f"{key}: {type(value).__name__}" for key, value in parameters.items()
+        )
+        return "{" + fields + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+
+class QueryProfiler:
+    """
+    Times every statement of an engine with cursor execute events.
+
+    Statements slower than `slow_query_threshold` are logged (optionally sampled)
+    with the route of the request and the shape of their parameters. Queries are
+    counted per request by `QueryProfilerMiddleware`, requests running more than
+    `max_queries_per_request` queries (typically an N+1) are logged too.
+
+    The hooks cost two `perf_counter` calls per statement, so they can stay on in
+    production, unlike the engine `echo`.
+    """
+
+    def __init__(
+        self,
+        slow_query_threshold: float = 0.2,
+        sample_rate: float = 1.0,
+        max_queries_per_request: int = 50,
+        server_timing: bool = False,
+        logger: typing.Optional[logging.Logger] = None,
+    ) -> None:
+        """
+        Initializes the QueryProfiler instance.
+
+        Args:
+            slow_query_threshold (float): duration in seconds from which a query is logged (default: 0.2).
+            sample_rate (float): fraction of the slow queries that are logged (default: 1, all of them).
+            max_queries_per_request (int): query count from which a request is logged (default: 50).
+            server_timing (bool): add a `Server-Timing` header with the db time to responses (default: False).
+            logger (logging.Logger): logger of the reports (default: "db.profiler").
+        """
+        self.slow_query_threshold = slow_query_threshold
+        self.sample_rate = sample_rate
+        self.max_queries_per_request = max_queries_per_request
+        self.server_timing = server_timing
+        self.logger = logger or logging.getLogger("db.profiler")
+
+    def instrument(self, engine: AsyncEngine) -> None:
+        """listen to the statements of an engine"""
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after_execute)
+        event.listen(engine.sync_engine, "handle_error", self._on_error)
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @staticmethod
+    def _on_error(exception_context):
+        # a failed statement has no after_cursor_execute, drop its start time so it
+        # does not stay on the pooled connection
+        connection = exception_context.connection
+        started = connection.info.get("query_started_at") if connection else None
+        if started:
+            started.pop()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info["query_started_at"].pop()
+        duration = time.perf_counter() - started_at
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.duration += duration
+
+        if duration < self.slow_query_threshold:
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self.logger.warning(
+            "slow query: %.1f ms, route: %s, parameters: %s, statement: %s",
+            duration * 1000,
+            stats.route if stats is not None else "-",
+            parameters_shape(parameters, executemany),
+            " ".join(statement.split())[:1000],
+        )
+
+    def request_finished(self, stats: RequestQueryStats) -> None:
+        if stats.count >= self.max_queries_per_request:
+            self.logger.warning(
+                "%d queries (%.1f ms) in one request, route: %s",
+                stats.count,
+                stats.duration * 1000,
+                stats.route,
+            )
+
+
+class QueryProfilerMiddleware:
+    """
+    ASGI middleware counting the queries of every request for a `QueryProfiler`,
+    and adding the `Server-Timing` header if enabled, e.g.
+    `Server-Timing: db;dur=12.5;desc="4 queries"`.
+    """
+
+    def __init__(self, app, profiler: QueryProfiler) -> None:
+        """
+        Args:
+            app: the wrapped ASGI application.
+            profiler (QueryProfiler): profiler instrumenting the engine.
+        """
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats(scope)
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and self.profiler.server_timing:
+                timing = (
+                    f'db;dur={stats.duration * 1000:.1f};desc="{stats.count} queries"'
+                )
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (b"server-timing", timing.encode()),
+                    ],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            self.profiler.request_finished(stats)
@@ -9,27 +9,52 @@
 
 import asyncio
 import logging
+import random
+import time
 import typing
 
 import aio_pika
+from aio_pika.abc import AbstractIncomingMessage
 from aio_pika.robust_channel import AbstractRobustChannel
 from aio_pika.robust_connection import AbstractRobustConnection
+from aio_pika.robust_exchange import AbstractRobustExchange
 from aio_pika.robust_queue import AbstractRobustQueue
 from tabulate import tabulate
 
+from common_libs import tracing
 from common_libs.logger import get_async_logger
+from common_libs.metrics import (
+    RABBITMQ_CONSUMED,
+    RABBITMQ_HANDLER_DURATION,
+    RABBITMQ_HANDLERS_IN_PROGRESS,
+    RABBITMQ_NACKED,
+)
+
+
+class RabbitMQUnavailableError(RuntimeError):
+    """Raised when no connection to RabbitMQ can be established (circuit breaker open)."""
 
 
 class RabbitMQManger:
     """
     Manages the connection to RabbitMQ and allows the creation of channels and queues.
     This class follows the Singleton design pattern to ensure that only one instance exists.
+
+    The connection is supervised: concurrent callers share one (re)connect attempt, which
+    retries with jittered exponential backoff. Once the retries are exhausted a circuit
+    breaker opens and callers fail fast with `RabbitMQUnavailableError` until
+    `circuit_reset_timeout` passed, see `health` for the state.
     """
 
+    CIRCUIT_CLOSED = "closed"
+    CIRCUIT_OPEN = "open"
+    CIRCUIT_HALF_OPEN = "half_open"
+
     # TODO: separate __ methods and create sub classes for manager class
 
     instance: typing.Optional["RabbitMQManger"] = None
     queues: typing.Dict[str, AbstractRobustQueue] = {}
+    exchanges: typing.Dict[str, AbstractRobustExchange] = {}
     channels: dict = dict()
 
     def __new__(cls, *args, **kwargs) -> "RabbitMQManger":
@@ -51,6 +76,9 @@ class RabbitMQManger:
         password: str = "guest",
         max_retry_connection: int = 10,
         virtual_host: str = "/",
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        circuit_reset_timeout: float = 30.0,
     ) -> None:
         """
         Initializes the RabbitMQManger instance.
@@ -61,6 +89,10 @@ class RabbitMQManger:
             username (str): RabbitMQ username (default: "guest").
             password (str): RabbitMQ password (default: "guest").
             max_retry_connection (int): The maximum number of retry attempts for connecting to RabbitMQ (default: 10).
+            virtual_host (str): RabbitMQ virtual host (default: "/").
+            backoff_base (float): base delay of the exponential reconnect backoff, in seconds (default: 0.5).
+            backoff_max (float): maximum delay between two connection attempts, in seconds (default: 30).
+            circuit_reset_timeout (float): seconds the circuit stays open after the retries are exhausted (default: 30).
         """
         self.host = host
         self.port = port
@@ -70,6 +102,13 @@ class RabbitMQManger:
         self.max_retry_connection = max_retry_connection
         self.queues: typing.Dict[str, AbstractRobustQueue] = {}
         self.virtual_host = virtual_host
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.circuit_reset_timeout = circuit_reset_timeout
+        self.generation = 0  # number of connections opened so far
+        self._connect_task: typing.Optional[asyncio.Task] = None
+        self._circuit_opened_at: typing.Optional[float] = None
+        self._last_error: typing.Optional[str] = None
 
     async def setup_logger(self, logger_name: str, log_file: str):
         self.logger = await get_async_logger(
@@ -79,44 +118,136 @@ class RabbitMQManger:
         )
         await self.logger.info("Logger Created successfully.")
 
+    def backoff_delay(self, attempt: int) -> float:
+        """
+        jittered exponential backoff ("full jitter"): a random delay between 0 and
+        `min(backoff_max, backoff_base * 2 ** attempt)` seconds.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    @property
+    def circuit_state(self) -> str:
+        """
+        state of the connection circuit breaker:
+            - "closed": connecting is allowed.
+            - "open": the last reconnect failed, connecting fails fast until `circuit_reset_timeout` passed.
+            - "half_open": the reset timeout passed, the next connect is a trial.
+        """
+        if self._circuit_opened_at is None:
+            return self.CIRCUIT_CLOSED
+        if time.monotonic() - self._circuit_opened_at < self.circuit_reset_timeout:
+            return self.CIRCUIT_OPEN
+        return self.CIRCUIT_HALF_OPEN
+
+    @property
+    def is_connected(self) -> bool:
+        """True if the connection is established (and not reconnecting)"""
+        return (
+            self.connection is not None
+            and not self.connection.is_closed
+            and self.connection.connected.is_set()
+        )
+
+    def health(self) -> dict:
+        """connection state for health checks"""
+        retry_in = None
+        if self.circuit_state == self.CIRCUIT_OPEN:
+            retry_in = round(
+                self.circuit_reset_timeout
+                - (time.monotonic() - self._circuit_opened_at),
+                1,
+            )
+        return {
+            "connected": self.is_connected,
+            "circuit": self.circuit_state,
+            "retry_in": retry_in,
+            "reconnects": self.generation - 1 if self.generation else 0,
+            "last_error": self._last_error,
+        }
+
+    async def connect(self) -> None:
+        """
+        Makes sure the connection is established.
+
+        Concurrent callers share a single connection attempt. While the circuit breaker
+        is open, callers fail fast instead of waiting for the broker.
+
+        Raises:
+            RabbitMQUnavailableError: if the circuit is open or the connection attempt failed.
+        """
+        if self.connection is not None and not self.connection.is_closed:
+            return
+        if self.circuit_state == self.CIRCUIT_OPEN:
+            raise RabbitMQUnavailableError(
+                f"rabbitmq is unavailable (circuit open), last error: {self._last_error}"
+            )
+        if self._connect_task is None or self._connect_task.done():
+            self._connect_task = asyncio.create_task(self._connect())
+        # shielded, so a cancelled caller does not cancel the shared attempt
+        await asyncio.shield(self._connect_task)
+
     async def _connect(self) -> None:
         """
         Connects to RabbitMQ using the provided credentials and connection parameters.
-        Retries the connection up to `max_retry_connection` times in case of failure.
+        Retries the connection up to `max_retry_connection` times in case of failure,
+        sleeping a jittered exponential backoff between attempts (only one attempt is
+        made if the circuit is half open).
 
         Raises:
-            RuntimeError: If the maximum number of connection retries is exceeded.
+            RabbitMQUnavailableError: If the maximum number of connection retries is exceeded,
+                the circuit breaker is opened.
         """
-        self.logger.info(f"rabbitmq: trying to connect to {self.host}:{self.port}")
+        await self.logger.info(
+            f"rabbitmq: trying to connect to {self.host}:{self.port}"
+        )
+        max_retries = (
+            0
+            if self.circuit_state == self.CIRCUIT_HALF_OPEN
+            else self.max_retry_connection
+        )
         retries = 0
-        while retries <= self.max_retry_connection:
+        while True:
             try:
-                self.connection = await aio_pika.connect_robust(
+                connection = await aio_pika.connect_robust(
                     login=self.username,
                     password=self.password,
                     host=self.host,
                     port=self.port,
                     virtual_host=self.virtual_host,
                 )
-                self.logger.info(
-                    f"rabbitmq: connected successfully to {self.host}:{self.port}"
-                )
-                return
-            except aio_pika.exceptions.AMQPError as e:
+                break
+            except (aio_pika.exceptions.AMQPError, OSError, asyncio.TimeoutError) as e:
+                self._last_error = repr(e)
+                if retries >= max_retries:
+                    self._circuit_opened_at = time.monotonic()
+                    await self.logger.error(
+                        f"rabbitmq: connection failed for {self.host}:{self.port}, Connection error: "
+                        f"Exceeded maximum number of connection retries, circuit open for {self.circuit_reset_timeout}s"
+                    )
+                    raise RabbitMQUnavailableError(
+                        "Connection error: Exceeded maximum number of connection retries."
+                    ) from e
+                wait_time = self.backoff_delay(retries)
                 retries += 1
-                wait_time = retries * 2
-                self.logger.info(
-                    f"rabbitmq: connection failed for {self.host}:{self.port}, retry number:{retries}, wait_for: {wait_time}s,\nreason: {e.reason}"
+                await self.logger.info(
+                    f"rabbitmq: connection failed for {self.host}:{self.port}, retry number:{retries}, wait_for: {wait_time:.2f}s,\nreason: {e!r}"
                 )
                 await asyncio.sleep(wait_time)
 
-        self.logger.info(
-            f"rabbitmq: connection failed for {self.host}:{self.port}, Connection error: Exceeded maximum number of connection retries"
-        )
-
-        raise RuntimeError(
-            "Connection error: Exceeded maximum number of connection retries."
+        replaced = self.connection is not None
+        self.connection = connection
+        self.generation += 1
+        self._circuit_opened_at = None
+        self._last_error = None
+        await self.logger.info(
+            f"rabbitmq: connected successfully to {self.host}:{self.port}"
         )
+        if replaced:
+            # channels, queues and exchanges of the lost connection are gone,
+            # consumers notice the new `generation` and subscribe again
+            self.channels.clear()
+            self.queues.clear()
+            self.exchanges.clear()
 
     async def _close(self) -> None:
         """
@@ -141,9 +272,7 @@ class RabbitMQManger:
         Returns:
             RabbitMQManger: The current instance of the manager.
         """
-        if self.connection and not self.connection.is_closed:
-            return self
-        await self._connect()
+        await self.connect()
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
@@ -164,8 +293,7 @@ class RabbitMQManger:
         Returns:
             AbstractRobustChannel: The active RabbitMQ channel.
         """
-        if self.connection is None or self.connection.is_closed:
-            await self._connect()
+        await self.connect()
 
         if channel_name not in self.channels:
             self.channels[channel_name] = await self.connection.channel()
@@ -200,6 +328,31 @@ class RabbitMQManger:
         await self.logger.info(f"rabbitmq: Queue '{queue_name}' declared successfully.")
         return queue
 
+    async def declare_exchange(
+        self, exchange_name: str, channel_name: str, *args, **kwargs
+    ) -> AbstractRobustExchange:
+        """
+        Declares an exchange in RabbitMQ if not already declared, otherwise returns the existing exchange.
+
+        Args:
+            exchange_name (str): The name of the exchange to declare.
+            channel_name (str): The name of the channel to declare it on.
+            *args, **kwargs: passed to `channel.declare_exchange` (e.g. type, durable).
+
+        Returns:
+            AbstractRobustExchange: The declared or existing exchange.
+        """
+        if exchange_name in self.exchanges:
+            return self.exchanges[exchange_name]
+
+        channel = await self.get_channel(channel_name=channel_name)
+        exchange = await channel.declare_exchange(exchange_name, *args, **kwargs)
+        self.exchanges[exchange_name] = exchange
+        await self.logger.info(
+            f"rabbitmq: Exchange '{exchange_name}' declared successfully."
+        )
+        return exchange
+
     async def status_channels(self) -> None:
         """
             print status of all channels in table format
@@ -223,3 +376,470 @@ class RabbitMQManger:
             tabulate(table_data, ["channel name", "channel status"], tablefmt="github")
         )
         print()
+
+
+class PublisherBackpressureError(RuntimeError):
+    """Raised when a publish waited too long for a free slot of the publisher."""
+
+
+class RabbitMQPublisher:
+    """
+    Publishing subsystem on top of `RabbitMQManger`.
+
+    Messages are published over a pool of confirm-mode channels. Publishes are
+    pipelined: many messages may be on the wire while their broker confirms
+    are outstanding (the broker acks them in batches with `multiple=True`),
+    and `publish_many` waits for all confirms of a batch together.
+
+    The number of unconfirmed publishes is bounded by `max_pending`. When the
+    broker is slow (or blocks the connection) new publishes wait for a free
+    slot, and give up with `PublisherBackpressureError` after
+    `backpressure_timeout` seconds, so memory stays bounded and callers can
+    shed load.
+
+    Messages that share an ordering key always go through the same channel, so
+    they reach the broker in publish order; other messages are spread
+    round-robin over the pool.
+    """
+
+    def __init__(
+        self,
+        manager: RabbitMQManger,
+        pool_size: int = 4,
+        max_pending: int = 10_000,
+        backpressure_timeout: typing.Optional[float] = None,
+        publish_timeout: typing.Optional[float] = 10.0,
+        channel_prefix: str = "publisher",
+    ) -> None:
+        """
+        Initializes the RabbitMQPublisher instance.
+
+        Args:
+            manager (RabbitMQManger): manager providing the connection and channels.
+            pool_size (int): number of confirm-mode channels (default: 4).
+            max_pending (int): maximum number of unconfirmed publishes (default: 10000).
+            backpressure_timeout (float): seconds a publish may wait for a free slot, None waits forever.
+            publish_timeout (float): seconds to wait for the broker confirm of a message (default: 10).
+            channel_prefix (str): prefix of the pool channel names (default: "publisher").
+        """
+        self.manager = manager
+        self.pool_size = pool_size
+        self.max_pending = max_pending
+        self.backpressure_timeout = backpressure_timeout
+        self.publish_timeout = publish_timeout
+        self.channel_prefix = channel_prefix
+        self._slots = asyncio.Semaphore(max_pending)
+        self._pending = 0
+        self._next_channel = 0
+
+    @property
+    def pending(self) -> int:
+        """number of publishes waiting for their broker confirm"""
+        return self._pending
+
+    def _channel_name(self, ordering_key: typing.Optional[typing.Hashable]) -> str:
+        if ordering_key is None:
+            index = self._next_channel
+            self._next_channel = (self._next_channel + 1) % self.pool_size
+        else:
+            index = hash(ordering_key) % self.pool_size
+        return f"{self.channel_prefix}-{index}"
+
+    async def _acquire_slot(self) -> None:
+        try:
+            await asyncio.wait_for(
+                self._slots.acquire(), timeout=self.backpressure_timeout
+            )
+        except asyncio.TimeoutError:
+            raise PublisherBackpressureError(
+                f"rabbitmq publisher is saturated ({self._pending}/{self.max_pending} unconfirmed messages)."
+            )
+
+    async def publish(
+        self,
+        message: aio_pika.abc.AbstractMessage,
+        routing_key: str,
+        exchange_name: str = "",
+        ordering_key: typing.Optional[typing.Hashable] = None,
+    ) -> None:
+        """
+        Publish a message and wait for its broker confirm.
+
+        Args:
+            message: message to publish.
+            routing_key (str): routing key of the message.
+            exchange_name (str): name of an already declared exchange, "" for the default exchange.
+            ordering_key: messages with the same key are published on the same channel.
+
+        Raises:
+            PublisherBackpressureError: if no slot got free within `backpressure_timeout`.
+        """
+        channel_name = self._channel_name(ordering_key)
+        if tracing.is_enabled():
+            message.headers = tracing.inject_headers(dict(message.headers or {}))
+        await self._acquire_slot()
+        self._pending += 1
+        try:
+            channel = await self.manager.get_channel(channel_name=channel_name)
+            exchange = (
+                channel.default_exchange
+                if not exchange_name
+                else await channel.get_exchange(exchange_name, ensure=False)
+            )
+            await exchange.publish(
+                message, routing_key=routing_key, timeout=self.publish_timeout
+            )
+        finally:
+            self._pending -= 1
+            self._slots.release()
+
+    async def publish_many(
+        self,
+        messages: typing.Iterable[
+            typing.Tuple[
+                aio_pika.abc.AbstractMessage, str, typing.Optional[typing.Hashable]
+            ]
+        ],
+        exchange_name: str = "",
+    ) -> None:
+        """
+        Publish a batch of messages pipelined, and wait for all of their confirms.
+
+        Args:
+            messages: `(message, routing_key, ordering_key)` tuples, in publish order.
+            exchange_name (str): name of an already declared exchange, "" for the default exchange.
+
+        Raises:
+            the first publish error, after every publish of the batch settled.
+        """
+        results = await asyncio.gather(
+            *(
+                self.publish(message, routing_key, exchange_name, ordering_key)
+                for message, routing_key, ordering_key in messages
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+
+class RabbitMQRetryPolicy:
+    """
+    Delayed retries and a parking queue for the messages of a queue.
+
+    Topology (all queues durable, bound to the default exchange):
+        - `<queue>.retry.<n>`: one delay queue per entry of `delays`, with a queue TTL
+          and the source queue as dead-letter target. A message published there is
+          dead-lettered back to `<queue>` once its delay expired.
+        - `<queue>.parking`: messages that failed permanently or too many times,
+          kept for inspection / manual replay.
+
+    The attempt count travels in the `x-attempt` header. A failed message is first
+    published (with publisher confirms) to its next queue and then acked, so it is
+    never lost, at worst delivered twice.
+    """
+
+    ATTEMPT_HEADER = "x-attempt"
+    REASON_HEADER = "x-failure-reason"
+
+    def __init__(
+        self,
+        publisher: "RabbitMQPublisher",
+        queue_name: str,
+        delays: typing.Sequence[float] = (1.0, 5.0, 30.0),
+        max_attempts: int = 5,
+    ) -> None:
+        """
+        Initializes the RabbitMQRetryPolicy instance.
+
+        Args:
+            publisher (RabbitMQPublisher): publisher used to move failed messages.
+            queue_name (str): the consumed queue the policy retries messages of.
+            delays: delay before each retry in seconds, the last delay is used for
+                all further retries (default: 1s, 5s, 30s).
+            max_attempts (int): deliveries of a message before it is parked (default: 5).
+        """
+        self.publisher = publisher
+        self.queue_name = queue_name
+        self.delays = list(delays)
+        self.max_attempts = max_attempts
+        self.parking_queue_name = f"{queue_name}.parking"
+        self.logger = None
+
+    def retry_queue_name(self, attempt: int) -> str:
+        """name of the delay queue used after the given (1-based) failed attempt"""
+        return f"{self.queue_name}.retry.{min(attempt, len(self.delays))}"
+
+    async def declare(self, manager: "RabbitMQManger", channel_name: str) -> None:
+        """declare the delay queues and the parking queue"""
+        self.logger = manager.logger
+        for index, delay in enumerate(self.delays, start=1):
+            await manager.declare_queue(
+                self.retry_queue_name(index),
+                channel_name,
+                durable=True,
+                arguments={
+                    "x-message-ttl": int(delay * 1000),
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": self.queue_name,
+                },
+            )
+        await manager.declare_queue(self.parking_queue_name, channel_name, durable=True)
+
+    @classmethod
+    def attempts(cls, message: AbstractIncomingMessage) -> int:
+        """number of failed deliveries of a message so far"""
+        try:
+            return int((message.headers or {}).get(cls.ATTEMPT_HEADER, 0))
+        except (TypeError, ValueError):
+            return 0
+
+    async def _move(
+        self,
+        message: AbstractIncomingMessage,
+        routing_key: str,
+        attempts: int,
+        reason: str,
+        action: str,
+    ) -> None:
+        copy = aio_pika.Message(
+            body=message.body,
+            headers={
+                **(message.headers or {}),
+                self.ATTEMPT_HEADER: attempts,
+                self.REASON_HEADER: reason[:512],
+            },
+            content_type=message.content_type,
+            content_encoding=message.content_encoding,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            message_id=message.message_id,
+            correlation_id=message.correlation_id,
+            timestamp=message.timestamp,
+            type=message.type,
+        )
+        try:
+            await self.publisher.publish(copy, routing_key=routing_key)
+        except Exception as e:
+            # could not move it, let the broker deliver it again
+            if self.logger:
+                await self.logger.error(
+                    f"rabbitmq: moving message_id: {message.message_id} to '{routing_key}' failed, requeued. error: {e!r}"
+                )
+            await message.nack(requeue=True)
+            RABBITMQ_NACKED.labels(self.queue_name, "requeue").inc()
+            return
+        await message.ack()
+        RABBITMQ_NACKED.labels(self.queue_name, action).inc()
+
+    async def retry(self, message: AbstractIncomingMessage, reason: str) -> None:
+        """
+        handle a transient failure: retry the message after a delay, or park it
+        once it failed `max_attempts` times.
+        """
+        attempts = self.attempts(message) + 1
+        if attempts >= self.max_attempts:
+            await self.park(message, f"{reason} (gave up after {attempts} attempts)")
+            return
+        if self.logger:
+            await self.logger.info(
+                f"rabbitmq: message_id: {message.message_id} failed (attempt {attempts}), retrying. reason: {reason}"
+            )
+        await self._move(
+            message, self.retry_queue_name(attempts), attempts, reason, "retry"
+        )
+
+    async def park(self, message: AbstractIncomingMessage, reason: str) -> None:
+        """handle a permanent failure: move the message to the parking queue"""
+        if self.logger:
+            await self.logger.error(
+                f"rabbitmq: message_id: {message.message_id} parked. reason: {reason}"
+            )
+        await self._move(
+            message, self.parking_queue_name, self.attempts(message), reason, "park"
+        )
+
+
+class RabbitMQConsumer:
+    """
+    Consumer engine that runs a message handler concurrently.
+
+    The channel prefetch (QoS) bounds how many unacked messages the broker
+    pushes to this consumer and a semaphore bounds how many handlers run at
+    the same time. Messages that share an ordering key (e.g. the same user id)
+    are handled strictly one after another in delivery order, while messages
+    with different keys are handled in parallel.
+    """
+
+    def __init__(
+        self,
+        handler: typing.Callable[[AbstractIncomingMessage], typing.Awaitable],
+        key_func: typing.Optional[
+            typing.Callable[[AbstractIncomingMessage], typing.Optional[typing.Hashable]]
+        ] = None,
+        prefetch_count: int = 64,
+        max_concurrency: int = 16,
+        retry_policy: typing.Optional[RabbitMQRetryPolicy] = None,
+    ) -> None:
+        """
+        Initializes the RabbitMQConsumer instance.
+
+        Args:
+            handler: coroutine function called with every message, responsible for ack/nack.
+            key_func: returns the ordering key of a message, None means "no ordering constraint".
+            prefetch_count (int): channel prefetch count (default: 64).
+            max_concurrency (int): maximum number of handlers running at once (default: 16).
+            retry_policy (RabbitMQRetryPolicy): declared on start, unhandled handler errors
+                are retried through it instead of dropping the message (default: None).
+        """
+        self.handler = handler
+        self.retry_policy = retry_policy
+        self.key_func = key_func
+        self.prefetch_count = prefetch_count
+        self.max_concurrency = max_concurrency
+        self.logger = None
+        self.queue_name = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._key_tails: typing.Dict[typing.Hashable, asyncio.Future] = {}
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        """number of handlers currently running"""
+        return self._in_flight
+
+    async def start(
+        self,
+        manager: "RabbitMQManger",
+        queue_name: str,
+        channel_name: str,
+        *args,
+        **kwargs,
+    ) -> AbstractRobustQueue:
+        """
+        Set the channel QoS, declare the queue and start consuming it.
+
+        Args:
+            manager (RabbitMQManger): manager used for channels and queues.
+            queue_name (str): name of the queue to consume.
+            channel_name (str): name of the channel to consume on.
+            *args, **kwargs: passed to `declare_queue`.
+        """
+        self.logger = manager.logger
+        self.queue_name = queue_name
+        channel = await manager.get_channel(channel_name=channel_name)
+        await channel.set_qos(prefetch_count=self.prefetch_count)
+        if self.retry_policy is not None:
+            await self.retry_policy.declare(manager, channel_name)
+        queue = await manager.declare_queue(queue_name, channel_name, *args, **kwargs)
+        await queue.consume(self.on_message)
+        await self.logger.info(
+            f"rabbitmq: consuming '{queue_name}' with prefetch_count={self.prefetch_count}, "
+            f"max_concurrency={self.max_concurrency}"
+        )
+        return queue
+
+    async def run(
+        self,
+        manager: "RabbitMQManger",
+        queue_name: str,
+        channel_name: str,
+        *args,
+        check_interval: float = 5.0,
+        **kwargs,
+    ) -> None:
+        """
+        Supervised `start`, meant to be started as a background task, runs until cancelled.
+
+        Failed subscriptions are retried with the backoff of the manager instead of
+        crashing the task. The robust connection restores the subscription after short
+        network failures by itself; when the manager had to open a new connection
+        (`generation` changed) the queue is subscribed again.
+
+        Args:
+            manager (RabbitMQManger): manager used for channels and queues.
+            queue_name (str): name of the queue to consume.
+            channel_name (str): name of the channel to consume on.
+            check_interval (float): seconds between two checks of the connection (default: 5).
+            *args, **kwargs: passed to `declare_queue`.
+        """
+        self.logger = manager.logger
+        attempt = 0
+        while True:
+            try:
+                await self.start(manager, queue_name, channel_name, *args, **kwargs)
+            except Exception as e:
+                wait_time = manager.backoff_delay(attempt)
+                attempt += 1
+                await self.logger.error(
+                    f"rabbitmq: consuming '{queue_name}' failed, retrying in {wait_time:.2f}s. error: {e!r}"
+                )
+                await asyncio.sleep(wait_time)
+                continue
+
+            attempt = 0
+            generation = manager.generation
+            while (
+                manager.generation == generation
+                and manager.connection is not None
+                and not manager.connection.is_closed
+            ):
+                await asyncio.sleep(check_interval)
+            await self.logger.info(
+                f"rabbitmq: connection replaced, subscribing to '{queue_name}' again"
+            )
+
+    async def on_message(self, message: AbstractIncomingMessage) -> None:
+        """
+        Consume callback. The ordering slot of the message is reserved before
+        the first await, so same-key messages keep their delivery order.
+        """
+        key = self.key_func(message) if self.key_func else None
+        previous, done = None, None
+        if key is not None:
+            previous = self._key_tails.get(key)
+            done = asyncio.get_running_loop().create_future()
+            self._key_tails[key] = done
+
+        try:
+            if previous is not None:
+                await asyncio.shield(previous)
+            async with self._semaphore:
+                self._in_flight += 1
+                RABBITMQ_CONSUMED.labels(self.queue_name).inc()
+                RABBITMQ_HANDLERS_IN_PROGRESS.labels(self.queue_name).inc()
+                started_at = time.perf_counter()
+                try:
+                    with tracing.span(
+                        f"{self.queue_name} process",
+                        kind="consumer",
+                        attributes={
+                            "messaging.system": "rabbitmq",
+                            "messaging.destination.name": str(self.queue_name),
+                            "messaging.message.id": str(message.message_id),
+                        },
+                        headers=message.headers or {},
+                    ):
+                        await self.handler(message)
+                except Exception as e:
+                    if self.logger:
+                        await self.logger.error(
+                            f"rabbitmq: unhandled error in handler for message_id: {message.message_id}, error: {e}"
+                        )
+                    if not message.processed:
+                        if self.retry_policy is not None:
+                            await self.retry_policy.retry(message, repr(e))
+                        else:
+                            await message.nack(requeue=False)
+                            RABBITMQ_NACKED.labels(self.queue_name, "drop").inc()
+                finally:
+                    self._in_flight -= 1
+                    RABBITMQ_HANDLERS_IN_PROGRESS.labels(self.queue_name).dec()
+                    RABBITMQ_HANDLER_DURATION.labels(self.queue_name).observe(
+                        time.perf_counter() - started_at
+                    )
+        finally:
+            if done is not None:
+                done.set_result(None)
+                if self._key_tails.get(key) is done:
+                    del self._key_tails[key]
@@ -0,0 +1,83 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import typing
+
+import redis.asyncio as redis
+from redis.exceptions import RedisError
+
+
+class FailureRateLimiter:
+    """
+    Counts failures (e.g. failed logins) per key in fixed redis windows.
+
+    A key is blocked once its counter reached its limit, until the window of
+    the counter expires. Counters are checked with one MGET and incremented
+    with one pipeline, whatever the number of keys.
+
+    Redis is treated as best effort: if it is unreachable nothing is blocked
+    (fail open), callers are expected to have other bounds on their work.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        window: int = 300,
+        key_prefix: str = "failures",
+    ) -> None:
+        """
+        Initializes the FailureRateLimiter instance.
+
+        Args:
+            redis_client (redis.Redis): async redis client holding the counters.
+            window (int): lifetime of a counter in seconds (default: 300).
+            key_prefix (str): prefix of all counter keys (default: "failures").
+        """
+        self.redis = redis_client
+        self.window = window
+        self.key_prefix = key_prefix
+
+    def key(self, key: str) -> str:
+        """build the redis key of a counter"""
+        return f"{self.key_prefix}:{key}"
+
+    async def is_blocked(self, limits: typing.Mapping[str, int]) -> bool:
+        """
+        Check whether any of the keys reached its limit.
+
+        Args:
+            limits: maximum number of failures per key, e.g. `{"ip:1.2.3.4": 50}`.
+        """
+        keys = list(limits)
+        try:
+            counters = await self.redis.mget([self.key(key) for key in keys])
+        except RedisError:
+            return False
+        return any(
+            counter is not None and int(counter) >= limits[key]
+            for key, counter in zip(keys, counters)
+        )
+
+    async def add_failure(self, *keys: str) -> None:
+        """increment the counters of keys, a new counter lives for one window"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(self.key(key), 0, ex=self.window, nx=True)
+                    pipe.incr(self.key(key))
+                await pipe.execute()
+        except RedisError:
+            pass
+
+    async def reset(self, *keys: str) -> None:
+        """drop the counters of keys"""
+        try:
+            await self.redis.delete(*(self.key(key) for key in keys))
+        except RedisError:
+            pass
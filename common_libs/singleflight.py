@@ -0,0 +1,71 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import asyncio
+import typing
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single call.
+
+    The first caller of a key (the leader) runs the function, every caller that
+    arrives while it is still running awaits the leader's result (or exception)
+    instead of running the function again. Once the call is done the key is
+    forgotten, so later callers start a new call.
+
+    If the leader is cancelled, the waiting callers retry and one of them
+    becomes the new leader. Not thread-safe; meant to be used from a single
+    event loop.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[typing.Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(
+        self,
+        key: typing.Hashable,
+        func: typing.Callable[[], typing.Awaitable[typing.Any]],
+    ) -> typing.Any:
+        """
+        Run `func` for a key, or wait for the call already in flight for it.
+
+        Args:
+            key: identifies calls that may share a result.
+            func: coroutine function producing the result.
+        """
+        while (future := self._calls.get(key)) is not None:
+            try:
+                # shield, so a cancelled follower does not cancel the shared call
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the leader was cancelled, retry
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark as retrieved when nobody is waiting
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
@@ -0,0 +1,142 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import codecs
+import json
+import typing
+
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+
+class StreamDecodeError(ValueError):
+    """Raised when a streamed JSON array can not be parsed any further."""
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body iterator reads the request body while the
+    response is being sent.
+
+    On ASGI servers older than spec 2.4 the default StreamingResponse listens for
+    client disconnects by calling `receive()` concurrently, which would steal
+    the request body messages from `request.stream()`. Here only the response is
+    streamed; a client disconnect surfaces as `ClientDisconnect` raised by
+    `request.stream()` inside the body iterator instead.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+        if self.background is not None:
+            await self.background()
+
+
+async def iter_json_documents(
+    chunks: typing.AsyncIterator[bytes],
+) -> typing.AsyncIterator[typing.Any]:
+    """
+    Incrementally parse a streamed request body into JSON documents.
+
+    Two formats are supported and detected from the first non-whitespace
+    character of the body:
+        - a JSON array (`[{...}, {...}]`), every element is yielded.
+        - NDJSON (one JSON document per line), every line is yielded.
+
+    Only the current (incomplete) document is buffered, so memory stays flat
+    regardless of the body size.
+
+    For NDJSON, a line that is not valid JSON yields the `json.JSONDecodeError`
+    instance instead of a document and parsing goes on with the next line. A
+    malformed JSON array can not be resynchronized, so `StreamDecodeError` is
+    raised instead.
+
+    Args:
+        chunks: async iterator of raw body chunks, e.g. `request.stream()`.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    json_decoder = json.JSONDecoder()
+    buffer = ""
+    mode = None  # "array" | "ndjson"
+    position = 0
+    array_closed = False
+
+    async def _read() -> bool:
+        nonlocal buffer
+        async for chunk in chunks_iterator:
+            if chunk:
+                buffer += decoder.decode(chunk)
+                return True
+        buffer += decoder.decode(b"", final=True)
+        return False
+
+    chunks_iterator = chunks.__aiter__()
+    more = True
+    while True:
+        if mode is None:
+            stripped = buffer.lstrip()
+            if stripped:
+                buffer = stripped
+                if buffer[0] == "[":
+                    mode, position = "array", 1
+                else:
+                    mode = "ndjson"
+                continue
+
+        elif mode == "ndjson":
+            while "\n" in buffer:
+                line, buffer = buffer.split("\n", 1)
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as e:
+                        yield e
+            if not more:
+                if buffer.strip():
+                    try:
+                        yield json.loads(buffer)
+                    except json.JSONDecodeError as e:
+                        yield e
+                return
+
+        else:  # array
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position += 1
+                if position >= len(buffer):
+                    break
+                if buffer[position] == "]":
+                    array_closed = True
+                    return
+                try:
+                    document, end = json_decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if not more:
+                        raise StreamDecodeError(
+                            f"invalid JSON array element at character {position}."
+                        )
+                    break
+                if end >= len(buffer) and more:
+                    break  # a number or literal may continue in the next chunk
+                yield document
+                position = end
+            # drop consumed text so the buffer only holds the current element
+            buffer, position = buffer[position:], 0
+            if not more:
+                if not array_closed:
+                    raise StreamDecodeError("JSON array is not closed.")
+                return
+
+        if not more:
+            return
+        more = await _read()
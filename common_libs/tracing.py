@@ -0,0 +1,254 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+
+optional OpenTelemetry tracing (pip install .[tracing]).
+
+every helper of this module is a no-op until `setup_tracing` is called, and
+`setup_tracing` does nothing if opentelemetry is not installed, so the code can
+be instrumented unconditionally.
+"""
+
+import contextlib
+import functools
+import typing
+
+try:
+    from opentelemetry import propagate
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:  # tracing is optional
+    propagate = None
+    SpanKind = None
+
+_tracer = None
+_provider = None
+
+
+def is_enabled() -> bool:
+    """True if `setup_tracing` configured a tracer"""
+    return _tracer is not None
+
+
+def build_span_exporter(
+    exporter: str,
+    otlp_endpoint: typing.Optional[str] = None,
+    file_path: typing.Optional[str] = None,
+):
+    """
+    Create a span exporter.
+
+    Args:
+        exporter (str): "otlp" (grpc, needs opentelemetry-exporter-otlp), "console" or
+            "file" (spans written as json lines to `file_path`, for local testing).
+        otlp_endpoint (str): collector endpoint, e.g. "http://localhost:4317".
+        file_path (str): path of the file exporter.
+
+    Raises:
+        ValueError: for an unknown exporter.
+    """
+    if exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        return OTLPSpanExporter(endpoint=otlp_endpoint)
+
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+    if exporter == "console":
+        return ConsoleSpanExporter()
+    if exporter == "file":
+        return ConsoleSpanExporter(
+            out=open(file_path, "a", encoding="utf-8"),
+            formatter=lambda span: span.to_json(indent=None) + "\n",
+        )
+    raise ValueError(f"invalid tracing exporter: {exporter}")
+
+
+def setup_tracing(
+    service_name: str,
+    exporter_factory: typing.Callable[[], typing.Any],
+    batch: bool = True,
+) -> bool:
+    """
+    Configure the tracer of the helpers of this module.
+
+    Args:
+        service_name (str): `service.name` resource attribute of the spans.
+        exporter_factory: returns the span exporter, e.g. `lambda: build_span_exporter("otlp")`.
+        batch (bool): export spans in background batches (default: True), or one by one.
+
+    Returns:
+        False if opentelemetry is not installed, True otherwise.
+    """
+    global _tracer, _provider
+    if propagate is None:
+        return False
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, SimpleSpanProcessor
+
+    processor = BatchSpanProcessor if batch else SimpleSpanProcessor
+    _provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    _provider.add_span_processor(processor(exporter_factory()))
+    _tracer = _provider.get_tracer("users-management")
+    return True
+
+
+def shutdown_tracing() -> None:
+    """flush the pending spans and disable tracing"""
+    global _tracer, _provider
+    if _provider is not None:
+        _provider.shutdown()
+    _tracer, _provider = None, None
+
+
+@contextlib.contextmanager
+def span(
+    name: str,
+    kind: str = "internal",
+    attributes: typing.Optional[dict] = None,
+    headers: typing.Optional[typing.Mapping] = None,
+):
+    """
+    Context manager running its block in a new span, yields the span (None if
+    tracing is disabled).
+
+    Args:
+        name (str): span name.
+        kind (str): "internal", "server", "client", "producer" or "consumer".
+        attributes (dict): span attributes.
+        headers: carrier of a propagated trace context (http or amqp headers), the
+            span is created as its child.
+    """
+    if _tracer is None:
+        yield None
+        return
+    context = propagate.extract(dict(headers)) if headers is not None else None
+    with _tracer.start_as_current_span(
+        name,
+        context=context,
+        kind=getattr(SpanKind, kind.upper()),
+        attributes=attributes,
+    ) as current:
+        yield current
+
+
+def traced(name: typing.Optional[str] = None):
+    """decorator running an async function in a span named after it"""
+
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return await func(*args, **kwargs)
+            with _tracer.start_as_current_span(span_name):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def inject_headers(headers: typing.Optional[dict] = None) -> dict:
+    """add the current trace context to (amqp) message headers"""
+    headers = {} if headers is None else headers
+    if _tracer is not None:
+        propagate.inject(headers)
+    return headers
+
+
+def instrument_engine(engine) -> None:
+    """
+    Create a client span per statement of an (async) engine, as a child of the
+    current span.
+    """
+    from sqlalchemy import event
+
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        if _tracer is None:
+            return
+        operation = statement.lstrip().split(" ", 1)[0].upper()
+        current = _tracer.start_span(
+            f"db {operation}",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": sync_engine.dialect.name,
+                "db.statement": " ".join(statement.split())[:2000],
+                "db.executemany": executemany,
+            },
+        )
+        conn.info.setdefault("tracing_spans", []).append(current)
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("tracing_spans")
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(sync_engine, "handle_error")
+    def on_error(exception_context):
+        connection = exception_context.connection
+        spans = connection.info.get("tracing_spans") if connection else None
+        if spans:
+            current = spans.pop()
+            current.record_exception(exception_context.original_exception)
+            current.set_status(Status(StatusCode.ERROR))
+            current.end()
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware creating a server span per HTTP request, named after the route
+    template (e.g. `GET /users/id/{user_id}`), and continuing the trace of the
+    `traceparent` header of the caller.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _tracer is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {
+            key.decode("latin-1"): value.decode("latin-1")
+            for key, value in scope["headers"]
+        }
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with span(
+            f"{scope['method']} {scope['path']}",
+            kind="server",
+            attributes={
+                "http.request.method": scope["method"],
+                "url.path": scope["path"],
+            },
+            headers=headers,
+        ) as current:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    current.update_name(f"{scope['method']} {route}")
+                    current.set_attribute("http.route", route)
+                current.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    current.set_status(Status(StatusCode.ERROR))
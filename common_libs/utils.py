@@ -8,7 +8,9 @@
 """
 
 import base64
+import binascii
 import hashlib
+import json
 import random
 import string
 
@@ -34,6 +36,37 @@ def generate_random_string(length: int = 6, punctuation: bool = True) -> str:
     return "".join(random_string)
 
 
+def encode_cursor(values: dict) -> str:
+    """encode pagination cursor values into an opaque url-safe string
+
+    :param values: json serializable cursor values
+    :type values: dict
+
+    :return: str: opaque cursor
+    """
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    """decode a cursor created by `encode_cursor`
+
+    :param cursor: opaque cursor
+    :type cursor: str
+
+    :raises ValueError: if the cursor is malformed
+    :return: dict: cursor values
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("malformed cursor") from e
+    if not isinstance(values, dict):
+        raise ValueError("malformed cursor")
+    return values
+
+
 class CryptoMethodUtils:
     """cryptography utils class"""
 
@@ -10,8 +10,11 @@
 from fastapi import FastAPI
 from fastapi_pagination import add_pagination
 
+from common_libs.metrics import PrometheusMiddleware
+from common_libs.query_profiler import QueryProfilerMiddleware
+from common_libs.tracing import TracingMiddleware
 from core.config import get_config
-from core.db import BaseModelClass, engine
+from core.db import BaseModelClass, engine, query_profiler
 from core.events import lifespan
 from core.urls import urlpatterns
 
@@ -32,6 +35,12 @@ def create_app(config_class: object) -> FastAPI:
         lifespan=lifespan,
     )
     add_pagination(app)
+    if config_class.DB_PROFILE_ENABLE:
+        app.add_middleware(QueryProfilerMiddleware, profiler=query_profiler)
+    if config_class.METRICS_ENABLE:
+        app.add_middleware(PrometheusMiddleware)
+    if config_class.TRACING_ENABLE:
+        app.add_middleware(TracingMiddleware)  # outermost, spans the whole request
 
     for router in urlpatterns:
         app.include_router(
@@ -42,4 +51,3 @@ def create_app(config_class: object) -> FastAPI:
 
 
 app = create_app(Settings)
-import core.base_views
@@ -7,14 +7,20 @@
 * https://github.com/alisharify7/user-service-management
 """
 
-from core import app
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse, Response
+
+from common_libs.metrics import metrics_payload
 from core.config import get_config
+from core.extensions import rabbitManager
 
 Setting = get_config()
 
+core_router = APIRouter()
+
 
-@app.get("/")
-@app.get("/version")
+@core_router.get("/")
+@core_router.get("/version")
 def index():
     return {
         "status": "ok",
@@ -24,3 +30,33 @@ def index():
         "API-TERM-URL": Setting.API_TERM_URL,
         "redoc": Setting.API_REDOC_URL,
     }
+
+
+@core_router.get("/health")
+def health():
+    """
+    health of the service dependencies.
+
+    rabbitmq is reported "degraded" while it is (re)connecting, and "unavailable" (503)
+    while its circuit breaker is open.
+    """
+    rabbitmq = rabbitManager.health()
+    if rabbitmq["connected"]:
+        status = "ok"
+    elif rabbitmq["circuit"] == rabbitManager.CIRCUIT_OPEN:
+        status = "unavailable"
+    else:
+        status = "degraded"
+    return JSONResponse(
+        status_code=503 if status == "unavailable" else 200,
+        content={"status": status, "rabbitmq": rabbitmq},
+    )
+
+
+@core_router.get("/metrics", include_in_schema=False)
+def metrics():
+    """prometheus metrics of this worker"""
+    if not Setting.METRICS_ENABLE:
+        raise HTTPException(status_code=404, detail="Not Found")
+    payload, content_type = metrics_payload()
+    return Response(content=payload, media_type=content_type)
@@ -55,9 +55,77 @@ class BaseSetting:
         f"postgresql+asyncpg://{DATABASE_USERNAME}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
+    # connection pool of one worker process. a deployment opens up to
+    # DATABASE_WORKERS * (POOL_SIZE + MAX_OVERFLOW) connections, checked at startup
+    # against DATABASE_MAX_CONNECTIONS (0: max_connections of the server).
+    DATABASE_POOL_SIZE: int = int(os.environ.get("DATABASE_POOL_SIZE", 30))
+    DATABASE_MAX_OVERFLOW: int = int(os.environ.get("DATABASE_MAX_OVERFLOW", 10))
+    DATABASE_POOL_TIMEOUT: float = float(
+        os.environ.get("DATABASE_POOL_TIMEOUT", 30)
+    )  # seconds to wait for a free connection
+    DATABASE_POOL_RECYCLE: int = int(
+        os.environ.get("DATABASE_POOL_RECYCLE", 1800)
+    )  # seconds before a connection is replaced, -1 never
+    DATABASE_POOL_PRE_PING: bool = (
+        os.environ.get("DATABASE_POOL_PRE_PING", "False") == "True"
+    )  # test connections on checkout (one more round trip)
+    DATABASE_STATEMENT_CACHE_SIZE: int = int(
+        os.environ.get("DATABASE_STATEMENT_CACHE_SIZE", 100)
+    )  # prepared statements cached per connection
+    # PgBouncer (transaction pooling) mode: no prepared statement caching and
+    # unique prepared statement names.
+    DATABASE_PGBOUNCER: bool = os.environ.get("DATABASE_PGBOUNCER", "False") == "True"
+    DATABASE_WORKERS: int = int(
+        os.environ.get("DATABASE_WORKERS", os.environ.get("WEB_CONCURRENCY", 1))
+    )  # worker processes sharing the database (uvicorn / gunicorn --workers)
+    DATABASE_MAX_CONNECTIONS: int = int(os.environ.get("DATABASE_MAX_CONNECTIONS", 0))
+    DATABASE_POOL_CHECK_STRICT: bool = (
+        os.environ.get("DATABASE_POOL_CHECK_STRICT", "False") == "True"
+    )  # refuse to start when the pools can exceed the connection budget
+    BULK_CREATE_CHUNK_SIZE: int = int(
+        os.environ.get("BULK_CREATE_CHUNK_SIZE", 500)
+    )  # users inserted per statement in bulk create
+    EXPORT_YIELD_PER: int = int(
+        os.environ.get("EXPORT_YIELD_PER", 1000)
+    )  # rows fetched per round trip by the users export
+    BATCH_LOOKUP_MAX_KEYS: int = int(
+        os.environ.get("BATCH_LOOKUP_MAX_KEYS", 2000)
+    )  # maximum number of keys accepted by the users batch lookup
     DEBUG_QUERY: bool = (
         os.environ.get("DATABASE_DEBUG_QUERY", "False") == "True"
     )  # sqlalchemy echo config
+    # query profiling: statements slower than the threshold are logged (sampled) with
+    # their route, requests running too many queries (N+1) are logged too.
+    DB_PROFILE_ENABLE: bool = os.environ.get("DB_PROFILE_ENABLE", "True") == "True"
+    DB_SLOW_QUERY_THRESHOLD_MS: int = int(
+        os.environ.get("DB_SLOW_QUERY_THRESHOLD_MS", 200)
+    )
+    DB_SLOW_QUERY_SAMPLE_RATE: float = float(
+        os.environ.get("DB_SLOW_QUERY_SAMPLE_RATE", 1.0)
+    )
+    DB_MAX_QUERIES_PER_REQUEST: int = int(
+        os.environ.get("DB_MAX_QUERIES_PER_REQUEST", 50)
+    )
+    DB_SERVER_TIMING: bool = (
+        os.environ.get("DB_SERVER_TIMING", "False") == "True"
+    )  # add a Server-Timing header with the db time to responses
+
+    # prometheus metrics: /metrics endpoint, request / pool / event loop instrumentation
+    METRICS_ENABLE: bool = os.environ.get("METRICS_ENABLE", "True") == "True"
+    METRICS_EVENT_LOOP_LAG_INTERVAL_MS: int = int(
+        os.environ.get("METRICS_EVENT_LOOP_LAG_INTERVAL_MS", 500)
+    )
+
+    # optional opentelemetry tracing (pip install .[tracing]), exporter: otlp | console | file
+    TRACING_ENABLE: bool = os.environ.get("TRACING_ENABLE", "False") == "True"
+    TRACING_SERVICE_NAME: str = os.environ.get(
+        "TRACING_SERVICE_NAME", "user-service-management"
+    )
+    TRACING_EXPORTER: str = os.environ.get("TRACING_EXPORTER", "otlp")
+    TRACING_OTLP_ENDPOINT: str = os.environ.get(
+        "TRACING_OTLP_ENDPOINT", "http://localhost:4317"
+    )
+    TRACING_FILE_PATH: str = os.environ.get("TRACING_FILE_PATH", "traces.jsonl")
 
     def __str__(self):
         return "BaseSetting Class"
@@ -78,6 +146,40 @@ class Setting(BaseSetting):
     REDIS_CACHE_URI = os.environ.get("REDIS_CACHE_URI", "localhost")
     REDIS_CACHE_INTERFACE = redis.Redis().from_url(REDIS_CACHE_URI)
 
+    # user lookup cache config
+    CACHE_ENABLE: bool = os.environ.get("CACHE_ENABLE", "True") == "True"
+    CACHE_USER_TTL: int = int(os.environ.get("CACHE_USER_TTL", 300))  # seconds
+    CACHE_USER_NEGATIVE_TTL: int = int(
+        os.environ.get("CACHE_USER_NEGATIVE_TTL", 30)
+    )  # seconds, ttl of cached 404s
+    CACHE_EARLY_REFRESH_BETA: float = float(
+        os.environ.get("CACHE_EARLY_REFRESH_BETA", 1.0)
+    )  # eagerness of the probabilistic early refresh, 0 disables it
+    # optional per-worker in-memory cache in front of redis
+    CACHE_L1_ENABLE: bool = os.environ.get("CACHE_L1_ENABLE", "False") == "True"
+    CACHE_L1_MAX_ENTRIES: int = int(os.environ.get("CACHE_L1_MAX_ENTRIES", 10_000))
+    CACHE_L1_MAX_BYTES: int = int(
+        os.environ.get("CACHE_L1_MAX_BYTES", 32 * 1024 * 1024)
+    )
+    CACHE_L1_TTL: float = float(os.environ.get("CACHE_L1_TTL", 5))  # seconds
+    CACHE_INVALIDATION_CHANNEL: str = os.environ.get(
+        "CACHE_INVALIDATION_CHANNEL", "users:cache:invalidation"
+    )
+
+    # credential verification config, failed attempts are counted per window
+    LOGIN_MAX_FAILED_ATTEMPTS: int = int(
+        os.environ.get("LOGIN_MAX_FAILED_ATTEMPTS", 5)
+    )  # per username
+    LOGIN_MAX_FAILED_ATTEMPTS_PER_IP: int = int(
+        os.environ.get("LOGIN_MAX_FAILED_ATTEMPTS_PER_IP", 50)
+    )
+    LOGIN_THROTTLE_WINDOW: int = int(
+        os.environ.get("LOGIN_THROTTLE_WINDOW", 300)
+    )  # seconds
+    LOGIN_ACTIVITY_FLUSH_INTERVAL_MS: int = int(
+        os.environ.get("LOGIN_ACTIVITY_FLUSH_INTERVAL_MS", 1000)
+    )  # last_login / login_attempts are written in batches
+
     REDIS_API_KEY_URI: str = os.environ.get("REDIS_API_KEY_URI", "localhost")
     REDIS_API_KEY_INTERFACE = redis.Redis.from_url(REDIS_API_KEY_URI)
 
@@ -98,6 +200,83 @@ class Setting(BaseSetting):
         else int(os.environ.get("RABBITMQ_PORT"))
     )
     RABBITMQ_VHOST: str = os.environ.get("RABBITMQ_VHOST")
+    RABBITMQ_PREFETCH_COUNT: int = int(os.environ.get("RABBITMQ_PREFETCH_COUNT", 256))
+    RABBITMQ_CONSUMER_CONCURRENCY: int = int(
+        os.environ.get("RABBITMQ_CONSUMER_CONCURRENCY", 128)
+    )  # max handlers running at once per worker
+    # micro-batching of consumed user events, a batch size of 1 disables batching.
+    # a batch never holds more events than RABBITMQ_CONSUMER_CONCURRENCY.
+    RABBITMQ_BATCH_SIZE: int = int(os.environ.get("RABBITMQ_BATCH_SIZE", 100))
+    RABBITMQ_BATCH_MAX_DELAY_MS: int = int(
+        os.environ.get("RABBITMQ_BATCH_MAX_DELAY_MS", 50)
+    )
+    # publisher: pool of confirm-mode channels, publishes wait for a free slot once
+    # RABBITMQ_PUBLISHER_MAX_PENDING messages are unconfirmed (backpressure).
+    RABBITMQ_PUBLISHER_CHANNELS: int = int(
+        os.environ.get("RABBITMQ_PUBLISHER_CHANNELS", 4)
+    )
+    RABBITMQ_PUBLISHER_MAX_PENDING: int = int(
+        os.environ.get("RABBITMQ_PUBLISHER_MAX_PENDING", 10_000)
+    )
+    RABBITMQ_PUBLISH_TIMEOUT: float = float(
+        os.environ.get("RABBITMQ_PUBLISH_TIMEOUT", 10)
+    )  # seconds to wait for a broker confirm
+    # failed user events are retried through delay queues (one per delay, the last
+    # one is reused) and parked in "<queue>.parking" after RETRY_MAX_ATTEMPTS deliveries.
+    RABBITMQ_RETRY_DELAYS_MS: list[int] = [
+        int(delay)
+        for delay in os.environ.get(
+            "RABBITMQ_RETRY_DELAYS_MS", "1000,5000,30000"
+        ).split(",")
+    ]
+    RABBITMQ_RETRY_MAX_ATTEMPTS: int = int(
+        os.environ.get("RABBITMQ_RETRY_MAX_ATTEMPTS", 5)
+    )
+    # message ids of applied user events are kept this long to skip redeliveries
+    RABBITMQ_DEDUP_RETENTION_HOURS: int = int(
+        os.environ.get("RABBITMQ_DEDUP_RETENTION_HOURS", 72)
+    )
+    # reconnects use a jittered exponential backoff (base * 2 ** attempt, capped),
+    # once the retries are exhausted rabbitmq calls fail fast for CIRCUIT_RESET_TIMEOUT seconds.
+    RABBITMQ_CONNECT_MAX_RETRIES: int = int(
+        os.environ.get("RABBITMQ_CONNECT_MAX_RETRIES", 10)
+    )
+    RABBITMQ_BACKOFF_BASE: float = float(os.environ.get("RABBITMQ_BACKOFF_BASE", 0.5))
+    RABBITMQ_BACKOFF_MAX: float = float(os.environ.get("RABBITMQ_BACKOFF_MAX", 30))
+    RABBITMQ_CIRCUIT_RESET_TIMEOUT: float = float(
+        os.environ.get("RABBITMQ_CIRCUIT_RESET_TIMEOUT", 30)
+    )
+    # user change events are written to an outbox table and published to this
+    # (topic) exchange by a background relay, routing key is the event type.
+    RABBITMQ_USERS_EVENTS_EXCHANGE: str = os.environ.get(
+        "RABBITMQ_USERS_EVENTS_EXCHANGE", "users.events"
+    )
+    OUTBOX_ENABLE: bool = os.environ.get("OUTBOX_ENABLE", "True") == "True"
+    OUTBOX_BATCH_SIZE: int = int(os.environ.get("OUTBOX_BATCH_SIZE", 500))
+    OUTBOX_POLL_INTERVAL_MS: int = int(os.environ.get("OUTBOX_POLL_INTERVAL_MS", 1000))
+
+    # password hashing executor config
+    HASHING_POOL_TYPE: str = os.environ.get(
+        "HASHING_POOL_TYPE", "thread"
+    )  # thread | process
+    HASHING_MAX_WORKERS: int = int(
+        os.environ.get("HASHING_MAX_WORKERS", os.cpu_count() or 1)
+    )
+    HASHING_MAX_QUEUE_SIZE: int = int(os.environ.get("HASHING_MAX_QUEUE_SIZE", 64))
+    # password hashing policy, the first scheme hashes new passwords, hashes of the
+    # other schemes (or of a lower cost) are upgraded on the next successful login.
+    # tune the costs with `python -m benchmarks.hashing`.
+    HASHING_SCHEMES: list[str] = os.environ.get("HASHING_SCHEMES", "bcrypt").split(
+        ","
+    )  # bcrypt | argon2 (needs argon2-cffi)
+    HASHING_BCRYPT_ROUNDS: int = int(os.environ.get("HASHING_BCRYPT_ROUNDS", 12))
+    HASHING_ARGON2_TIME_COST: int = int(os.environ.get("HASHING_ARGON2_TIME_COST", 3))
+    HASHING_ARGON2_MEMORY_COST: int = int(
+        os.environ.get("HASHING_ARGON2_MEMORY_COST", 65536)
+    )  # KiB
+    HASHING_ARGON2_PARALLELISM: int = int(
+        os.environ.get("HASHING_ARGON2_PARALLELISM", 4)
+    )
 
     def __str__(self):
         return "Setting Class"
@@ -7,22 +7,161 @@
 * https://github.com/alisharify7/user-service-management
 """
 
+import logging
+import uuid
 from contextlib import asynccontextmanager
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import declarative_base
 
+from common_libs.metrics import InstrumentedQueuePool, instrument_engine_pool
+from common_libs.query_profiler import QueryProfiler
+from common_libs.tracing import instrument_engine
 from core.config import get_config
 
 Setting = get_config()
 
+logger = logging.getLogger("db.pool")
+
+
+def pgbouncer_statement_name() -> str:
+    """unique prepared statement name, PgBouncer may run it on another server connection"""
+    return f"__asyncpg_{uuid.uuid4()}__"
+
+
+def engine_options(setting) -> dict:
+    """
+    keyword arguments of `create_async_engine` built from the configuration.
+
+    with `DATABASE_PGBOUNCER` (transaction pooling) prepared statements are not
+    cached, neither by sqlalchemy nor by asyncpg, and get unique names: a statement
+    prepared on one server connection does not exist on the next one.
+
+    :param setting: configuration object
+    :return: engine keyword arguments
+    """
+    options = {
+        "pool_size": setting.DATABASE_POOL_SIZE,
+        "max_overflow": setting.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": setting.DATABASE_POOL_TIMEOUT,
+        "pool_recycle": setting.DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": setting.DATABASE_POOL_PRE_PING,
+    }
+    if make_url(setting.SQLALCHEMY_DATABASE_URI).get_driver_name() != "asyncpg":
+        return options
+
+    if setting.DATABASE_PGBOUNCER:
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": pgbouncer_statement_name,
+        }
+    else:
+        options["connect_args"] = {
+            "prepared_statement_cache_size": setting.DATABASE_STATEMENT_CACHE_SIZE
+        }
+    return options
+
+
+def pool_sizing_problem(
+    workers: int, pool_size: int, max_overflow: int, budget: Optional[int]
+) -> Optional[str]:
+    """
+    check that the pools of all the workers fit in the connection budget.
+
+    :param workers: number of worker processes, each one has its own pool
+    :param pool_size: pool size of one worker
+    :param max_overflow: overflow of one worker
+    :param budget: connections available to the service, None if unknown
+    :return: a description of the problem, None if the pools fit
+    """
+    total = workers * (pool_size + max_overflow)
+    if budget is None or total <= budget:
+        return None
+    return (
+        f"{workers} worker(s) x (pool_size {pool_size} + max_overflow {max_overflow})"
+        f" = {total} connections, but only {budget} are available"
+    )
+
+
+async def server_connection_budget(db_engine: AsyncEngine) -> Optional[int]:
+    """max_connections of the postgres server minus the superuser reserved ones"""
+    if db_engine.dialect.name != "postgresql":
+        return None
+    async with db_engine.connect() as connection:
+        max_connections = int(
+            (await connection.execute(text("SHOW max_connections"))).scalar()
+        )
+        reserved = int(
+            (
+                await connection.execute(text("SHOW superuser_reserved_connections"))
+            ).scalar()
+        )
+    return max_connections - reserved
+
+
+async def check_pool_sizing(db_engine: Optional[AsyncEngine] = None) -> None:
+    """
+    warn (or fail with `DATABASE_POOL_CHECK_STRICT`) at startup if the pools of all
+    the workers can open more connections than the database accepts.
+
+    the budget is `DATABASE_MAX_CONNECTIONS`, or the server max_connections if it is
+    0 (not behind PgBouncer, whose server max_connections says nothing about its
+    client limit). the check is skipped if the server cannot be queried.
+
+    :param db_engine: engine to check (default: the engine of the app)
+    :raises RuntimeError: in strict mode, if the pools do not fit
+    """
+    db_engine = db_engine or engine
+    budget = Setting.DATABASE_MAX_CONNECTIONS or None
+    if budget is None and not Setting.DATABASE_PGBOUNCER:
+        try:
+            budget = await server_connection_budget(db_engine)
+        except (SQLAlchemyError, OSError) as error:
+            logger.warning("pool sizing check skipped: %s", error)
+            return
+
+    problem = pool_sizing_problem(
+        Setting.DATABASE_WORKERS,
+        Setting.DATABASE_POOL_SIZE,
+        Setting.DATABASE_MAX_OVERFLOW,
+        budget,
+    )
+    if problem is None:
+        return
+    if Setting.DATABASE_POOL_CHECK_STRICT:
+        raise RuntimeError(f"database pool too large: {problem}")
+    logger.warning("database pool too large: %s", problem)
+
+
 engine = create_async_engine(
     url=Setting.SQLALCHEMY_DATABASE_URI,
-    pool_size=30,
-    max_overflow=10,
     echo=Setting.DEBUG_QUERY,
+    **engine_options(Setting),
+    **({"poolclass": InstrumentedQueuePool} if Setting.METRICS_ENABLE else {}),
+)
+if Setting.METRICS_ENABLE:
+    instrument_engine_pool(engine)
+
+query_profiler = QueryProfiler(
+    slow_query_threshold=Setting.DB_SLOW_QUERY_THRESHOLD_MS / 1000,
+    sample_rate=Setting.DB_SLOW_QUERY_SAMPLE_RATE,
+    max_queries_per_request=Setting.DB_MAX_QUERIES_PER_REQUEST,
+    server_timing=Setting.DB_SERVER_TIMING,
 )
+if Setting.DB_PROFILE_ENABLE:
+    query_profiler.instrument(engine)
+if Setting.TRACING_ENABLE:
+    instrument_engine(engine)
 
 Session = async_sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
@@ -35,6 +174,14 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+def get_session_factory() -> async_sessionmaker:
+    """
+    Get the session factory, for streaming responses: their body is produced after
+    the dependencies of the request (e.g. the `get_session` session) are closed.
+    """
+    return Session
+
+
 @asynccontextmanager
 async def rabbit_get_session() -> AsyncGenerator[AsyncSession, None]:
     """Get a fresh session for connection to database"""
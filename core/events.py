@@ -12,17 +12,40 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 
+from common_libs.metrics import monitor_event_loop_lag
+from common_libs.tracing import shutdown_tracing
 from core import extensions
+from core.config import get_config
+from core.db import check_pool_sizing
+
+Setting = get_config()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    from users.rabbit_operation import consume_users_messages
+    from users.auth import login_activity
+    from users.cache import user_cache
+    from users.outbox import outbox_relay
+    from users.rabbit_operation import consume_users_messages, prune_processed_events
 
+    await check_pool_sizing()
     await extensions.rabbitManager.setup_logger(
         logger_name="rabbitmq-consumer", log_file="rabbitmq-consumer.log"
     )
-    asyncio.create_task(consume_users_messages())
+    consumer_task = asyncio.create_task(consume_users_messages())
+    prune_processed_events_task = asyncio.create_task(prune_processed_events())
+    cache_invalidation_task = asyncio.create_task(user_cache.listen_invalidations())
+    login_activity_task = asyncio.create_task(login_activity.run())
+    event_loop_lag_task = (
+        asyncio.create_task(
+            monitor_event_loop_lag(Setting.METRICS_EVENT_LOOP_LAG_INTERVAL_MS / 1000)
+        )
+        if Setting.METRICS_ENABLE
+        else None
+    )
+    outbox_relay_task = (
+        asyncio.create_task(outbox_relay.run()) if Setting.OUTBOX_ENABLE else None
+    )
 
     # for i in range(10):
     #     d = UserEvent(event_type=UserEventType.UPDATED,
@@ -42,4 +65,15 @@ async def lifespan(app: FastAPI):
     #         await rabbit_manager.logger.info("Message published.")
 
     yield
+    consumer_task.cancel()
+    prune_processed_events_task.cancel()
+    cache_invalidation_task.cancel()
+    login_activity_task.cancel()
+    if outbox_relay_task is not None:
+        outbox_relay_task.cancel()
+    if event_loop_lag_task is not None:
+        event_loop_lag_task.cancel()
+    await login_activity.flush()
+    extensions.passwordHasher.shutdown()
+    shutdown_tracing()
     await extensions.rabbitManager.logger.shutdown()
@@ -7,19 +7,59 @@
 * https://github.com/alisharify7/user-service-management
 """
 
+import logging
+
 from passlib.context import CryptContext
 
-from common_libs.rabbitmq import RabbitMQManger
+from common_libs.hashing import PasswordHashingExecutor, build_crypt_context
+from common_libs.metrics import HASHING_IN_FLIGHT, HASHING_QUEUE_DEPTH
+from common_libs.rabbitmq import RabbitMQManger, RabbitMQPublisher
+from common_libs.tracing import build_span_exporter, setup_tracing
 from core.config import get_config
 
 Setting = get_config()
 
+if Setting.TRACING_ENABLE and not setup_tracing(
+    service_name=Setting.TRACING_SERVICE_NAME,
+    exporter_factory=lambda: build_span_exporter(
+        Setting.TRACING_EXPORTER,
+        otlp_endpoint=Setting.TRACING_OTLP_ENDPOINT,
+        file_path=Setting.TRACING_FILE_PATH,
+    ),
+):
+    logging.getLogger(__name__).warning(
+        "TRACING_ENABLE is set but opentelemetry is not installed, tracing is off."
+    )
 
-hashManager: CryptContext = CryptContext(schemes=["bcrypt"], deprecated="auto")
+hashManager: CryptContext = build_crypt_context(
+    schemes=Setting.HASHING_SCHEMES,
+    bcrypt_rounds=Setting.HASHING_BCRYPT_ROUNDS,
+    argon2_time_cost=Setting.HASHING_ARGON2_TIME_COST,
+    argon2_memory_cost=Setting.HASHING_ARGON2_MEMORY_COST,
+    argon2_parallelism=Setting.HASHING_ARGON2_PARALLELISM,
+)
+passwordHasher: PasswordHashingExecutor = PasswordHashingExecutor(
+    crypt_context=hashManager,
+    pool_type=Setting.HASHING_POOL_TYPE,
+    max_workers=Setting.HASHING_MAX_WORKERS,
+    max_queue_size=Setting.HASHING_MAX_QUEUE_SIZE,
+)
+HASHING_QUEUE_DEPTH.set_function(lambda: passwordHasher.queue_depth)
+HASHING_IN_FLIGHT.set_function(lambda: passwordHasher.in_flight)
 rabbitManager: RabbitMQManger = RabbitMQManger(
     username=Setting.RABBITMQ_USERNAME,
     password=Setting.RABBITMQ_PASSWORD,
     host=Setting.RABBITMQ_HOST,
     port=Setting.RABBITMQ_PORT,
     virtual_host=Setting.RABBITMQ_VHOST,
+    max_retry_connection=Setting.RABBITMQ_CONNECT_MAX_RETRIES,
+    backoff_base=Setting.RABBITMQ_BACKOFF_BASE,
+    backoff_max=Setting.RABBITMQ_BACKOFF_MAX,
+    circuit_reset_timeout=Setting.RABBITMQ_CIRCUIT_RESET_TIMEOUT,
+)
+rabbitPublisher: RabbitMQPublisher = RabbitMQPublisher(
+    manager=rabbitManager,
+    pool_size=Setting.RABBITMQ_PUBLISHER_CHANNELS,
+    max_pending=Setting.RABBITMQ_PUBLISHER_MAX_PENDING,
+    publish_timeout=Setting.RABBITMQ_PUBLISH_TIMEOUT,
 )
@@ -28,7 +28,10 @@ class BaseModel(BaseModelClass):
     """
 
     __abstract__ = True
-    id: so.Mapped[int] = so.mapped_column(sa.BigInteger(), primary_key=True)
+    id: so.Mapped[int] = so.mapped_column(
+        sa.BigInteger().with_variant(sa.Integer(), "sqlite"),  # sqlite autoincrement
+        primary_key=True,
+    )
     ulid: so.Mapped[str] = so.mapped_column(
         sa.String(32),
         nullable=False,
@@ -52,6 +55,10 @@ class BaseModel(BaseModelClass):
         onupdate=lambda: datetime.datetime.now(datetime.UTC),
         default=lambda: datetime.datetime.now(datetime.UTC),
     )
+    # optimistic lock, every update of the row must increment it (see `next_version`)
+    version: so.Mapped[int] = so.mapped_column(
+        sa.BigInteger(), nullable=False, default=1, server_default="1"
+    )
 
     @staticmethod
     def set_table_name(name: str) -> str:
@@ -67,6 +74,15 @@ class BaseModel(BaseModelClass):
         name = name.replace("-", "_").replace(" ", "")
         return f"{Setting.DATABASE_TABLE_PREFIX_NAME}{name}".lower()
 
+    @classmethod
+    def next_version(cls) -> sa.ColumnElement:
+        """
+        SQL expression of the incremented row version, for UPDATE statements.
+
+        e.g. `sa.update(Model).where(Model.version == expected).values(version=Model.next_version())`
+        """
+        return cls.version + 1
+
     async def save(
         self,
         db_session: AsyncSA.AsyncSession | None = None,
@@ -7,6 +7,10 @@
 * https://github.com/alisharify7/user-service-management
 """
 
+from core.base_views import core_router
 from users import users_router
 
-urlpatterns = [{"router": users_router, "prefix": "/users", "tags": ["users"]}]
+urlpatterns = [
+    {"router": core_router, "prefix": "", "tags": ["core"]},
+    {"router": users_router, "prefix": "/users", "tags": ["users"]},
+]
@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+from passlib.context import CryptContext
+
+from common_libs.hashing import (
+    HashingQueueFullError,
+    PasswordHashingExecutor,
+    build_crypt_context,
+)
+
+crypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify():
+    executor = PasswordHashingExecutor(crypt_context, max_workers=1)
+    hashed = await executor.hash("secret")
+    assert await executor.verify("secret", hashed)
+    assert not await executor.verify("wrong", hashed)
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_rejects_jobs_when_saturated():
+    executor = PasswordHashingExecutor(crypt_context, max_workers=1, max_queue_size=1)
+    results = await asyncio.gather(
+        *(executor.hash("secret") for _ in range(4)), return_exceptions=True
+    )
+    assert sum(isinstance(r, HashingQueueFullError) for r in results) == 2
+    assert executor.in_flight == 0
+    executor.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_verify_and_update_upgrades_outdated_hashes():
+    old_hash = build_crypt_context(bcrypt_rounds=4).hash("secret")
+    executor = PasswordHashingExecutor(
+        build_crypt_context(bcrypt_rounds=5), max_workers=1
+    )
+    is_valid, new_hash = await executor.verify_and_update("secret", old_hash)
+    assert is_valid and new_hash.startswith("$2b$05$")
+    assert await executor.verify_and_update("secret", new_hash) == (True, None)
+    assert await executor.verify_and_update("wrong", old_hash) == (False, None)
+    executor.shutdown()
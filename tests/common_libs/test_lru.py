@@ -0,0 +1,30 @@
+import time
+
+from common_libs.lru import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    cache.get("a")
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_respects_max_bytes():
+    cache = LRUCache(max_bytes=4)
+    cache.set("a", b"12")
+    cache.set("b", b"345")
+    assert cache.get("a") is None
+    assert cache.size_bytes == 3
+
+
+def test_expired_entries_are_misses():
+    cache = LRUCache(ttl=0.01)
+    cache.set("a", b"1")
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
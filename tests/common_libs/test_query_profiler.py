@@ -0,0 +1,65 @@
+import logging
+
+import pytest
+import sqlalchemy as sa
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from common_libs.query_profiler import (
+    QueryProfiler,
+    QueryProfilerMiddleware,
+    parameters_shape,
+)
+
+
+def test_parameters_shape_hides_values():
+    assert parameters_shape({"id": 1, "name": "secret"}) == "{id: int, name: str}"
+    assert parameters_shape([(1,), (2,)], executemany=True) == "2 x (int)"
+
+
+@pytest.mark.asyncio
+async def test_queries_are_counted_per_request(caplog):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    profiler = QueryProfiler(
+        slow_query_threshold=0, max_queries_per_request=3, server_timing=True
+    )
+    profiler.instrument(engine)
+
+    app = FastAPI()
+    app.add_middleware(QueryProfilerMiddleware, profiler=profiler)
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: int):
+        async with engine.connect() as connection:
+            for _ in range(3):
+                await connection.execute(sa.text("SELECT :id"), {"id": item_id})
+        return {}
+
+    caplog.set_level(logging.WARNING, logger="db.profiler")
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.get("/items/1")
+
+    assert response.headers["server-timing"].endswith('desc="3 queries"')
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(
+        "slow query" in message and "/items/{item_id}" in message
+        for message in messages
+    )
+    assert any("3 queries" in message for message in messages)
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_failed_statements_are_not_left_on_the_connection():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    QueryProfiler().instrument(engine)
+
+    async with engine.connect() as connection:
+        for _ in range(3):
+            with pytest.raises(sa.exc.OperationalError):
+                await connection.execute(sa.text("SELECT * FROM missing_table"))
+        assert connection.info.get("query_started_at") == []
+    await engine.dispose()
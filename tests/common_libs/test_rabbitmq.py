@@ -0,0 +1,166 @@
+import asyncio
+
+import aio_pika
+import pytest
+
+from common_libs.rabbitmq import (
+    PublisherBackpressureError,
+    RabbitMQManger,
+    RabbitMQPublisher,
+    RabbitMQRetryPolicy,
+    RabbitMQUnavailableError,
+)
+
+
+class FakeExchange:
+    def __init__(self, channel_name, published, confirm_delay):
+        self.channel_name = channel_name
+        self.published = published
+        self.confirm_delay = confirm_delay
+
+    async def publish(self, message, routing_key, timeout=None):
+        self.published.append((self.channel_name, message.body))
+        await asyncio.sleep(self.confirm_delay)
+
+
+class FakeChannel:
+    def __init__(self, name, published, confirm_delay):
+        self.default_exchange = FakeExchange(name, published, confirm_delay)
+
+    async def get_exchange(self, name, ensure=True):
+        return self.default_exchange
+
+
+class FakeManager:
+    def __init__(self, confirm_delay=0.0):
+        self.published = []
+        self.confirm_delay = confirm_delay
+
+    async def get_channel(self, channel_name):
+        return FakeChannel(channel_name, self.published, self.confirm_delay)
+
+
+@pytest.mark.asyncio
+async def test_publish_many_keeps_order_per_ordering_key():
+    manager = FakeManager()
+    publisher = RabbitMQPublisher(manager, pool_size=4)
+    await publisher.publish_many(
+        [
+            (aio_pika.Message(body=f"{key}-{i}".encode()), "user.updated", key)
+            for i in range(5)
+            for key in ("a", "b")
+        ],
+        exchange_name="users.events",
+    )
+    for key in ("a", "b"):
+        published = [(c, b) for c, b in manager.published if b.startswith(key.encode())]
+        assert len({channel for channel, _ in published}) == 1
+        assert [body for _, body in published] == [
+            f"{key}-{i}".encode() for i in range(5)
+        ]
+    assert publisher.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_publish_applies_backpressure():
+    publisher = RabbitMQPublisher(
+        FakeManager(confirm_delay=0.05), max_pending=2, backpressure_timeout=0.01
+    )
+    results = await asyncio.gather(
+        *(
+            publisher.publish(aio_pika.Message(body=b"user"), "user.created")
+            for _ in range(4)
+        ),
+        return_exceptions=True,
+    )
+    assert sum(isinstance(r, PublisherBackpressureError) for r in results) == 2
+    assert publisher.pending == 0
+
+
+class FakeLogger:
+    async def info(self, message):
+        pass
+
+    async def error(self, message):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_connect_opens_circuit_after_retries(monkeypatch):
+    attempts = []
+
+    async def connect_robust(**kwargs):
+        attempts.append(kwargs)
+        raise ConnectionRefusedError("broker down")
+
+    monkeypatch.setattr(aio_pika, "connect_robust", connect_robust)
+    # bypass the singleton, the application manager must not be touched
+    manager = object.__new__(RabbitMQManger)
+    manager.__init__(max_retry_connection=2, backoff_base=0.001, backoff_max=0.001)
+    manager.logger = FakeLogger()
+
+    # concurrent callers share a single connection attempt
+    results = await asyncio.gather(
+        manager.connect(), manager.connect(), return_exceptions=True
+    )
+    assert all(isinstance(r, RabbitMQUnavailableError) for r in results)
+    assert len(attempts) == 3
+    assert manager.health()["circuit"] == "open"
+    assert not manager.health()["connected"]
+
+    # fail fast while the circuit is open
+    with pytest.raises(RabbitMQUnavailableError):
+        await manager.get_channel("channel")
+    assert len(attempts) == 3
+
+
+class FakePublisher:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, message, routing_key):
+        self.published.append((routing_key, message))
+
+
+class FakeIncomingMessage:
+    def __init__(self, headers=None):
+        self.body = b"event"
+        self.headers = headers or {}
+        self.content_type = "application/json"
+        self.content_encoding = None
+        self.message_id = "message-id"
+        self.correlation_id = None
+        self.timestamp = None
+        self.type = None
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+
+@pytest.mark.asyncio
+async def test_retry_policy_delays_then_parks():
+    publisher = FakePublisher()
+    policy = RabbitMQRetryPolicy(
+        publisher, "users_queue", delays=[1, 5], max_attempts=4
+    )
+
+    message = FakeIncomingMessage()
+    for _ in range(4):
+        await policy.retry(message, "db down")
+        assert message.acked
+        routing_key, moved = publisher.published[-1]
+        message = FakeIncomingMessage(headers=moved.headers)
+
+    assert [routing_key for routing_key, _ in publisher.published] == [
+        "users_queue.retry.1",
+        "users_queue.retry.2",
+        "users_queue.retry.2",
+        "users_queue.parking",
+    ]
+    assert moved.headers["x-attempt"] == 3
+    assert moved.headers["x-failure-reason"].startswith("db down")
+    assert moved.message_id == "message-id"
+
+    await policy.park(FakeIncomingMessage(), "conflict")
+    assert publisher.published[-1][0] == "users_queue.parking"
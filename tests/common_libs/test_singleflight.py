@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from common_libs.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    results = await asyncio.gather(*(flight.do("user:1", load) for _ in range(10)))
+    assert results == [1] * 10
+    assert calls == 1
+    assert len(flight) == 0
+
+    assert await flight.do("user:1", load) == 2
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("db is down")
+
+    results = await asyncio.gather(
+        *(flight.do("user:1", fail) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_follower_retries_when_leader_is_cancelled():
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+
+    async def fast():
+        return "user"
+
+    leader = asyncio.create_task(flight.do("user:1", slow))
+    await started.wait()
+    follower = asyncio.create_task(flight.do("user:1", fast))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == "user"
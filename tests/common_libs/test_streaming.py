@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+from common_libs.streaming import StreamDecodeError, iter_json_documents
+
+
+async def _chunks(data: str, size: int):
+    data = data.encode()
+    for i in range(0, len(data), size):
+        yield data[i : i + size]
+
+
+async def _collect(data: str, size: int = 3) -> list:
+    return [document async for document in iter_json_documents(_chunks(data, size))]
+
+
+@pytest.mark.asyncio
+async def test_json_array():
+    users = [{"username": f"user-{i}", "password": "é"} for i in range(5)]
+    assert await _collect(json.dumps(users)) == users
+
+
+@pytest.mark.asyncio
+async def test_ndjson_keeps_going_after_invalid_line():
+    documents = await _collect('{"username": "a"}\n{"bad\n{"username": "b"}')
+    assert documents[0] == {"username": "a"}
+    assert isinstance(documents[1], json.JSONDecodeError)
+    assert documents[2] == {"username": "b"}
+
+
+@pytest.mark.asyncio
+async def test_unclosed_json_array():
+    with pytest.raises(StreamDecodeError):
+        await _collect('[{"username": "a"}')
@@ -0,0 +1,54 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from common_libs import tracing
+from common_libs.rabbitmq import RabbitMQConsumer
+
+in_memory = pytest.importorskip(
+    "opentelemetry.sdk.trace.export.in_memory_span_exporter"
+)
+
+
+class FakeIncomingMessage:
+    def __init__(self, headers):
+        self.headers = headers
+        self.message_id = "message-id"
+        self.processed = False
+
+
+@pytest.mark.asyncio
+async def test_trace_is_propagated_from_publisher_to_db_queries():
+    exporter = in_memory.InMemorySpanExporter()
+    tracing.setup_tracing("test", exporter_factory=lambda: exporter, batch=False)
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    tracing.instrument_engine(engine)
+
+    @tracing.traced("operation")
+    async def operation():
+        async with engine.connect() as connection:
+            await connection.execute(sa.text("SELECT 1"))
+
+    async def handler(message):
+        await operation()
+
+    try:
+        with tracing.span("publish", kind="producer"):
+            headers = tracing.inject_headers({})
+        assert "traceparent" in headers
+
+        consumer = RabbitMQConsumer(handler=handler)
+        consumer.queue_name = "users_queue"
+        await consumer.on_message(FakeIncomingMessage(headers))
+    finally:
+        tracing.shutdown_tracing()
+        await engine.dispose()
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert set(spans) == {"publish", "users_queue process", "operation", "db SELECT"}
+    assert len({span.context.trace_id for span in spans.values()}) == 1
+    assert (
+        spans["users_queue process"].parent.span_id == spans["publish"].context.span_id
+    )
+    assert spans["db SELECT"].parent.span_id == spans["operation"].context.span_id
+    assert not tracing.is_enabled()
@@ -2,15 +2,16 @@ import pytest
 from httpx import AsyncClient
 
 from core import create_app, get_config
-from core.db import BaseModelClass, get_session
+from core.db import BaseModelClass, get_session, get_session_factory
 
-from .utils import engine, get_session_test
+from .utils import engine, get_session_factory_test, get_session_test
 
 
 @pytest.fixture()
 async def app():
     fastapp = create_app(get_config())
     fastapp.dependency_overrides[get_session] = get_session_test
+    fastapp.dependency_overrides[get_session_factory] = get_session_factory_test
 
     async with engine.begin() as conn:
         await conn.run_sync(BaseModelClass.metadata.drop_all)
@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from users.auth import LoginActivityRecorder
+
+
+@pytest.mark.asyncio
+async def test_login_activity_survives_connection_errors():
+    calls = 0
+
+    def session_factory():
+        nonlocal calls
+        calls += 1
+        raise ConnectionRefusedError("database is down")
+
+    recorder = LoginActivityRecorder(session_factory, flush_interval=0.01)
+    task = asyncio.create_task(recorder.run())
+    recorder.record_failure(1)
+    await asyncio.sleep(0.05)
+    recorder.record_failure(1)
+    await asyncio.sleep(0.05)
+
+    assert not task.done()  # the failed flushes did not end the task
+    assert calls == 2
+    task.cancel()
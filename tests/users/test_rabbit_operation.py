@@ -0,0 +1,89 @@
+from contextlib import asynccontextmanager
+
+import pytest
+
+from tests.users.test_routes import create_users
+from tests.utils import async_session
+from users.rabbit_operation import (
+    ALREADY_PROCESSED,
+    apply_user_event,
+    apply_user_events_batch,
+)
+from users.scheme import (
+    CreateUserEvent,
+    DeleteUserEvent,
+    UpdateUserEvent,
+    UserEvent,
+    UserEventType,
+)
+
+
+@asynccontextmanager
+async def get_session_test():
+    async with async_session() as session:
+        yield session
+
+
+@pytest.mark.asyncio
+async def test_redelivered_event_is_skipped(client, monkeypatch):
+    monkeypatch.setattr("users.rabbit_operation.get_session", get_session_test)
+    await create_users(client, 1)
+    event = UserEvent(event_type=UserEventType.DELETED, data=DeleteUserEvent(id=1))
+
+    assert await apply_user_event(event, message_id="message-1") == (True,)
+    # a redelivery is acked as a duplicate instead of failing with "not found"
+    assert await apply_user_event(event, message_id="message-1") is ALREADY_PROCESSED
+    # without message id there is nothing to deduplicate on
+    assert len(await apply_user_event(event)) == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_event_is_not_marked_processed(client, monkeypatch):
+    monkeypatch.setattr("users.rabbit_operation.get_session", get_session_test)
+    await create_users(client, 1)
+    missing = UserEvent(event_type=UserEventType.DELETED, data=DeleteUserEvent(id=999))
+    stale = UserEvent(
+        event_type=UserEventType.UPDATED,
+        data=UpdateUserEvent(
+            id=1,
+            version=5,
+            username="user-0",
+            email_address="user-0@example.com",
+            phone_number="09120000000",
+            gender="male",
+        ),
+    )
+
+    # a replay (e.g. from the parking queue) applies the event again
+    for _ in range(2):
+        assert (await apply_user_event(missing, message_id="m-1"))[0] == 400
+        assert (await apply_user_event(stale, message_id="m-2"))[0] == 412
+
+
+@pytest.mark.asyncio
+async def test_batch_keeps_arrival_order(client, monkeypatch):
+    monkeypatch.setattr("users.rabbit_operation.get_session", get_session_test)
+
+    async def unbatched(*args, **kwargs):
+        raise AssertionError("the batch transaction failed")
+
+    monkeypatch.setattr("users.rabbit_operation.apply_user_event", unbatched)
+    await create_users(client, 1)
+    # different ordering keys (id / username), so both can share a batch
+    delete = UserEvent(event_type=UserEventType.DELETED, data=DeleteUserEvent(id=1))
+    recreate = UserEvent(
+        event_type=UserEventType.CREATED,
+        data=CreateUserEvent(
+            username="user-0",
+            password="password",
+            email_address="user-0@example.com",
+            phone_number="09120000000",
+            gender="male",
+        ),
+    )
+
+    results = await apply_user_events_batch([("m-1", delete), ("m-2", recreate)])
+    assert [len(result) for result in results] == [1, 1]
+    response = await client.get("/users/username/user-0")
+    assert response.status_code == 200
+    assert response.json()["public_key"] == results[1][0].public_key
@@ -1,4 +1,14 @@
+import json
+
 import pytest
+import sqlalchemy as sa
+
+from common_libs.lru import LRUCache
+from tests.utils import async_session
+from users.cache import user_cache
+from users.model import User as UserModel
+from users.model import UserOutboxEvent
+from users.scheme import DumpUserScheme
 
 
 @pytest.mark.asyncio
@@ -6,3 +16,327 @@ async def test_index(client):
     print(client)
     response = await client.get("/")
     assert response.status_code == 200
+
+
+async def test_health(client):
+    response = await client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["status"] == "degraded"  # rabbitmq is not connected
+    assert response.json()["rabbitmq"]["circuit"] == "closed"
+
+
+async def test_metrics(client):
+    await client.get("/users/id/12")
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert (
+        'http_requests_total{method="GET",route="/users/id/{user_id}",status="404"}'
+        in response.text
+    )
+    assert "db_pool_checked_out" in response.text
+
+
+async def create_users(client, count: int):
+    for i in range(count):
+        response = await client.post(
+            "/users/",
+            json={
+                "username": f"user-{i}",
+                "password": "password",
+                "email_address": f"user-{i}@example.com",
+                "phone_number": f"0912000000{i}",
+                "gender": "male",
+            },
+        )
+        assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_cursor_pagination(client):
+    await create_users(client, 5)
+
+    usernames, cursor = [], None
+    while True:
+        params = {"size": 2, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get("/users/cursor", params=params)).json()
+        usernames += [user["username"] for user in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert usernames == [f"user-{i}" for i in range(5)]
+
+    response = await client.get("/users/cursor", params={"cursor": "invalid"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_export_users_csv(client):
+    await create_users(client, 3)
+
+    response = await client.get(
+        "/users/export", params={"format": "csv", "fields": "username,gender"}
+    )
+    assert response.status_code == 200
+    assert response.text.splitlines() == [
+        "username,gender",
+        "user-0,male",
+        "user-1,male",
+        "user-2,male",
+    ]
+
+    response = await client.get("/users/export", params={"fields": "password"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_bulk_create_users(client):
+    await create_users(client, 1)
+    documents = [
+        {
+            "username": "bulk-0",
+            "password": "password",
+            "email_address": "bulk-0@example.com",
+            "phone_number": "09130000000",
+            "gender": "male",
+        },
+        {
+            "username": "user-0",  # already exists
+            "password": "password",
+            "email_address": "bulk-1@example.com",
+            "phone_number": "09130000001",
+            "gender": "male",
+        },
+        {"username": "bulk-2"},  # no password
+    ]
+    body = "\n".join(json.dumps(document) for document in documents) + "\n{invalid\n"
+
+    response = await client.post(
+        "/users/bulk", content=body, headers={"content-type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [(r["index"], r["status"]) for r in results] == [
+        (0, 201),
+        (1, 409),
+        (2, 422),
+        (3, 400),
+    ]
+    assert results[1]["detail"] == "User already exists."
+
+    response = await client.get("/users/username/bulk-0")
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_create_user_conflict(client):
+    await create_users(client, 1)
+    response = await client.post(
+        "/users/",
+        json={
+            "username": "user-0",
+            "password": "password",
+            "email_address": "other@example.com",
+            "phone_number": "09129999999",
+            "gender": "male",
+        },
+    )
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Username already exists."
+
+
+@pytest.mark.asyncio
+async def test_get_users_batch(client, monkeypatch):
+    await create_users(client, 3)
+    # user 42 is only in the cache, so it can only be served from there
+    cached_user = DumpUserScheme(
+        id=42,
+        username="cached",
+        email_address="cached@example.com",
+        phone_number="09139999999",
+        gender="male",
+        public_key="cached-key",
+        version=1,
+    )
+
+    async def get_many(field, values):
+        return [
+            (True, cached_user) if value == 42 else (False, None) for value in values
+        ]
+
+    monkeypatch.setattr(user_cache, "get_many", get_many)
+
+    keys = [3, 42, 999, 1, 3]
+    response = await client.post("/users/batch", json={"field": "id", "keys": keys})
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [item["key"] for item in items] == keys
+    assert [item["user"] and item["user"]["username"] for item in items] == [
+        "user-2",
+        "cached",
+        None,
+        "user-0",
+        "user-2",
+    ]
+    assert response.json()["missing"] == [999]
+
+
+@pytest.mark.asyncio
+async def test_get_users_batch_invalid_ids(client):
+    response = await client.post(
+        "/users/batch", json={"field": "id", "keys": [1, "not-an-id"]}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid user ID."
+
+
+@pytest.mark.asyncio
+async def test_verify_credentials(client):
+    await create_users(client, 1)
+    response = await client.post(
+        "/users/verify-credentials",
+        json={"username": "user-0", "password": "wrong-password"},
+    )
+    assert response.status_code == 401
+
+    response = await client.post(
+        "/users/verify-credentials",
+        json={"username": "user-0", "password": "password"},
+    )
+    assert response.status_code == 200
+    assert response.json()["username"] == "user-0"
+
+
+@pytest.mark.asyncio
+async def test_verify_credentials_of_inactive_user(client):
+    await create_users(client, 1)
+    async with async_session() as session:
+        await session.execute(sa.update(UserModel).values(is_active=False))
+        await session.commit()
+
+    response = await client.post(
+        "/users/verify-credentials",
+        json={"username": "user-0", "password": "password"},
+    )
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Invalid username or password."
+
+
+@pytest.mark.asyncio
+async def test_update_user_without_password_keeps_it(client):
+    await create_users(client, 1)
+    response = await client.put(
+        "/users/1",
+        json={
+            "username": "user-0",
+            "first_name": "renamed",
+            "email_address": "user-0@example.com",
+            "phone_number": "09120000000",
+            "gender": "male",
+        },
+    )
+    assert response.status_code == 204
+
+    response = await client.post(
+        "/users/verify-credentials",
+        json={"username": "user-0", "password": "password"},
+    )
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "renamed"
+
+
+@pytest.mark.asyncio
+async def test_patch_user(client):
+    await create_users(client, 2)
+    response = await client.patch("/users/1", json={"first_name": "patched"})
+    assert response.status_code == 204
+
+    response = await client.get("/users/id/1")
+    assert response.json()["first_name"] == "patched"
+    assert response.json()["email_address"] == "user-0@example.com"
+
+    response = await client.patch("/users/1", json={"first_name": "patched"})
+    assert response.status_code == 204
+
+    response = await client.patch("/users/1", json={"username": "user-1"})
+    assert response.status_code == 409
+
+    # optional, but not nullable
+    response = await client.patch("/users/1", json={"username": None})
+    assert response.status_code == 422
+
+    response = await client.patch("/users/404", json={"first_name": "patched"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_etag_and_optimistic_locking(client):
+    await create_users(client, 1)
+    response = await client.get("/users/id/1")
+    etag = response.headers["etag"]
+    assert etag == '"1-1"'
+
+    response = await client.get("/users/id/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = await client.patch(
+        "/users/1", json={"first_name": "first"}, headers={"If-Match": etag}
+    )
+    assert response.status_code == 204
+    assert response.headers["etag"] == '"1-2"'
+
+    response = await client.patch(
+        "/users/1", json={"first_name": "second"}, headers={"If-Match": etag}
+    )
+    assert response.status_code == 412
+
+    response = await client.get("/users/id/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "first"
+
+
+@pytest.mark.asyncio
+async def test_password_patch_refreshes_cached_etag(client, monkeypatch):
+    monkeypatch.setattr(user_cache, "local_cache", LRUCache())
+    await create_users(client, 1)
+    response = await client.get("/users/id/1")  # cached with version 1
+    etag = response.headers["etag"]
+
+    response = await client.patch(
+        "/users/1", json={"password": "new-password"}, headers={"If-Match": etag}
+    )
+    assert response.status_code == 204
+    new_etag = response.headers["etag"]
+    assert new_etag != etag
+
+    response = await client.get("/users/id/1", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] == new_etag
+
+    response = await client.patch(
+        "/users/1", json={"first_name": "first"}, headers={"If-Match": new_etag}
+    )
+    assert response.status_code == 204
+
+
+@pytest.mark.asyncio
+async def test_changes_are_added_to_outbox(client):
+    await create_users(client, 1)
+    await client.patch("/users/1", json={"first_name": "patched"})
+    await client.patch("/users/1", json={"first_name": "patched"})  # no-op
+    await client.delete("/users/id/1")
+
+    async with async_session() as session:
+        events = (
+            (await session.execute(sa.select(UserOutboxEvent).order_by("id")))
+            .scalars()
+            .all()
+        )
+    assert [event.event_type for event in events] == [
+        "user.created",
+        "user.updated",
+        "user.deleted",
+    ]
+    assert events[1].payload["first_name"] == "patched"
+    assert events[1].payload["version"] == 2
+    assert {event.aggregate_id for event in events} == {1}
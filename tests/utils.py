@@ -1,10 +1,9 @@
-from sqlalchemy.ext.asyncio import create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
 engine = create_async_engine(TEST_DATABASE_URL)
-async_session = sessionmaker(
+async_session = async_sessionmaker(
     bind=engine, expire_on_commit=False, autoflush=False, autocommit=False
 )
 
@@ -12,3 +11,7 @@ async_session = sessionmaker(
 async def get_session_test():
     async with async_session() as session:
         yield session
+
+
+def get_session_factory_test():
+    return async_session
@@ -0,0 +1,152 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import asyncio
+import datetime
+import logging
+import typing
+
+import sqlalchemy as sa
+import sqlalchemy.ext.asyncio as AsyncSA
+
+from common_libs.ratelimit import FailureRateLimiter
+from core.config import get_config
+from core.db import Session
+from users.model import User as UserModel
+
+Setting = get_config()
+
+logger = logging.getLogger(__name__)
+
+
+class LoginActivityRecorder:
+    """
+    Write-behind buffer for the login bookkeeping of users (`last_login`, `login_attempts`).
+
+    Login attempts (and password hash upgrades) are only recorded in memory and aggregated
+    per user; `flush` applies all of them with a few executemany UPDATE statements in a
+    single transaction, so a burst of logins costs one commit per flush interval instead
+    of one per attempt.
+
+    `login_attempts` counts the failed attempts since the last successful login.
+    Recording is best effort: pending activity is lost if a flush fails.
+    """
+
+    def __init__(
+        self,
+        session_factory: typing.Callable[[], AsyncSA.AsyncSession],
+        flush_interval: float = 1.0,
+    ) -> None:
+        """
+        :param session_factory: creates the sessions used to apply the updates.
+        :param flush_interval: seconds between two flushes of `run`.
+        """
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        # user id -> [last successful login or None, failed attempts after it]
+        self._pending: dict[int, list] = {}
+        # user id -> (hash the password was verified against, new hash)
+        self._password_upgrades: dict[int, tuple[str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record_success(
+        self, user_id: int, at: typing.Optional[datetime.datetime] = None
+    ) -> None:
+        """remember a successful login, it resets the failed attempts of the user"""
+        at = at or datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        self._pending[user_id] = [at, 0]
+
+    def record_failure(self, user_id: int) -> None:
+        """remember a failed login of the user"""
+        self._pending.setdefault(user_id, [None, 0])[1] += 1
+
+    def record_password_upgrade(
+        self, user_id: int, old_hash: str, new_hash: str
+    ) -> None:
+        """
+        replace the password hash of the user, unless the password changed meanwhile
+        """
+        self._password_upgrades[user_id] = (old_hash, new_hash)
+
+    async def flush(self) -> None:
+        """apply the pending activity to the database"""
+        if not self._pending and not self._password_upgrades:
+            return
+        pending, self._pending = self._pending, {}
+        upgrades, self._password_upgrades = self._password_upgrades, {}
+
+        users = UserModel.__table__
+        logged_in = [
+            {"b_id": user_id, "b_last_login": last_login, "b_failures": failures}
+            for user_id, (last_login, failures) in pending.items()
+            if last_login is not None
+        ]
+        failed = [
+            {"b_id": user_id, "b_failures": failures}
+            for user_id, (last_login, failures) in pending.items()
+            if last_login is None
+        ]
+        async with self.session_factory() as db_session:
+            if logged_in:
+                await db_session.execute(
+                    sa.update(users)
+                    .where(users.c.id == sa.bindparam("b_id"))
+                    .values(
+                        last_login=sa.bindparam("b_last_login"),
+                        login_attempts=sa.bindparam("b_failures"),
+                    ),
+                    logged_in,
+                )
+            if failed:
+                await db_session.execute(
+                    sa.update(users)
+                    .where(users.c.id == sa.bindparam("b_id"))
+                    .values(
+                        login_attempts=users.c.login_attempts
+                        + sa.bindparam("b_failures")
+                    ),
+                    failed,
+                )
+            if upgrades:
+                await db_session.execute(
+                    sa.update(users)
+                    .where(
+                        users.c.id == sa.bindparam("b_id"),
+                        users.c.password == sa.bindparam("b_old_hash"),
+                    )
+                    .values(password=sa.bindparam("b_new_hash")),
+                    [
+                        {"b_id": user_id, "b_old_hash": old, "b_new_hash": new}
+                        for user_id, (old, new) in upgrades.items()
+                    ],
+                )
+            await db_session.commit()
+
+    async def run(self) -> None:
+        """flush the pending activity every `flush_interval` seconds, runs forever"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                # e.g. the database is unreachable, keep recording and try again
+                logger.exception("Error occurred while saving the login activity")
+
+
+login_activity: LoginActivityRecorder = LoginActivityRecorder(
+    session_factory=Session,
+    flush_interval=Setting.LOGIN_ACTIVITY_FLUSH_INTERVAL_MS / 1000,
+)
+login_throttle: FailureRateLimiter = FailureRateLimiter(
+    redis_client=Setting.REDIS_CACHE_INTERFACE,
+    window=Setting.LOGIN_THROTTLE_WINDOW,
+    key_prefix="users:login:failures",
+)
@@ -0,0 +1,356 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import asyncio
+import json
+import math
+import random
+import time
+import typing
+
+import redis.asyncio as redis
+from pydantic import ValidationError
+from redis.exceptions import RedisError
+
+from common_libs.lru import LRUCache
+from common_libs.metrics import CACHE_LOOKUPS
+from core.config import get_config
+from users.scheme import DumpUserScheme
+
+Setting = get_config()
+
+
+class UserCache:
+    """
+    Read-through cache for user lookups, backed by redis.
+
+    A user is cached as a serialized `DumpUserScheme` under one key per lookup
+    field (id, username and public key), so any of the three lookups can be
+    served from the cache after the first miss. Lookups that found no user are
+    cached too (with a shorter ttl) to absorb repeated 404s.
+
+    An optional in-process `LRUCache` (L1) sits in front of redis to save the
+    network round trip for hot users. Invalidations are published on a redis
+    pub/sub channel so every worker drops the keys from its own L1, see
+    `listen_invalidations`.
+
+    Every cached user carries its expiry time and the time it took to load it
+    from the database. A lookup may report a miss shortly before the entry
+    expires (probabilistic early refresh, "XFetch"), with a probability growing
+    as expiry approaches and with the load time, so a hot user is reloaded by a
+    single request instead of by every request right after it expired.
+
+    Redis is treated as best effort: every redis error is swallowed and the
+    caller falls back to the database.
+    """
+
+    LOOKUP_FIELDS = ("id", "username", "public_key")
+    NOT_FOUND_MARKER = b"\x00not-found"
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        ttl: int = 300,
+        negative_ttl: int = 30,
+        enabled: bool = True,
+        key_prefix: str = "users",
+        local_cache: typing.Optional[LRUCache] = None,
+        invalidation_channel: str = "users:cache:invalidation",
+        early_refresh_beta: float = 1.0,
+    ) -> None:
+        """
+        :param redis_client: async redis client used as cache storage.
+        :param ttl: ttl (seconds) of cached users.
+        :param negative_ttl: ttl (seconds) of cached "not found" results.
+        :param enabled: if False every lookup is a miss and nothing is stored.
+        :param key_prefix: prefix of all cache keys.
+        :param local_cache: optional per-worker L1 cache in front of redis.
+        :param invalidation_channel: redis pub/sub channel for L1 invalidations.
+        :param early_refresh_beta: eagerness of the early refresh, 0 disables it.
+        """
+        self.redis = redis_client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.enabled = enabled
+        self.key_prefix = key_prefix
+        self.local_cache = local_cache
+        self.invalidation_channel = invalidation_channel
+        self.early_refresh_beta = early_refresh_beta
+
+    def key(self, field: str, value: typing.Any) -> str:
+        """build cache key of a lookup field and its value"""
+        return f"{self.key_prefix}:{field}:{value}"
+
+    async def get(
+        self, field: str, value: typing.Any
+    ) -> tuple[bool, typing.Optional[DumpUserScheme]]:
+        """
+        Look up a user in the cache.
+
+        :return:
+            - `(False, None)` on a miss (or if the entry should be refreshed early).
+            - `(True, None)` if a "not found" result is cached.
+            - `(True, user)` if the user is cached.
+        """
+        if not self.enabled:
+            return (False, None)
+        key = self.key(field, value)
+        cached = self.local_cache.get(key) if self.local_cache is not None else None
+        layer = "l1_hit"
+        if cached is None:
+            layer = "redis_hit"
+            try:
+                cached = await self.redis.get(key)
+            except RedisError:
+                cached = None
+            if cached is None:
+                CACHE_LOOKUPS.labels("users", "miss").inc()
+                return (False, None)
+            self._set_local(key, cached)
+
+        result = self._decode(cached)
+        CACHE_LOOKUPS.labels("users", layer if result[0] else "miss").inc()
+        return result
+
+    async def get_many(
+        self, field: str, values: typing.Sequence[typing.Any]
+    ) -> list[tuple[bool, typing.Optional[DumpUserScheme]]]:
+        """
+        Look up many users by one lookup field, keys missing from the L1 cache are
+        fetched from redis with a single MGET.
+
+        :return: one `get`-like result per value, in order.
+        """
+        if not self.enabled:
+            return [(False, None)] * len(values)
+        keys = [self.key(field, value) for value in values]
+        cached = [
+            self.local_cache.get(key) if self.local_cache is not None else None
+            for key in keys
+        ]
+        remote_indexes = [index for index, value in enumerate(cached) if value is None]
+        if remote_indexes:
+            try:
+                remote = await self.redis.mget([keys[i] for i in remote_indexes])
+            except RedisError:
+                remote = [None] * len(remote_indexes)
+            for index, value in zip(remote_indexes, remote):
+                if value is not None:
+                    cached[index] = value
+                    self._set_local(keys[index], value)
+
+        results = [
+            (False, None) if value is None else self._decode(value) for value in cached
+        ]
+        from_redis = set(remote_indexes)
+        for index, (found, _) in enumerate(results):
+            layer = "redis_hit" if index in from_redis else "l1_hit"
+            CACHE_LOOKUPS.labels("users", layer if found else "miss").inc()
+        return results
+
+    async def set(self, user: DumpUserScheme, delta: float = 0.0) -> None:
+        """
+        store a user under all of its lookup keys.
+
+        :param user: user to store.
+        :param delta: seconds it took to load the user, drives the early refresh.
+        """
+        if not self.enabled:
+            return
+        payload = self._encode(user, delta)
+        keys = [self.key(field, getattr(user, field)) for field in self.LOOKUP_FIELDS]
+        for key in keys:
+            self._set_local(key, payload)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(key, payload, ex=self.ttl)
+                await pipe.execute()
+        except RedisError:
+            pass
+
+    async def set_not_found(self, field: str, value: typing.Any) -> None:
+        """remember that no user exists for a lookup field value"""
+        if not self.enabled:
+            return
+        key = self.key(field, value)
+        self._set_local(key, self.NOT_FOUND_MARKER)
+        try:
+            await self.redis.set(key, self.NOT_FOUND_MARKER, ex=self.negative_ttl)
+        except RedisError:
+            pass
+
+    async def set_many(
+        self,
+        users: typing.Iterable[DumpUserScheme],
+        not_found: typing.Iterable[tuple[str, typing.Any]] = (),
+        delta: float = 0.0,
+    ) -> None:
+        """
+        Store many users (under all of their lookup keys) and "not found" results
+        in one redis round trip.
+
+        :param users: users to store.
+        :param not_found: `(field, value)` lookups that found no user.
+        :param delta: seconds it took to load the users, drives the early refresh.
+        """
+        if not self.enabled:
+            return
+        entries = []
+        for user in users:
+            payload = self._encode(user, delta)
+            for field in self.LOOKUP_FIELDS:
+                entries.append(
+                    (self.key(field, getattr(user, field)), payload, self.ttl)
+                )
+        for field, value in not_found:
+            entries.append(
+                (self.key(field, value), self.NOT_FOUND_MARKER, self.negative_ttl)
+            )
+        if not entries:
+            return
+        for key, payload, _ in entries:
+            self._set_local(key, payload)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, payload, ttl in entries:
+                    pipe.set(key, payload, ex=ttl)
+                await pipe.execute()
+        except RedisError:
+            pass
+
+    async def invalidate(
+        self,
+        user_id: typing.Optional[int] = None,
+        usernames: typing.Iterable[str] = (),
+        public_keys: typing.Iterable[str] = (),
+    ) -> None:
+        """
+        Drop every cache entry of a user.
+
+        The cached payload under the id key (if any) is read first, so keys of
+        values that are no longer known to the caller (e.g. the old username
+        after a rename) are dropped as well.
+
+        :param user_id: id of the changed user.
+        :param usernames: usernames to drop, e.g. old and new username.
+        :param public_keys: public keys to drop.
+        """
+        if not self.enabled:
+            return
+        keys = {self.key("username", username) for username in usernames if username}
+        keys |= {self.key("public_key", key) for key in public_keys if key}
+        try:
+            if user_id is not None:
+                id_key = self.key("id", user_id)
+                keys.add(id_key)
+                cached = (
+                    self.local_cache.get(id_key)
+                    if self.local_cache is not None
+                    else None
+                ) or await self.redis.get(id_key)
+                if cached is not None and cached != self.NOT_FOUND_MARKER:
+                    cached_user = json.loads(cached)
+                    cached_user = cached_user.get("user", cached_user)
+                    keys.add(self.key("username", cached_user["username"]))
+                    keys.add(self.key("public_key", cached_user["public_key"]))
+            if self.local_cache is not None:
+                self.local_cache.delete(*keys)
+            if keys:
+                await self.redis.delete(*keys)
+                if self.local_cache is not None:
+                    await self.redis.publish(
+                        self.invalidation_channel, json.dumps(sorted(keys))
+                    )
+        except RedisError:
+            pass
+
+    def _encode(self, user: DumpUserScheme, delta: float) -> bytes:
+        envelope = {
+            "expires_at": time.time() + self.ttl,
+            "delta": delta,
+            "user": user.model_dump(mode="json"),
+        }
+        return json.dumps(envelope).encode()
+
+    def _decode(self, cached: bytes) -> tuple[bool, typing.Optional[DumpUserScheme]]:
+        if cached == self.NOT_FOUND_MARKER:
+            return (True, None)
+        envelope = json.loads(cached)
+        if "user" not in envelope:  # written by an older version, reload it
+            return (False, None)
+        if self._should_refresh_early(envelope["expires_at"], envelope["delta"]):
+            return (False, None)
+        try:
+            return (True, DumpUserScheme.model_validate(envelope["user"]))
+        except ValidationError:  # cached with an older scheme, reload it
+            return (False, None)
+
+    def _should_refresh_early(self, expires_at: float, delta: float) -> bool:
+        """XFetch: now - delta * beta * ln(rand()) >= expiry"""
+        if self.early_refresh_beta <= 0 or delta <= 0:
+            return False
+        return (
+            time.time()
+            - delta * self.early_refresh_beta * math.log(1.0 - random.random())
+            >= expires_at
+        )
+
+    def _set_local(self, key: str, value: bytes) -> None:
+        if self.local_cache is None:
+            return
+        # a cached 404 must not outlive its (shorter) redis ttl in L1
+        ttl = (
+            min(self.local_cache.ttl, self.negative_ttl)
+            if value == self.NOT_FOUND_MARKER
+            else None
+        )
+        self.local_cache.set(key, value, ttl=ttl)
+
+    async def listen_invalidations(self, retry_delay: float = 1.0) -> None:
+        """
+        Drop keys published on the invalidation channel from the local L1 cache.
+
+        Runs forever, meant to be started as a background task once per worker.
+        The local cache is cleared whenever the subscription is (re)established,
+        since invalidations sent while disconnected are lost.
+        """
+        if self.local_cache is None or not self.enabled:
+            return
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.invalidation_channel)
+                    self.local_cache.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        self.local_cache.delete(*json.loads(message["data"]))
+            except RedisError:
+                self.local_cache.clear()
+                await asyncio.sleep(retry_delay)
+
+
+user_cache: UserCache = UserCache(
+    redis_client=Setting.REDIS_CACHE_INTERFACE,
+    ttl=Setting.CACHE_USER_TTL,
+    negative_ttl=Setting.CACHE_USER_NEGATIVE_TTL,
+    enabled=Setting.CACHE_ENABLE,
+    local_cache=(
+        LRUCache(
+            max_entries=Setting.CACHE_L1_MAX_ENTRIES,
+            max_bytes=Setting.CACHE_L1_MAX_BYTES,
+            ttl=Setting.CACHE_L1_TTL,
+        )
+        if Setting.CACHE_L1_ENABLE
+        else None
+    ),
+    invalidation_channel=Setting.CACHE_INVALIDATION_CHANNEL,
+    early_refresh_beta=Setting.CACHE_EARLY_REFRESH_BETA,
+)
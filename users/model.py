@@ -10,11 +10,12 @@
 import datetime
 import enum
 import typing
+import uuid
 
 import sqlalchemy as sa
 import sqlalchemy.orm as so
 
-from core.extensions import hashManager
+from core.extensions import passwordHasher
 from core.model import BaseModel
 
 
@@ -26,6 +27,10 @@ class Gender(enum.Enum):
 
 class User(BaseModel):
     __tablename__ = BaseModel.set_table_name("users")
+    __table_args__ = (
+        # keyset pagination ordered by (created_at, id)
+        sa.Index(f"ix_{__tablename__}_created_at_id", "created_at", "id"),
+    )
     first_name: so.Mapped[str] = so.mapped_column(
         sa.String(256), unique=False, nullable=True
     )
@@ -35,7 +40,9 @@ class User(BaseModel):
     username: so.Mapped[str] = so.mapped_column(
         sa.String(256), unique=True, nullable=False
     )
-    password: so.Mapped[str] = so.mapped_column(sa.String(60), nullable=False)
+    password: so.Mapped[str] = so.mapped_column(
+        sa.String(255), nullable=False
+    )  # bcrypt hashes are 60 chars, argon2 hashes ~100
     email_address: so.Mapped[str] = so.mapped_column(
         sa.String(320), unique=True, nullable=True
     )  # https://stackoverflow.com/questions/386294/what-is-the-maximum-length-of-a-valid-email-address
@@ -51,6 +58,53 @@ class User(BaseModel):
     gender: so.Mapped[Gender] = so.mapped_column(
         sa.Enum(Gender), nullable=True, default=Gender.male
     )
+    public_key: so.Mapped[str] = so.mapped_column(
+        sa.String(36), nullable=False, unique=True, index=True
+    )
+    # users are active once created, inactive users can not log in
+    is_active: so.Mapped[bool] = so.mapped_column(
+        sa.Boolean(), nullable=False, default=True, server_default=sa.true()
+    )
+
+    async def set_password(self, password: str) -> None:
+        """hash the given password in the hashing executor and set it on the user.
+
+        :raises HashingQueueFullError: if the hashing executor is saturated.
+        """
+        self.password = await passwordHasher.hash(password)
+
+    def set_public_key(self) -> None:
+        """generate a new random public key for the user."""
+        self.public_key = str(uuid.uuid4())
+
 
-    def set_password(self, username: str) -> None:
-        self.password = hashManager.hash(username)
+class UserOutboxEvent(BaseModel):
+    """
+    transactional outbox of user change events.
+
+    rows are inserted in the same transaction as the user change and published
+    to rabbitmq (then deleted) by `users.outbox.UserOutboxRelay`, the `ulid` is
+    used as message id.
+    """
+
+    __tablename__ = BaseModel.set_table_name("users_outbox")
+    event_type: so.Mapped[str] = so.mapped_column(sa.String(32), nullable=False)
+    aggregate_id: so.Mapped[int] = so.mapped_column(
+        sa.BigInteger(), nullable=False
+    )  # id of the changed user
+    payload: so.Mapped[dict] = so.mapped_column(sa.JSON(), nullable=False)
+
+
+class ProcessedUserEvent(BaseModel):
+    """
+    message ids of the consumed user events that were applied.
+
+    rows are inserted in the same transaction as the change of the event, so a
+    redelivered event (at-least-once delivery) is recognized and acked without
+    being applied twice. old rows are pruned after `RABBITMQ_DEDUP_RETENTION_HOURS`.
+    """
+
+    __tablename__ = BaseModel.set_table_name("users_processed_events")
+    message_id: so.Mapped[str] = so.mapped_column(
+        sa.String(64), nullable=False, unique=True, index=True
+    )
@@ -1,57 +1,163 @@
+import asyncio
+import datetime
+import time
+import typing
+import uuid
+
 import sqlalchemy as sa
 import sqlalchemy.ext.asyncio as AsyncSA
+from sqlalchemy.dialects import postgresql
 from starlette import status as http_status
 
-from core.extensions import hashManager
+from common_libs.hashing import HashingQueueFullError
+from common_libs.singleflight import SingleFlight
+from common_libs.tracing import traced
+from common_libs.utils import decode_cursor, encode_cursor
+from core.config import get_config
+from core.extensions import passwordHasher
+from users.auth import login_activity, login_throttle
+from users.cache import user_cache
 from users.model import User as UserModel
+from users.model import UserOutboxEvent
+from users.outbox import outbox_relay
+from users.scheme import DumpUserScheme, UserEventType
+
+Setting = get_config()
+
+# concurrent cache misses of the same user share one database query
+user_lookups: SingleFlight = SingleFlight()
+
+# columns of a user change event (the `DumpUserScheme` fields)
+USER_EVENT_COLUMNS = tuple(
+    getattr(UserModel, field) for field in DumpUserScheme.model_fields
+)
+
+
+def _user_event(event_type: UserEventType, user: typing.Any) -> dict:
+    """
+    outbox row of a user change event. `user` holds the `DumpUserScheme` fields
+    (a model, row or dict), deleted users only need id, username and public_key.
+    """
+    if isinstance(user, dict):
+        user = DumpUserScheme.model_validate(user)
+    if event_type == UserEventType.DELETED:
+        payload = {
+            "id": user.id,
+            "username": user.username,
+            "public_key": user.public_key,
+        }
+    else:
+        payload = DumpUserScheme.model_validate(user).model_dump(mode="json")
+    return {"event_type": event_type.value, "aggregate_id": user.id, "payload": payload}
+
+
+async def _add_outbox_events(
+    db_session: AsyncSA.AsyncSession, events: list[dict]
+) -> None:
+    """
+    append user change events to the outbox, in the transaction of the change.
+    they are published by `outbox_relay` after commit (no broker round trip here).
+    """
+    if Setting.OUTBOX_ENABLE and events:
+        await db_session.execute(sa.insert(UserOutboxEvent), events)
+
+
+def _any_of(
+    column: sa.ColumnElement,
+    values: list,
+    column_type: type,
+    db_session: AsyncSA.AsyncSession,
+) -> sa.ColumnElement:
+    """
+    `column = ANY(:values)` condition: one array parameter, so the statement is the
+    same for any number of values. databases without arrays get `column IN (...)`.
+    """
+    if db_session.get_bind().dialect.name != "postgresql":
+        return column.in_(values)
+    return column == sa.any_(
+        sa.bindparam("values", values, type_=postgresql.ARRAY(column_type))
+    )
+
+
+USER_UNIQUE_FIELDS_MESSAGES = {
+    "username": "Username already exists.",
+    "phone_number": "Phone number already exists.",
+    "email_address": "Email address already exists.",
+}
 
 
+def unique_violation_message(error: sa.exc.IntegrityError) -> str | None:
+    """
+    Maps a unique constraint violation of the users table back to its conflict message.
+
+    The violated constraint is read from the driver error (asyncpg exposes `constraint_name`,
+    e.g. `user_users_username_key`); for drivers without it the error text is matched
+    against the `<table>.<column>` / `<table>_<column>_key` names.
+
+    :param error: IntegrityError raised by the INSERT/UPDATE.
+    :return: the conflict message, or None if the error is not a known unique violation.
+    """
+    driver_error = getattr(error.orig, "__cause__", None) or error.orig
+    constraint_name = getattr(driver_error, "constraint_name", None)
+    error_text = str(error.orig)
+    table = UserModel.__tablename__
+    for field, message in USER_UNIQUE_FIELDS_MESSAGES.items():
+        if constraint_name == f"{table}_{field}_key":
+            return message
+        if constraint_name is None and (
+            f"{table}.{field}" in error_text or f"{table}_{field}_key" in error_text
+        ):
+            return message
+    return None
+
+
+@traced()
 async def create_user(user_data: dict, db_session: AsyncSA.AsyncSession) -> tuple:
     """
     Attempts to create a new user in the database.
 
-    This function checks for existing users with the same username, phone number, or email address.
-    If any of these fields already exist in the database, it returns a corresponding HTTP 409 conflict
-    with an appropriate error message. If no conflicts are found, it creates and saves the user.
+    The user is written with a single `INSERT ... RETURNING id` statement, uniqueness of the
+    username, phone number and email address is enforced by the table unique constraints.
+    If one of them is violated, the constraint is mapped back to a HTTP 409 conflict with an
+    appropriate error message, so concurrent creations of the same user can not race.
+    A `user.created` event is added to the outbox in the same transaction.
 
     :param user_data: A dictionary or Pydantic model containing user attributes.
     :param db_session: SQLAlchemy session object used for database operations.
     :return:
         - On success: a tuple containing the created UserModel instance, e.g. `(new_user,)`
         - On failure: a tuple with HTTP status code and error message, e.g. `(409, "Username already exists.")`
+        - If the password hashing executor is saturated: `(503, "Password hashing service is busy, try again later.")`
     """
-    query = sa.select(UserModel).filter(
-        sa.or_(
-            UserModel.username == user_data["username"],
-            UserModel.phone_number == user_data["phone_number"],
-            UserModel.email_address == user_data["email_address"],
-        )
-    )
-    result = (await db_session.execute(query)).scalar_one_or_none()
-    if result:
-        if result.username == user_data["username"]:
-            return (
-                http_status.HTTP_409_CONFLICT,
-                "Username already exists.",
-            )
-        elif result.phone_number == user_data["phone_number"]:
-            return (
-                http_status.HTTP_409_CONFLICT,
-                "Phone number already exists.",
-            )
-        elif result.email_address == user_data["email_address"]:
-            return (
-                http_status.HTTP_409_CONFLICT,
-                "Email address already exists.",
-            )
-
     new_user = UserModel(**user_data)
-    new_user.set_password(new_user.password)
+    try:
+        await new_user.set_password(new_user.password)
+    except HashingQueueFullError:
+        return (
+            http_status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Password hashing service is busy, try again later.",
+        )
     new_user.set_public_key()
     db_session.add(new_user)
 
     try:
+        await db_session.flush()
+        await _add_outbox_events(
+            db_session, [_user_event(UserEventType.CREATED, new_user)]
+        )
+        # detach the user, so the commit does not expire the attributes we just wrote
+        # (no SELECT is needed to return the created user)
+        db_session.expunge(new_user)
         await db_session.commit()
+    except sa.exc.IntegrityError as e:
+        await db_session.rollback()
+        message = unique_violation_message(e)
+        if message:
+            return (http_status.HTTP_409_CONFLICT, message)
+        return (
+            http_status.HTTP_500_INTERNAL_SERVER_ERROR,
+            f"there was an error in the saving the user in db. check logs for more info. + {e.args}",
+        )
     except Exception as e:
         print(e)
         await db_session.rollback()
@@ -59,16 +165,24 @@ async def create_user(user_data: dict, db_session: AsyncSA.AsyncSession) -> tupl
             http_status.HTTP_500_INTERNAL_SERVER_ERROR,
             f"there was an error in the saving the user in db. check logs for more info. + {e.args}",
         )
-    await db_session.refresh(new_user)
+    outbox_relay.notify()
+    # drop cached "not found" results for the new user keys
+    await user_cache.invalidate(
+        user_id=new_user.id,
+        usernames=[new_user.username],
+        public_keys=[new_user.public_key],
+    )
     return (new_user,)
 
 
+@traced()
 async def delete_user(user_id: int, db_session: AsyncSA.AsyncSession) -> tuple:
     """
     Attempts to delete a user by their ID.
 
     Executes a delete query on the UserModel table for the given user ID. If the user is successfully deleted,
     it returns a tuple with a single `True` value. Otherwise, returns an appropriate HTTP status code and error message.
+    A `user.deleted` event is added to the outbox in the same transaction.
 
     :param user_id: The ID of the user to be deleted.
     :param db_session: SQLAlchemy session object used for database operations.
@@ -78,17 +192,31 @@ async def delete_user(user_id: int, db_session: AsyncSA.AsyncSession) -> tuple:
         - On error: `(500, "An error occurred")`
     """
 
-    query = sa.delete(UserModel).filter_by(id=user_id)
+    query = (
+        sa.delete(UserModel)
+        .filter_by(id=user_id)
+        .returning(UserModel.id, UserModel.username, UserModel.public_key)
+    )
     try:
-        result = await db_session.execute(query)
-        await db_session.commit()
-        if result.rowcount > 0:
-            return (True,)
-        else:
+        deleted = (await db_session.execute(query)).first()
+        if not deleted:
+            # nothing else of the transaction (e.g. a processed event id) is kept
+            await db_session.rollback()
             return (
                 http_status.HTTP_400_BAD_REQUEST,
                 "User not found or no changes made",
             )
+        await _add_outbox_events(
+            db_session, [_user_event(UserEventType.DELETED, deleted)]
+        )
+        await db_session.commit()
+        outbox_relay.notify()
+        await user_cache.invalidate(
+            user_id=user_id,
+            usernames=[deleted.username],
+            public_keys=[deleted.public_key],
+        )
+        return (True,)
     except Exception as e:
         await db_session.rollback()
         return (
@@ -97,37 +225,87 @@ async def delete_user(user_id: int, db_session: AsyncSA.AsyncSession) -> tuple:
         )
 
 
+USER_VERSION_CONFLICT = (
+    http_status.HTTP_412_PRECONDITION_FAILED,
+    "User was modified by another request.",
+)
+
+
+@traced()
 async def update_user(
-    user_data: dict, user_id: int, db_session: AsyncSA.AsyncSession
+    user_data: dict,
+    user_id: int,
+    db_session: AsyncSA.AsyncSession,
+    expected_version: int | None = None,
 ) -> tuple:
     """
     Updates the information of an existing user.
 
     This function takes updated user data and applies it to the user with the specified ID.
-    It hashes the password before updating and commits the changes to the database.
+    If a new password is given it is hashed (off the event loop) before updating, a missing
+    (None) password leaves the current one untouched and costs no hashing. The changes are
+    committed to the database (with a `user.updated` outbox event) and the version of the
+    user is incremented.
+
+    If `expected_version` is given the update is only applied if the user is still at that
+    version (optimistic locking), otherwise 412 is returned.
 
     :param user_data: Dictionary or Pydantic model containing the updated user fields.
     :param user_id: The ID of the user to update.
     :param db_session: SQLAlchemy session object used for database operations.
+    :param expected_version: version the caller based its changes on, None skips the check.
     :return:
-        - On success: a tuple containing True, e.g. `(True,)`
+        - On success: a tuple containing the new version of the user, e.g. `(2,)`
         - If user not found or no changes made: `(400, "User not found or no changes made")`
+        - If the user was modified meanwhile: `(412, "User was modified by another request.")`
+        - If the password hashing executor is saturated: `(503, "Password hashing service is busy, try again later.")`
         - On error: `(500, "An error occurred")`
     """
 
-    user_data = user_data
-    user_data["password"] = hashManager.hash(user_data["password"])
-    query = sa.update(UserModel).where(UserModel.id == user_id).values(**user_data)
+    if user_data.get("password") is None:
+        user_data.pop("password", None)
+    else:
+        try:
+            user_data["password"] = await passwordHasher.hash(user_data["password"])
+        except HashingQueueFullError:
+            return (
+                http_status.HTTP_503_SERVICE_UNAVAILABLE,
+                "Password hashing service is busy, try again later.",
+            )
+    query = (
+        sa.update(UserModel)
+        .where(UserModel.id == user_id)
+        .values(**user_data, version=UserModel.next_version())
+        .returning(*USER_EVENT_COLUMNS)
+    )
+    if expected_version is not None:
+        query = query.where(UserModel.version == expected_version)
     try:
-        result = await db_session.execute(query)
-        await db_session.commit()
-        if result.rowcount > 0:
-            return (True,)
-        else:
+        updated = (await db_session.execute(query)).first()
+        if not updated:
+            conflict = expected_version is not None and await _user_exists(
+                user_id, db_session
+            )
+            # nothing else of the transaction (e.g. a processed event id) is kept
+            await db_session.rollback()
+            if conflict:
+                return USER_VERSION_CONFLICT
             return (
                 http_status.HTTP_400_BAD_REQUEST,
                 "User not found or no changes made",
             )
+        await _add_outbox_events(
+            db_session, [_user_event(UserEventType.UPDATED, updated)]
+        )
+        await db_session.commit()
+        outbox_relay.notify()
+        # the old username (if changed) is dropped through the cached id entry
+        await user_cache.invalidate(
+            user_id=user_id,
+            usernames=[updated.username],
+            public_keys=[updated.public_key],
+        )
+        return (updated.version,)
     except Exception as e:
         await db_session.rollback()
         return (
@@ -136,6 +314,386 @@ async def update_user(
         )
 
 
+async def _user_exists(user_id: int, db_session: AsyncSA.AsyncSession) -> bool:
+    query = sa.select(sa.exists().where(UserModel.id == user_id))
+    return bool((await db_session.execute(query)).scalar())
+
+
+@traced()
+async def patch_user(
+    user_data: dict,
+    user_id: int,
+    db_session: AsyncSA.AsyncSession,
+    expected_version: int | None = None,
+) -> tuple:
+    """
+    Partially updates an existing user, only the given fields are written.
+
+    The current values of the given fields are read (and the row locked) first; fields
+    that already hold the given value are dropped, and if nothing is left no UPDATE is
+    issued at all (and no outbox event is added). A password is only hashed if one is
+    given, before the row is locked. The user cache is
+    invalidated whenever the version changes, including the old username key on a rename.
+
+    If `expected_version` is given the user must still be at that version (optimistic
+    locking), otherwise 412 is returned.
+
+    :param user_data: the fields to change, e.g. `model_dump(exclude_unset=True)`.
+    :param user_id: The ID of the user to update.
+    :param db_session: SQLAlchemy session object used for database operations.
+    :param expected_version: version the caller based its changes on, None skips the check.
+    :return:
+        - On success: a tuple with the (new) version of the user, e.g. `(2,)`
+        - If user not found: `(400, "User not found or no changes made")`
+        - If the user was modified meanwhile: `(412, "User was modified by another request.")`
+        - If a unique field is taken: `(409, "Username already exists.")`
+        - If the password hashing executor is saturated: `(503, "Password hashing service is busy, try again later.")`
+        - On error: `(500, "An error occurred")`
+    """
+    user_data = dict(user_data)
+    password = user_data.pop("password", None)
+    new_password = None
+    if password is not None:
+        # hashed before the row is locked, the lock and the connection are not held
+        # while the hashing job runs
+        try:
+            new_password = await passwordHasher.hash(password)
+        except HashingQueueFullError:
+            return (
+                http_status.HTTP_503_SERVICE_UNAVAILABLE,
+                "Password hashing service is busy, try again later.",
+            )
+    query = (
+        sa.select(
+            UserModel.username,
+            UserModel.public_key,
+            UserModel.version,
+            *(getattr(UserModel, field) for field in user_data),
+        )
+        .where(UserModel.id == user_id)
+        .with_for_update()
+    )
+    current = (await db_session.execute(query)).first()
+    if current is None:
+        await db_session.rollback()
+        return (http_status.HTTP_400_BAD_REQUEST, "User not found or no changes made")
+    if expected_version is not None and current.version != expected_version:
+        await db_session.rollback()
+        return USER_VERSION_CONFLICT
+
+    changes = {
+        field: value
+        for field, value in user_data.items()
+        if getattr(current, field) != value
+    }
+    if new_password is not None:
+        changes["password"] = new_password
+    if not changes:
+        await db_session.rollback()
+        return (current.version,)
+
+    # the row is locked, so the version can not have changed since it was read
+    query = (
+        sa.update(UserModel)
+        .where(UserModel.id == user_id)
+        .values(**changes, version=current.version + 1)
+        .returning(*USER_EVENT_COLUMNS)
+    )
+    try:
+        updated = (await db_session.execute(query)).first()
+        await _add_outbox_events(
+            db_session, [_user_event(UserEventType.UPDATED, updated)]
+        )
+        await db_session.commit()
+    except sa.exc.IntegrityError as e:
+        await db_session.rollback()
+        message = unique_violation_message(e)
+        if message:
+            return (http_status.HTTP_409_CONFLICT, message)
+        return (http_status.HTTP_500_INTERNAL_SERVER_ERROR, "An error occurred")
+    except Exception:
+        await db_session.rollback()
+        return (http_status.HTTP_500_INTERNAL_SERVER_ERROR, "An error occurred")
+
+    outbox_relay.notify()
+    # the cached user holds the version (ETag), so even a password change drops it
+    await user_cache.invalidate(
+        user_id=user_id,
+        # the new username may have a cached "not found" entry
+        usernames=[current.username, changes.get("username")],
+        public_keys=[current.public_key],
+    )
+    return (current.version + 1,)
+
+
+async def _hash_passwords(passwords: list, concurrency: int | None = None) -> list:
+    """
+    hash passwords concurrently, a saturated executor yields None for that password.
+    `concurrency` caps how many of these passwords are in the executor at once, so a
+    big batch leaves room in the executor for other requests.
+    """
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def _hash(password: str) -> str:
+        if semaphore is None:
+            return await passwordHasher.hash(password)
+        async with semaphore:
+            return await passwordHasher.hash(password)
+
+    hashed = await asyncio.gather(
+        *(_hash(password) for password in passwords), return_exceptions=True
+    )
+    for result in hashed:
+        if isinstance(result, BaseException) and not isinstance(
+            result, HashingQueueFullError
+        ):
+            raise result
+    return [None if isinstance(result, BaseException) else result for result in hashed]
+
+
+@traced()
+async def bulk_create_users(
+    users_data: list[dict],
+    db_session: AsyncSA.AsyncSession,
+    hash_concurrency: int | None = None,
+) -> list[tuple]:
+    """
+    Inserts many users with a single `INSERT ... ON CONFLICT DO NOTHING RETURNING` statement.
+
+    Passwords are hashed concurrently in the hashing executor. A `user.created` event is
+    added to the outbox for every created user. The changes are **not** committed, the
+    caller owns the transaction (and cache invalidation after commit).
+
+    :param users_data: list of dictionaries containing user attributes.
+    :param db_session: SQLAlchemy session object used for database operations.
+    :param hash_concurrency: maximum number of passwords hashed at once, unlimited by default.
+    :return: one result per given user, in order:
+        - On success: `(new_user_row,)` with the `DumpUserScheme` fields of the user.
+        - If the username, phone number or email address already exists: `(409, "User already exists.")`
+        - If the password hashing executor is saturated: `(503, "Password hashing service is busy, try again later.")`
+    """
+    results: list = [None] * len(users_data)
+    hashed_passwords = await _hash_passwords(
+        [user_data["password"] for user_data in users_data],
+        concurrency=hash_concurrency,
+    )
+
+    rows, rows_index = [], {}
+    for index, (user_data, hashed) in enumerate(zip(users_data, hashed_passwords)):
+        if hashed is None:
+            results[index] = (
+                http_status.HTTP_503_SERVICE_UNAVAILABLE,
+                "Password hashing service is busy, try again later.",
+            )
+            continue
+        if user_data["username"] in rows_index:
+            results[index] = (http_status.HTTP_409_CONFLICT, "User already exists.")
+            continue
+        rows_index[user_data["username"]] = index
+        rows.append({**user_data, "password": hashed, "public_key": str(uuid.uuid4())})
+
+    if rows:
+        query = (
+            postgresql.insert(UserModel)
+            .values(rows)
+            .on_conflict_do_nothing()
+            .returning(*USER_EVENT_COLUMNS)
+        )
+        created = (await db_session.execute(query)).all()
+        await _add_outbox_events(
+            db_session, [_user_event(UserEventType.CREATED, row) for row in created]
+        )
+        for row in created:
+            results[rows_index.pop(row.username)] = (row,)
+        for index in rows_index.values():
+            results[index] = (http_status.HTTP_409_CONFLICT, "User already exists.")
+
+    return results
+
+
+@traced()
+async def bulk_update_users(
+    users_data: list[tuple[int, dict, int | None]],
+    db_session: AsyncSA.AsyncSession,
+    hash_concurrency: int | None = None,
+) -> list[tuple]:
+    """
+    Updates many users by primary key with a single bulk UPDATE (executemany).
+
+    Existing rows are selected (and locked) first with one `WHERE id = ANY(...)` query to
+    report missing users, to check the expected versions and to learn the old usernames
+    for cache invalidation. Only given (not None) passwords are hashed, before the rows are
+    locked. A `user.updated` event is added to the outbox for every updated user. The changes
+    are **not** committed, the caller owns the transaction.
+
+    :param users_data: list of `(user_id, user_data, expected_version)` tuples, an
+        expected version of None skips the optimistic locking check.
+    :param db_session: SQLAlchemy session object used for database operations.
+    :param hash_concurrency: maximum number of passwords hashed at once, unlimited by default.
+    :return: one result per given user, in order:
+        - On success: `(old_user_row,)` with id, username, public_key and version before the update.
+        - If user not found: `(400, "User not found or no changes made")`
+        - If the user is not at the expected version: `(412, "User was modified by another request.")`
+        - If the password hashing executor is saturated: `(503, "Password hashing service is busy, try again later.")`
+    """
+    # hashed before the rows are locked, the locks are not held while the jobs run
+    hashed_passwords = iter(
+        await _hash_passwords(
+            [
+                user_data["password"]
+                for _, user_data, _ in users_data
+                if user_data.get("password") is not None
+            ],
+            concurrency=hash_concurrency,
+        )
+    )
+
+    ids = [user_id for user_id, _, _ in users_data]
+    query = (
+        sa.select(
+            UserModel.id, UserModel.username, UserModel.public_key, UserModel.version
+        )
+        .where(_any_of(UserModel.id, ids, sa.BigInteger, db_session))
+        .with_for_update()
+    )
+    existing = {row.id: row for row in (await db_session.execute(query)).all()}
+
+    results, rows = [], []
+    for user_id, user_data, expected_version in users_data:
+        user_data = dict(user_data)
+        hashed = True
+        if user_data.get("password") is None:
+            user_data.pop("password", None)
+        else:
+            hashed = user_data["password"] = next(hashed_passwords)
+
+        if user_id not in existing:
+            results.append(
+                (
+                    http_status.HTTP_400_BAD_REQUEST,
+                    "User not found or no changes made",
+                )
+            )
+        elif (
+            expected_version is not None
+            and existing[user_id].version != expected_version
+        ):
+            results.append(USER_VERSION_CONFLICT)
+        elif hashed is None:
+            results.append(
+                (
+                    http_status.HTTP_503_SERVICE_UNAVAILABLE,
+                    "Password hashing service is busy, try again later.",
+                )
+            )
+        else:
+            rows.append(
+                {**user_data, "id": user_id, "version": existing[user_id].version + 1}
+            )
+            results.append((existing[user_id],))
+
+    if rows:
+        await db_session.execute(sa.update(UserModel), rows)
+        await _add_outbox_events(
+            db_session,
+            [
+                _user_event(
+                    UserEventType.UPDATED,
+                    {**row, "public_key": existing[row["id"]].public_key},
+                )
+                for row in rows
+            ],
+        )
+    return results
+
+
+@traced()
+async def bulk_delete_users(
+    user_ids: list[int], db_session: AsyncSA.AsyncSession
+) -> list[tuple]:
+    """
+    Deletes many users with a single `DELETE ... WHERE id = ANY(...) RETURNING` statement.
+
+    A `user.deleted` event is added to the outbox for every deleted user. The changes are
+    **not** committed, the caller owns the transaction.
+
+    :param user_ids: ids of the users to delete.
+    :param db_session: SQLAlchemy session object used for database operations.
+    :return: one result per given id, in order:
+        - On success: `(deleted_user_row,)` with id, username and public_key of the user.
+        - If user not found: `(400, "User not found or no changes made")`
+    """
+    query = (
+        sa.delete(UserModel)
+        .where(_any_of(UserModel.id, user_ids, sa.BigInteger, db_session))
+        .returning(UserModel.id, UserModel.username, UserModel.public_key)
+    )
+    deleted = {row.id: row for row in (await db_session.execute(query)).all()}
+    await _add_outbox_events(
+        db_session,
+        [_user_event(UserEventType.DELETED, row) for row in deleted.values()],
+    )
+    return [
+        (
+            (deleted[user_id],)
+            if user_id in deleted
+            else (
+                http_status.HTTP_400_BAD_REQUEST,
+                "User not found or no changes made",
+            )
+        )
+        for user_id in user_ids
+    ]
+
+
+@traced()
+async def get_user_by_field(
+    field: str, value, db_session: AsyncSA.AsyncSession
+) -> tuple:
+    """
+    Retrieves a user by one of its unique lookup fields (id, username or public_key).
+
+    The user cache is consulted first; on a miss the user is loaded from the database
+    and the result (including "not found") is stored in the cache. Concurrent misses of
+    the same key are coalesced into a single database query.
+
+    :param field: name of the lookup field, one of `UserCache.LOOKUP_FIELDS`.
+    :param value: value of the lookup field.
+    :param db_session: SQLAlchemy session for DB operations.
+    :return:
+        - On success: a tuple with the user, e.g. `(user,)`
+        - On failure: a tuple with HTTP status code and error message.
+    """
+    field_label = "ID" if field == "id" else field.replace("_", " ")
+    not_found = (
+        http_status.HTTP_404_NOT_FOUND,
+        f"No user found with the given {field_label}.",
+    )
+    hit, user = await user_cache.get(field, value)
+    if not hit:
+        user = await user_lookups.do(
+            (field, value), lambda: _load_user_by_field(field, value, db_session)
+        )
+    return (user,) if user else not_found
+
+
+@traced()
+async def _load_user_by_field(
+    field: str, value, db_session: AsyncSA.AsyncSession
+) -> DumpUserScheme | None:
+    """load a user from the database and store the result in the user cache"""
+    started_at = time.perf_counter()
+    query = sa.select(UserModel).filter_by(**{field: value})
+    result = (await db_session.execute(query)).scalar_one_or_none()
+    if not result:
+        await user_cache.set_not_found(field, value)
+        return None
+
+    user = DumpUserScheme.model_validate(result)
+    await user_cache.set(user, delta=time.perf_counter() - started_at)
+    return user
+
+
 async def get_user_by_id(user_id: int, db_session: AsyncSA.AsyncSession) -> tuple:
     """
     Retrieves a user by their unique ID.
@@ -143,17 +701,10 @@ async def get_user_by_id(user_id: int, db_session: AsyncSA.AsyncSession) -> tupl
     :param user_id: The ID of the user.
     :param db_session: SQLAlchemy session for DB operations.
     :return:
-        - On success: a tuple with the user instance, e.g. `(user,)`
+        - On success: a tuple with the user, e.g. `(user,)`
         - On failure: a tuple with HTTP status code and error message.
     """
-    query = sa.select(UserModel).filter_by(id=user_id)
-    result = (await db_session.execute(query)).scalar_one_or_none()
-    if not result:
-        return (
-            http_status.HTTP_404_NOT_FOUND,
-            "No user found with the given ID.",
-        )
-    return (result,)
+    return await get_user_by_field("id", user_id, db_session)
 
 
 async def get_user_by_username(
@@ -165,17 +716,10 @@ async def get_user_by_username(
     :param username: The username to search for.
     :param db_session: SQLAlchemy session for DB operations.
     :return:
-        - On success: a tuple with the user instance, e.g. `(user,)`
+        - On success: a tuple with the user, e.g. `(user,)`
         - On failure: a tuple with HTTP status code and error message.
     """
-    query = sa.select(UserModel).filter_by(username=username)
-    result = (await db_session.execute(query)).scalar_one_or_none()
-    if not result:
-        return (
-            http_status.HTTP_404_NOT_FOUND,
-            "No user found with the given username.",
-        )
-    return (result,)
+    return await get_user_by_field("username", username, db_session)
 
 
 async def get_user_by_public_key(
@@ -187,20 +731,259 @@ async def get_user_by_public_key(
     :param public_key: The public key to search for.
     :param db_session: SQLAlchemy session for DB operations.
     :return:
-        - On success: a tuple with the user instance, e.g. `(user,)`
+        - On success: a tuple with the user, e.g. `(user,)`
         - On failure: a tuple with HTTP status code and error message.
     """
-    query = sa.select(UserModel).filter_by(public_key=public_key)
-    result = (await db_session.execute(query)).scalar_one_or_none()
-    if not result:
+    return await get_user_by_field("public_key", public_key, db_session)
+
+
+@traced()
+async def get_users_by_field_batch(
+    field: str, values: list, db_session: AsyncSA.AsyncSession
+) -> tuple:
+    """
+    Retrieves many users by one of their unique lookup fields (id, username or public_key).
+
+    As many users as possible are served from the user cache, the rest are loaded with a
+    single `WHERE <field> = ANY(...)` query (`IN (...)` on databases without arrays) and
+    stored in the cache (including the keys that found no user).
+
+    :param field: name of the lookup field, one of `UserCache.LOOKUP_FIELDS`.
+    :param values: lookup values, duplicates are allowed.
+    :param db_session: SQLAlchemy session for DB operations.
+    :return:
+        - On success: `({"items": [{"key": value, "user": user | None}, ...], "missing": [...]},)`
+          with one item per given value, in request order.
+        - On failure: a tuple with HTTP status code and error message, e.g. `(400, "Invalid user ID.")`
+    """
+    if field == "id":
+        try:
+            values = [int(value) for value in values]
+        except (TypeError, ValueError):
+            return (http_status.HTTP_400_BAD_REQUEST, "Invalid user ID.")
+        column_type = sa.BigInteger
+    else:
+        values = [str(value) for value in values]
+        column_type = sa.String
+
+    unique_values = list(dict.fromkeys(values))
+    users = {}
+    misses = []
+    cached = await user_cache.get_many(field, unique_values)
+    for value, (hit, user) in zip(unique_values, cached):
+        if not hit:
+            misses.append(value)
+        elif user is not None:
+            users[value] = user
+
+    if misses:
+        started_at = time.perf_counter()
+        query = sa.select(UserModel).where(
+            _any_of(getattr(UserModel, field), misses, column_type, db_session)
+        )
+        loaded = [
+            DumpUserScheme.model_validate(user)
+            for user in (await db_session.execute(query)).scalars()
+        ]
+        users.update({getattr(user, field): user for user in loaded})
+        await user_cache.set_many(
+            loaded,
+            not_found=[(field, value) for value in misses if value not in users],
+            delta=time.perf_counter() - started_at,
+        )
+
+    return (
+        {
+            "items": [{"key": value, "user": users.get(value)} for value in values],
+            "missing": [value for value in unique_values if value not in users],
+        },
+    )
+
+
+# hash checked for unknown usernames, so they take as long as known ones
+_dummy_password_hash: str | None = None
+
+
+@traced()
+async def verify_credentials(
+    username: str, password: str, client_ip: str, db_session: AsyncSA.AsyncSession
+) -> tuple:
+    """
+    Verifies a username and password.
+
+    Failed attempts are counted per username and per client ip in redis; once either
+    counter reached its limit, attempts are rejected without checking the password until
+    the throttle window expired. The password is checked in the hashing executor (never
+    on the event loop) and re-hashed if its hash does not match the current hashing
+    policy anymore, unknown usernames and inactive users are checked against a dummy
+    hash so they can not be told apart (from each other or from a wrong password) by
+    the response time. `last_login` / `login_attempts` of the user
+    are updated in the background by `login_activity`.
+
+    :param username: username of the user.
+    :param password: password to check.
+    :param client_ip: ip address of the client, used for throttling.
+    :param db_session: SQLAlchemy session for DB operations.
+    :return:
+        - On success: a tuple with the user, e.g. `(user,)`
+        - On invalid credentials: `(401, "Invalid username or password.")`
+        - If throttled: `(429, "Too many failed login attempts, try again later.")`
+        - If the password hashing executor is saturated: `(503, "Password hashing service is busy, try again later.")`
+    """
+    global _dummy_password_hash
+    throttle_limits = {
+        f"username:{username}": Setting.LOGIN_MAX_FAILED_ATTEMPTS,
+        f"ip:{client_ip}": Setting.LOGIN_MAX_FAILED_ATTEMPTS_PER_IP,
+    }
+    if await login_throttle.is_blocked(throttle_limits):
         return (
-            http_status.HTTP_404_NOT_FOUND,
-            "No user found with the given public key.",
+            http_status.HTTP_429_TOO_MANY_REQUESTS,
+            "Too many failed login attempts, try again later.",
         )
-    return (result,)
 
+    query = sa.select(UserModel).filter_by(username=username)
+    user = (await db_session.execute(query)).scalar_one_or_none()
+    if user is not None and not user.is_active:
+        user = None  # disabled accounts are handled like unknown usernames
+    try:
+        if user is None and _dummy_password_hash is None:
+            _dummy_password_hash = await passwordHasher.hash(uuid.uuid4().hex)
+        is_valid, new_hash = await passwordHasher.verify_and_update(
+            password, user.password if user else _dummy_password_hash
+        )
+    except HashingQueueFullError:
+        return (
+            http_status.HTTP_503_SERVICE_UNAVAILABLE,
+            "Password hashing service is busy, try again later.",
+        )
+
+    if user is None or not is_valid:
+        await login_throttle.add_failure(*throttle_limits)
+        if user is not None:
+            login_activity.record_failure(user.id)
+        return (http_status.HTTP_401_UNAUTHORIZED, "Invalid username or password.")
+
+    await login_throttle.reset(f"username:{username}")
+    login_activity.record_success(user.id)
+    if new_hash:
+        # outdated scheme or cost, upgraded now that the plain password is known
+        login_activity.record_password_upgrade(user.id, user.password, new_hash)
+    return (DumpUserScheme.model_validate(user),)
+
+
+USERS_CURSOR_ORDERINGS = ("id", "created_at")
+
+
+@traced()
+async def get_users_by_cursor(
+    db_session: AsyncSA.AsyncSession,
+    size: int,
+    cursor: str | None = None,
+    order_by: str = "id",
+    include_total: bool = False,
+) -> tuple:
+    """
+    Retrieves a page of users using keyset (cursor) pagination.
+
+    Users are ordered by `id`, or by `(created_at, id)`, and each page starts right after
+    the last row of the previous page (`WHERE (created_at, id) > (...)`) instead of using
+    OFFSET, so deep pages cost the same as the first one. The total count is only computed
+    when asked for, since it is a full table scan.
+
+    :param db_session: SQLAlchemy session for DB operations.
+    :param size: number of users per page.
+    :param cursor: opaque cursor returned as `next_cursor` by the previous page.
+    :param order_by: ordering key, one of `USERS_CURSOR_ORDERINGS`.
+    :param include_total: whether to count all users.
+    :return:
+        - On success: `(page,)` where page is a dict with `items`, `next_cursor` (None on the last page) and `total`.
+        - On an invalid cursor: `(400, "Invalid cursor.")`
+    """
+    if order_by == "created_at":
+        order_columns = (UserModel.created_at, UserModel.id)
+    else:
+        order_columns = (UserModel.id,)
 
-def get_all_users(): ...
+    query = sa.select(UserModel)
+    if cursor:
+        try:
+            values = decode_cursor(cursor)
+            if values["k"] != order_by:
+                raise ValueError("cursor ordering mismatch")
+            if order_by == "created_at":
+                last_values = (
+                    datetime.datetime.fromisoformat(values["v"][0]),
+                    int(values["v"][1]),
+                )
+            else:
+                last_values = (int(values["v"][0]),)
+        except (ValueError, KeyError, IndexError, TypeError):
+            return (http_status.HTTP_400_BAD_REQUEST, "Invalid cursor.")
+        query = query.where(sa.tuple_(*order_columns) > sa.tuple_(*last_values))
 
+    query = query.order_by(*order_columns).limit(size + 1)
+    users = list((await db_session.execute(query)).scalars().all())
+
+    next_cursor = None
+    if len(users) > size:
+        users = users[:size]
+        last_user = users[-1]
+        next_cursor = encode_cursor(
+            {
+                "k": order_by,
+                "v": (
+                    [last_user.created_at.isoformat(), last_user.id]
+                    if order_by == "created_at"
+                    else [last_user.id]
+                ),
+            }
+        )
+
+    total = None
+    if include_total:
+        total = await db_session.scalar(
+            sa.select(sa.func.count()).select_from(UserModel)
+        )
+    return ({"items": users, "next_cursor": next_cursor, "total": total},)
+
+
+USERS_EXPORT_FIELDS = tuple(
+    column.key for column in UserModel.__table__.columns if column.key != "password"
+)
+
+
+async def iter_users_export(
+    db_session: AsyncSA.AsyncSession,
+    fields: typing.Sequence[str] = USERS_EXPORT_FIELDS,
+    is_active: bool | None = None,
+    created_after: datetime.datetime | None = None,
+    created_before: datetime.datetime | None = None,
+    yield_per: int = 1000,
+) -> typing.AsyncIterator[list]:
+    """
+    Streams users from a server-side cursor, in batches of `yield_per` rows.
+
+    Only the requested columns are selected and at most one batch is held in memory,
+    so the whole table can be exported with constant memory.
+
+    :param db_session: SQLAlchemy session for DB operations.
+    :param fields: columns to export, a subset of `USERS_EXPORT_FIELDS`.
+    :param is_active: only export active (True) or inactive (False) users.
+    :param created_after: only export users created at or after this time.
+    :param created_before: only export users created before this time.
+    :param yield_per: number of rows fetched from the cursor at once.
+    :return: async iterator of row batches, each row is a tuple ordered like `fields`.
+    """
+    query = sa.select(*(getattr(UserModel, field) for field in fields)).order_by(
+        UserModel.id
+    )
+    if is_active is not None:
+        query = query.where(UserModel.is_active == is_active)
+    if created_after is not None:
+        query = query.where(UserModel.created_at >= created_after)
+    if created_before is not None:
+        query = query.where(UserModel.created_at < created_before)
 
-# TODO: instead of get_user_by a field create a function get_user_by_field
+    result = await db_session.stream(query.execution_options(yield_per=yield_per))
+    async for partition in result.partitions():
+        yield partition
@@ -0,0 +1,156 @@
+"""
+* users management
+* author: github.com/alisharify7
+* email: alisharifyofficial@gmail.com
+* license: see LICENSE for more details.
+* Copyright (c) 2025 - ali sharifi
+* https://github.com/alisharify7/user-service-management
+"""
+
+import asyncio
+import json
+import typing
+
+import aio_pika
+import sqlalchemy as sa
+import sqlalchemy.ext.asyncio as AsyncSA
+from sqlalchemy.dialects import postgresql
+
+from common_libs import tracing
+from common_libs.rabbitmq import RabbitMQManger, RabbitMQPublisher
+from core.config import get_config
+from core.db import Session
+from core.extensions import rabbitManager, rabbitPublisher
+from users.model import UserOutboxEvent
+
+Setting = get_config()
+
+
+class UserOutboxRelay:
+    """
+    Publishes the user change events of the outbox table to rabbitmq.
+
+    Every batch is read with `FOR UPDATE SKIP LOCKED` (so several workers can run a
+    relay without publishing the same rows), published through the confirm-mode
+    channel pool of `RabbitMQPublisher`, and deleted in the same transaction once
+    the broker confirmed every message. The publishes of a batch are pipelined and
+    their confirms awaited together; events of the same user share a channel, so
+    they keep their order.
+
+    Delivery is at-least-once: if the batch transaction fails after publishing, the
+    events are published again; consumers deduplicate by message id (the event ulid).
+    """
+
+    def __init__(
+        self,
+        session_factory: typing.Callable[[], AsyncSA.AsyncSession],
+        manager: RabbitMQManger,
+        publisher: RabbitMQPublisher,
+        exchange_name: str,
+        batch_size: int = 500,
+        poll_interval: float = 1.0,
+    ) -> None:
+        """
+        :param session_factory: creates the sessions used to read the outbox.
+        :param manager: rabbitmq manager, used to declare the exchange.
+        :param publisher: publisher the events are sent with.
+        :param exchange_name: topic exchange the events are published to.
+        :param batch_size: maximum number of events published per transaction.
+        :param poll_interval: seconds between two polls when nobody calls `notify`.
+        """
+        self.session_factory = session_factory
+        self.manager = manager
+        self.publisher = publisher
+        self.exchange_name = exchange_name
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+
+    def notify(self) -> None:
+        """wake the relay up, called after committing new outbox events"""
+        self._wakeup.set()
+
+    @staticmethod
+    def _message(event: UserOutboxEvent) -> aio_pika.Message:
+        body = {"event_type": event.event_type, "data": event.payload}
+        return aio_pika.Message(
+            body=json.dumps(body).encode(),
+            message_id=event.ulid,
+            type=event.event_type,
+            timestamp=event.created_at,
+            content_type="application/json",
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        )
+
+    async def relay_batch(self) -> int:
+        """publish (and delete) one batch of outbox events, returns its size"""
+        async with self.session_factory() as db_session:
+            query = (
+                sa.select(UserOutboxEvent)
+                .order_by(UserOutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            events = (await db_session.execute(query)).scalars().all()
+            if not events:
+                return 0
+
+            await self.manager.declare_exchange(
+                self.exchange_name,
+                channel_name=f"{self.publisher.channel_prefix}-0",
+                type=aio_pika.ExchangeType.TOPIC,
+                durable=True,
+            )
+            with tracing.span(
+                f"{self.exchange_name} publish",
+                kind="producer",
+                attributes={"messaging.batch.message_count": len(events)},
+            ):
+                await self.publisher.publish_many(
+                    [
+                        (self._message(event), event.event_type, event.aggregate_id)
+                        for event in events
+                    ],
+                    exchange_name=self.exchange_name,
+                )
+            ids = [event.id for event in events]
+            await db_session.execute(
+                sa.delete(UserOutboxEvent).where(
+                    UserOutboxEvent.id
+                    == sa.any_(
+                        sa.bindparam("ids", ids, type_=postgresql.ARRAY(sa.BigInteger))
+                    )
+                )
+            )
+            await db_session.commit()
+            return len(events)
+
+    async def run(self) -> None:
+        """relay the outbox until cancelled, meant to be started as a background task"""
+        while True:
+            try:
+                published = await self.relay_batch()
+            except Exception as e:
+                await self.manager.logger.error(
+                    f"outbox: publishing user events failed, retrying in {self.poll_interval}s. error: {e}"
+                )
+                await asyncio.sleep(self.poll_interval)
+                continue
+            if published >= self.batch_size:
+                continue  # more events are waiting
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+
+outbox_relay: UserOutboxRelay = UserOutboxRelay(
+    session_factory=Session,
+    manager=rabbitManager,
+    publisher=rabbitPublisher,
+    exchange_name=Setting.RABBITMQ_USERS_EVENTS_EXCHANGE,
+    batch_size=Setting.OUTBOX_BATCH_SIZE,
+    poll_interval=Setting.OUTBOX_POLL_INTERVAL_MS / 1000,
+)
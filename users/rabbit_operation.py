@@ -7,14 +7,60 @@
 * https://github.com/alisharify7/user-service-management
 """
 
+import asyncio
+import datetime
+import itertools
 import json
+import typing
 
+import sqlalchemy as sa
+import sqlalchemy.ext.asyncio as AsyncSA
 from aio_pika import IncomingMessage
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from starlette import status as http_status
 
+from common_libs.batching import MicroBatcher
+from common_libs.metrics import RABBITMQ_ACKED
+from common_libs.rabbitmq import RabbitMQConsumer, RabbitMQRetryPolicy
+from core.config import get_config
 from core.db import rabbit_get_session as get_session
-from core.extensions import rabbitManager
-from users.operations import create_user, delete_user, update_user
-from users.scheme import UserEvent
+from core.extensions import passwordHasher, rabbitManager, rabbitPublisher
+from users.cache import user_cache
+from users.model import ProcessedUserEvent
+from users.operations import (
+    bulk_create_users,
+    bulk_delete_users,
+    bulk_update_users,
+    create_user,
+    delete_user,
+    update_user,
+)
+from users.outbox import outbox_relay
+from users.scheme import UserEvent, UserEventType
+
+Setting = get_config()
+
+USERS_QUEUE = "users_queue"
+
+# result of an event whose message id was already processed (redelivery)
+ALREADY_PROCESSED = (None,)
+
+
+def user_event_ordering_key(message: IncomingMessage):
+    """
+    ordering key of a user event: the user id if the event carries one, otherwise
+    the username (create events). events of the same key are handled in order.
+    """
+    try:
+        data = json.loads(message.body).get("data") or {}
+    except (json.JSONDecodeError, AttributeError):
+        return None
+    if data.get("id") is not None:
+        return f"id:{data['id']}"
+    if data.get("username") is not None:
+        return f"username:{data['username']}"
+    return None
 
 
 async def process_consumed_message(message):
@@ -23,85 +69,270 @@ async def process_consumed_message(message):
     )
 
     try:
-        user_data = UserEvent.model_validate_json(json_data=message.body.decode())
-    except json.JSONDecodeError as e:
-        await message.nack(requeue=False)
+        user_data = UserEvent.model_validate_json(json_data=message.body)
+    except ValidationError as e:
+        # invalid json or event, retrying it would never succeed
         await rabbitManager.logger.info(
             f"error in validating consumed message with message_id: {message.message_id}. error {e}"
         )
+        await users_retry_policy.park(message, f"invalid event: {e}")
         return
-    if user_data.event_type.CREATED:
-        await rabbitManager.logger.info(
-            f"Message Type is {user_data.event_type.CREATED} for message_id: {message.message_id}"
-        )
-        await process_create_users(user_data=user_data, message=message)
-    elif user_data.event_type.UPDATED:
+    await rabbitManager.logger.info(
+        f"Message Type is {user_data.event_type.value} for message_id: {message.message_id}"
+    )
+    if user_events_batcher is not None:
+        result = await user_events_batcher.submit((message.message_id, user_data))
+    else:
+        result = await apply_user_event(user_data, message_id=message.message_id)
+    await acknowledge_user_event(message=message, user_data=user_data, result=result)
+
+
+async def acknowledge_user_event(
+    message: IncomingMessage, user_data: UserEvent, result: tuple
+) -> None:
+    """
+    ack a consumed message based on the result of its operation. failed events are
+    retried later if the failure is transient (5xx: database errors, hashing pool
+    saturated) and parked if it is permanent (4xx: conflicts, missing users).
+    """
+    action = {
+        UserEventType.CREATED: "created",
+        UserEventType.UPDATED: "updated",
+        UserEventType.DELETED: "deleted",
+    }[user_data.event_type]
+    if result is ALREADY_PROCESSED:
         await rabbitManager.logger.info(
-            f"Message Type is {user_data.event_type.UPDATED} for message_id: {message.message_id}"
+            f"duplicate event skipped, message_id: {message.message_id} was already processed"
         )
-        await process_update_users(user_data=user_data, message=message)
-    else:
+        await message.ack()
+        RABBITMQ_ACKED.labels(USERS_QUEUE).inc()
+        return
+    if len(result) != 1:
         await rabbitManager.logger.info(
-            f"Message Type is {user_data.event_type.DELETED} for message_id: {message.message_id}"
+            f"db error, user not {action}. {result}, for message_id: {message.message_id}"
         )
-        await process_delete_users(user_data=user_data, message=message)
+        reason = f"{result[0]}: {result[1]}"
+        if result[0] >= http_status.HTTP_500_INTERNAL_SERVER_ERROR:
+            await users_retry_policy.retry(message, reason)
+        else:
+            await users_retry_policy.park(message, reason)
+        return
 
+    await rabbitManager.logger.info(
+        f"user {action} successfully, for message_id: {message.message_id}"
+    )
+    await message.ack()
+    RABBITMQ_ACKED.labels(USERS_QUEUE).inc()
 
-async def consume_users_messages():
-    queue = await rabbitManager.declare_queue(
-        "users_queue", "consume_users_operation_channel", durable=True
+
+async def processed_message_ids(
+    message_ids: typing.Iterable[str], db_session: AsyncSA.AsyncSession
+) -> set[str]:
+    """return the given message ids that were already processed"""
+    message_ids = [message_id for message_id in message_ids if message_id]
+    if not message_ids:
+        return set()
+    query = sa.select(ProcessedUserEvent.message_id).where(
+        ProcessedUserEvent.message_id.in_(message_ids)
     )
-    await queue.consume(process_consumed_message)
+    return set((await db_session.execute(query)).scalars().all())
+
 
+async def apply_user_event(
+    user_data: UserEvent, message_id: typing.Optional[str] = None
+) -> tuple:
+    """
+    apply a single user event in its own transaction.
 
-async def process_create_users(message: IncomingMessage, user_data: UserEvent):
+    :param message_id: rabbitmq message id of the event, it is recorded in the
+        transaction of the change and an already recorded id skips the event.
+        operations only commit when they applied the change and roll back
+        otherwise, so the id of a failed event is not recorded and the event
+        can be retried or replayed from the parking queue.
+    """
     async with get_session() as session:
-        result = await create_user(
-            db_session=session, user_data=user_data.data.model_dump()
-        )
-        if len(result) != 1:
-            await rabbitManager.logger.info(
-                f"db error in creating user. {result}, for message_id: {message.message_id}"
+        if message_id:
+            if await processed_message_ids([message_id], db_session=session):
+                return ALREADY_PROCESSED
+            # pending until the operation commits its change, dropped on rollback
+            session.add(ProcessedUserEvent(message_id=message_id))
+        match user_data.event_type:
+            case UserEventType.CREATED:
+                return await create_user(
+                    db_session=session, user_data=user_data.data.model_dump()
+                )
+            case UserEventType.UPDATED:
+                return await update_user(
+                    db_session=session,
+                    user_id=user_data.data.id,
+                    user_data=user_data.data.model_dump(exclude={"id", "version"}),
+                    expected_version=user_data.data.version,
+                )
+            case UserEventType.DELETED:
+                return await delete_user(db_session=session, user_id=user_data.data.id)
+
+
+async def _apply_user_events_run(
+    event_type: UserEventType,
+    events: list[UserEvent],
+    db_session: AsyncSA.AsyncSession,
+) -> list[tuple]:
+    """apply events of one type with a single bulk operation, in the given session"""
+    match event_type:
+        case UserEventType.CREATED:
+            return await bulk_create_users(
+                [event.data.model_dump() for event in events],
+                db_session=db_session,
+                hash_concurrency=passwordHasher.max_workers,
+            )
+        case UserEventType.UPDATED:
+            return await bulk_update_users(
+                [
+                    (
+                        event.data.id,
+                        event.data.model_dump(exclude={"id", "version"}),
+                        event.data.version,
+                    )
+                    for event in events
+                ],
+                db_session=db_session,
+                hash_concurrency=passwordHasher.max_workers,
+            )
+        case UserEventType.DELETED:
+            return await bulk_delete_users(
+                [event.data.id for event in events], db_session=db_session
             )
-            await message.nack(requeue=False)
-            return
 
-        await rabbitManager.logger.info(
-            f"user created successfully, for message_id: {message.message_id}"
-        )
-        await message.ack()
 
+async def apply_user_events_batch(
+    consumed: list[tuple[typing.Optional[str], UserEvent]],
+) -> list[tuple]:
+    """
+    Apply a batch of user events in a single transaction using bulk statements.
 
-async def process_delete_users(message: IncomingMessage, user_data: UserEvent):
-    async with get_session() as session:
-        result = await delete_user(db_session=session, user_id=user_data.data.id)
-        if len(result) != 1:
-            await rabbitManager.logger.info(
-                f"db error in deleting user. {result}, for message_id: {message.message_id}"
+    Events are given with their message id: already processed ids are looked up
+    with one query and skipped (`ALREADY_PROCESSED`), the ids of the applied
+    events are recorded in the batch transaction.
+
+    Events are applied in arrival order, as runs of consecutive events of the same
+    type (one bulk statement per run). The consumer handles events of the same
+    `user_event_ordering_key` one after the other, so they never share a batch, but
+    that key is the username for creates and the id for updates and deletes: e.g.
+    the delete of a user and the re-create of its username can share one, and the
+    create must not run first. If the batch transaction fails as a whole (e.g. a
+    unique violation in a bulk update) every event is re-applied on its own, so
+    one bad event only fails itself.
+
+    Passwords of the creates and of the updates are hashed at most `max_workers` at
+    a time (updates before their rows are locked), so a full batch neither overflows
+    the hashing executor nor starves the http requests.
+
+    :return: one result per event, in the `users.operations` tuple convention.
+    """
+    events = [event for _, event in consumed]
+    results: list = [None] * len(events)
+
+    try:
+        async with get_session() as session:
+            processed = await processed_message_ids(
+                (message_id for message_id, _ in consumed), db_session=session
             )
-            await message.nack(requeue=False)
-            return
+            pending = []
+            for index, (message_id, event) in enumerate(consumed):
+                if message_id in processed:
+                    results[index] = ALREADY_PROCESSED
+                else:
+                    pending.append(index)
 
+            for event_type, run in itertools.groupby(
+                pending, key=lambda i: events[i].event_type
+            ):
+                run = list(run)
+                run_results = await _apply_user_events_run(
+                    event_type, [events[i] for i in run], db_session=session
+                )
+                for index, result in zip(run, run_results):
+                    results[index] = result
+            session.add_all(
+                ProcessedUserEvent(message_id=message_id)
+                for (message_id, _), result in zip(consumed, results)
+                if message_id and result is not ALREADY_PROCESSED and len(result) == 1
+            )
+            await session.commit()
+    except SQLAlchemyError as e:
         await rabbitManager.logger.info(
-            f"user deleted successfully, for message_id: {message.message_id}"
+            f"batch of {len(events)} user events failed, applying them one by one. error: {e}"
         )
-        await message.ack()
+        return [
+            await apply_user_event(event, message_id=message_id)
+            for message_id, event in consumed
+        ]
+
+    outbox_relay.notify()
+    for event, result in zip(events, results):
+        if result is ALREADY_PROCESSED or len(result) != 1:
+            continue
+        row = result[0]
+        usernames = [row.username]
+        if event.event_type == UserEventType.UPDATED:
+            usernames.append(event.data.username)
+        await user_cache.invalidate(
+            user_id=row.id, usernames=usernames, public_keys=[row.public_key]
+        )
+    return results
 
 
-async def process_update_users(message: IncomingMessage, user_data):
-    async with get_session() as session:
-        result = await update_user(
-            db_session=session,
-            user_id=user_data.data.id,
-            user_data=user_data.model_dump(),
+async def prune_processed_events(interval: float = 3600) -> None:
+    """
+    delete the processed message ids older than `RABBITMQ_DEDUP_RETENTION_HOURS`
+    every `interval` seconds, runs forever. redeliveries happen within minutes, so
+    the ids do not need to be kept longer than the retention of the queues.
+    """
+    while True:
+        cutoff = datetime.datetime.now(datetime.UTC) - datetime.timedelta(
+            hours=Setting.RABBITMQ_DEDUP_RETENTION_HOURS
         )
-        if len(result) != 1:
-            await rabbitManager.logger.info(
-                f"db error in updating user. {result}, for message_id: {message.message_id}"
+        try:
+            async with get_session() as session:
+                await session.execute(
+                    sa.delete(ProcessedUserEvent).where(
+                        ProcessedUserEvent.created_at < cutoff
+                    )
+                )
+                await session.commit()
+        except SQLAlchemyError as e:
+            await rabbitManager.logger.error(
+                f"pruning the processed user events failed. error: {e}"
             )
-            await message.nack(requeue=False)
-            return
-        await rabbitManager.logger.info(
-            f"user updated successfully, for message_id: {message.message_id}"
-        )
-        await message.ack()
+        await asyncio.sleep(interval)
+
+
+user_events_batcher: MicroBatcher | None = (
+    MicroBatcher(
+        flush=apply_user_events_batch,
+        max_batch_size=Setting.RABBITMQ_BATCH_SIZE,
+        max_delay=Setting.RABBITMQ_BATCH_MAX_DELAY_MS / 1000,
+    )
+    if Setting.RABBITMQ_BATCH_SIZE > 1
+    else None
+)
+
+users_retry_policy: RabbitMQRetryPolicy = RabbitMQRetryPolicy(
+    publisher=rabbitPublisher,
+    queue_name=USERS_QUEUE,
+    delays=[delay / 1000 for delay in Setting.RABBITMQ_RETRY_DELAYS_MS],
+    max_attempts=Setting.RABBITMQ_RETRY_MAX_ATTEMPTS,
+)
+users_consumer: RabbitMQConsumer = RabbitMQConsumer(
+    handler=process_consumed_message,
+    key_func=user_event_ordering_key,
+    prefetch_count=Setting.RABBITMQ_PREFETCH_COUNT,
+    max_concurrency=Setting.RABBITMQ_CONSUMER_CONCURRENCY,
+    retry_policy=users_retry_policy,  # also retries unexpected errors (e.g. db down)
+)
+
+
+async def consume_users_messages():
+    await users_consumer.run(
+        rabbitManager, USERS_QUEUE, "consume_users_operation_channel", durable=True
+    )
@@ -8,9 +8,9 @@
 """
 
 from enum import Enum
-from typing import Optional, Union
+from typing import Literal, Optional, Union
 
-from pydantic import BaseModel, ConfigDict, EmailStr, constr
+from pydantic import BaseModel, ConfigDict, EmailStr, constr, field_validator
 
 from users.model import Gender
 
@@ -39,12 +39,57 @@ class BaseDumpUserScheme(BaseModel):
 class DumpUserScheme(BaseDumpUserScheme):
     public_key: str
     id: int
+    version: int
 
 
-class UpdateUserScheme(BaseDumpUserScheme):
+class UsersCursorPageScheme(BaseModel):
+    items: list[DumpUserScheme]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+
+class VerifyCredentialsScheme(BaseModel):
+    username: constr(max_length=256)
     password: constr(max_length=128)
 
 
+class UsersBatchLookupScheme(BaseModel):
+    field: Literal["id", "username", "public_key"] = "id"
+    keys: list[Union[int, str]]
+
+
+class UsersBatchLookupItemScheme(BaseModel):
+    key: Union[int, str]
+    user: Optional[DumpUserScheme] = None
+
+
+class UsersBatchLookupResultScheme(BaseModel):
+    items: list[UsersBatchLookupItemScheme]
+    missing: list[Union[int, str]]
+
+
+class UpdateUserScheme(BaseDumpUserScheme):
+    password: Optional[constr(max_length=128)] = None  # None keeps the current password
+
+
+class PatchUserScheme(BaseModel):
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    username: Optional[constr(max_length=256)] = None
+    email_address: Optional[EmailStr] = None
+    phone_number: Optional[constr(max_length=16)] = None
+    gender: Optional[Gender] = None
+    password: Optional[constr(max_length=128)] = None
+
+    @field_validator("username", "password")
+    @classmethod
+    def not_null(cls, value):
+        """the fields are optional, but can not be set to null (NOT NULL columns)"""
+        if value is None:
+            raise ValueError("can not be null")
+        return value
+
+
 class UserEventType(str, Enum):
     CREATED = "user.created"
     UPDATED = "user.updated"
@@ -56,7 +101,8 @@ class CreateUserEvent(CreateUserScheme):
 
 
 class UpdateUserEvent(UpdateUserScheme):
-    pass
+    id: int
+    version: Optional[int] = None  # expected current version, None skips the check
 
 
 class DeleteUserEvent(BaseModel):
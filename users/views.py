@@ -7,18 +7,49 @@
 * https://github.com/alisharify7/user-service-management
 """
 
+import csv
+import datetime
+import enum
+import io
+import json
+import typing
+from typing import Literal, Optional
+
 import sqlalchemy as sa
 import sqlalchemy.ext.asyncio as AsyncSA
-from fastapi import Depends, HTTPException, Query
+from fastapi import Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi_pagination import Page, Params
 from fastapi_pagination.ext.sqlalchemy import paginate
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
 from starlette import status as http_status
 
 import users.operations as user_operations
-from core.db import get_session
+from common_libs.streaming import (
+    DuplexStreamingResponse,
+    StreamDecodeError,
+    iter_json_documents,
+)
+from core.config import get_config
+from core.db import get_session, get_session_factory
+from core.extensions import passwordHasher
 from users import users_router
+from users.cache import user_cache
 from users.model import User as UserModel
-from users.scheme import CreateUserScheme, DumpUserScheme, UpdateUserScheme
+from users.outbox import outbox_relay
+from users.scheme import (
+    CreateUserScheme,
+    DumpUserScheme,
+    PatchUserScheme,
+    UpdateUserScheme,
+    UsersBatchLookupResultScheme,
+    UsersBatchLookupScheme,
+    UsersCursorPageScheme,
+    VerifyCredentialsScheme,
+)
+
+Setting = get_config()
 
 
 @users_router.post("/", response_model=DumpUserScheme)
@@ -35,43 +66,287 @@ async def create_user(
     return result[0]
 
 
+def _bulk_result_line(index: int, status_code: int, **fields) -> str:
+    return json.dumps({"index": index, "status": status_code, **fields}) + "\n"
+
+
+async def _bulk_create_chunk(
+    rows: list[tuple[int, typing.Any]], db_session: AsyncSA.AsyncSession
+) -> typing.AsyncIterator[str]:
+    """
+    insert the valid users of a chunk in one statement + commit and yield a result
+    line for every row of the chunk (rows holding a str are pre-rendered error lines).
+    """
+    users_data = [data for _, data in rows if not isinstance(data, str)]
+    results = []
+    if users_data:
+        try:
+            # hash at most `max_workers` passwords at once, so a bulk upload never
+            # fills the hashing queue that single requests rely on.
+            results = await user_operations.bulk_create_users(
+                users_data=users_data,
+                db_session=db_session,
+                hash_concurrency=passwordHasher.max_workers,
+            )
+            await db_session.commit()
+            outbox_relay.notify()
+        except SQLAlchemyError:
+            await db_session.rollback()
+            results = [
+                (
+                    http_status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    "there was an error in the saving the user in db.",
+                )
+            ] * len(users_data)
+
+    results_iterator = iter(results)
+    for index, data in rows:
+        if isinstance(data, str):
+            yield data
+            continue
+        result = next(results_iterator)
+        if len(result) != 1:
+            yield _bulk_result_line(index, result[0], detail=result[1])
+            continue
+        row = result[0]
+        await user_cache.invalidate(
+            user_id=row.id, usernames=[row.username], public_keys=[row.public_key]
+        )
+        yield _bulk_result_line(
+            index,
+            http_status.HTTP_201_CREATED,
+            id=row.id,
+            username=row.username,
+            public_key=row.public_key,
+        )
+
+
+async def _bulk_create_users_results(
+    chunks: typing.AsyncIterator[bytes],
+    session_factory: AsyncSA.async_sessionmaker,
+) -> typing.AsyncIterator[str]:
+    """validate streamed users incrementally and create them chunk by chunk"""
+    rows, index = [], 0
+    async with session_factory() as db_session:
+        try:
+            async for document in iter_json_documents(chunks):
+                if isinstance(document, json.JSONDecodeError):
+                    rows.append(
+                        (
+                            index,
+                            _bulk_result_line(
+                                index,
+                                http_status.HTTP_400_BAD_REQUEST,
+                                detail=f"invalid JSON: {document}",
+                            ),
+                        )
+                    )
+                else:
+                    try:
+                        user_data = CreateUserScheme.model_validate(document)
+                        rows.append((index, user_data.model_dump()))
+                    except ValidationError as e:
+                        rows.append(
+                            (
+                                index,
+                                _bulk_result_line(
+                                    index,
+                                    http_status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                    detail=json.loads(e.json(include_url=False)),
+                                ),
+                            )
+                        )
+                index += 1
+
+                if len(rows) >= Setting.BULK_CREATE_CHUNK_SIZE:
+                    async for line in _bulk_create_chunk(rows, db_session):
+                        yield line
+                    rows = []
+        except StreamDecodeError as e:
+            rows.append(
+                (
+                    index,
+                    _bulk_result_line(
+                        index, http_status.HTTP_400_BAD_REQUEST, detail=str(e)
+                    ),
+                )
+            )
+
+        async for line in _bulk_create_chunk(rows, db_session):
+            yield line
+
+
+@users_router.post(
+    "/bulk",
+    response_class=DuplexStreamingResponse,
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/x-ndjson": {"schema": {"type": "string"}},
+                "application/json": {
+                    "schema": {"type": "array", "items": {"type": "object"}}
+                },
+            },
+            "required": True,
+        }
+    },
+)
+async def bulk_create_users(
+    request: Request,
+    session_factory: AsyncSA.async_sessionmaker = Depends(get_session_factory),
+):
+    """
+    creating many users from a streamed NDJSON or JSON array body of `CreateUserScheme` rows.
+
+    rows are validated as they arrive and inserted in chunks, the response streams
+    one NDJSON line per input row (in input order) with its `index` and `status`.
+    """
+    return DuplexStreamingResponse(
+        _bulk_create_users_results(request.stream(), session_factory),
+        media_type="application/x-ndjson",
+    )
+
+
+@users_router.post("/verify-credentials", response_model=DumpUserScheme)
+async def verify_credentials(
+    credentials: VerifyCredentialsScheme,
+    request: Request,
+    db_session: AsyncSA.AsyncSession = Depends(get_session),
+):
+    """
+    check a username and password, returns the user if they are valid.
+
+    failed attempts are throttled per username and client ip (HTTP 429).
+    """
+    result = await user_operations.verify_credentials(
+        username=credentials.username,
+        password=credentials.password,
+        client_ip=request.client.host if request.client else "unknown",
+        db_session=db_session,
+    )
+    if len(result) != 1:
+        headers = (
+            {"Retry-After": str(Setting.LOGIN_THROTTLE_WINDOW)}
+            if result[0] == http_status.HTTP_429_TOO_MANY_REQUESTS
+            else None
+        )
+        raise HTTPException(status_code=result[0], detail=result[1], headers=headers)
+    return result[0]
+
+
+def _user_etag(user_id: int, version: int) -> str:
+    """entity tag of a user document, changes with every update of the user"""
+    return f'"{user_id}-{version}"'
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """check an If-None-Match / If-Match header value against an entity tag"""
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _expected_version(if_match: Optional[str], user_id: int) -> Optional[int]:
+    """
+    version of the user an If-Match header refers to, None if there is no header.
+
+    :raises HTTPException: 412 if the header can not refer to a version of this user.
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    tag = if_match.split(",")[0].strip().removeprefix("W/").strip('"')
+    tag_user_id, _, version = tag.partition("-")
+    if tag_user_id != str(user_id) or not version.isdigit():
+        raise HTTPException(
+            status_code=http_status.HTTP_412_PRECONDITION_FAILED,
+            detail="User was modified by another request.",
+        )
+    return int(version)
+
+
+def _user_response(
+    result: tuple, request: Request, response: Response
+) -> DumpUserScheme | Response:
+    """
+    return a looked up user with its ETag, or an empty 304 response if the client
+    already has the current version (If-None-Match).
+    """
+    if len(result) != 1:
+        raise HTTPException(status_code=result[0], detail=result[1])
+    user = result[0]
+    etag = _user_etag(user.id, user.version)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=http_status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    response.headers["ETag"] = etag
+    return user
+
+
 @users_router.get("/id/{user_id}", response_model=DumpUserScheme)
 async def get_user_by_id(
-    user_id: int, db_session: AsyncSA.AsyncSession = Depends(get_session)
+    user_id: int,
+    request: Request,
+    response: Response,
+    db_session: AsyncSA.AsyncSession = Depends(get_session),
 ):
     """retrieve a user with  id"""
     result = await user_operations.get_user_by_id(
         user_id=user_id, db_session=db_session
     )
-    if len(result) != 1:
-        raise HTTPException(status_code=result[0], detail=result[1])
-    return result[0]
+    return _user_response(result, request, response)
 
 
 @users_router.get("/username/{username}", response_model=DumpUserScheme)
 async def get_user_by_username(
-    username: str, db_session: AsyncSA.AsyncSession = Depends(get_session)
+    username: str,
+    request: Request,
+    response: Response,
+    db_session: AsyncSA.AsyncSession = Depends(get_session),
 ):
     """retrieve a user with a username"""
     result = await user_operations.get_user_by_username(
         username=username, db_session=db_session
     )
-    if len(result) != 1:
-        raise HTTPException(status_code=result[0], detail=result[1])
-    return result[0]
+    return _user_response(result, request, response)
 
 
 @users_router.get("/public_key/{public_key}", response_model=DumpUserScheme)
 async def get_user_by_public_key(
-    public_key: str, db_session: AsyncSA.AsyncSession = Depends(get_session)
+    public_key: str,
+    request: Request,
+    response: Response,
+    db_session: AsyncSA.AsyncSession = Depends(get_session),
 ):
     """retrieve a user with a public-key"""
     result = await user_operations.get_user_by_public_key(
         public_key=public_key, db_session=db_session
     )
+    return _user_response(result, request, response)
+
+
+@users_router.post("/batch", response_model=UsersBatchLookupResultScheme)
+async def get_users_batch(
+    lookup: UsersBatchLookupScheme,
+    db_session: AsyncSA.AsyncSession = Depends(get_session),
+):
+    """
+    retrieve many users by their ids, usernames or public keys in one request.
+
+    `items` holds one entry per requested key in request order (`user` is null if no
+    user was found), `missing` lists the keys that found no user.
+    """
+    if len(lookup.keys) > Setting.BATCH_LOOKUP_MAX_KEYS:
+        raise HTTPException(
+            status_code=http_status.HTTP_400_BAD_REQUEST,
+            detail=f"too many keys, at most {Setting.BATCH_LOOKUP_MAX_KEYS} keys are allowed.",
+        )
+    result = await user_operations.get_users_by_field_batch(
+        field=lookup.field, values=lookup.keys, db_session=db_session
+    )
     if len(result) != 1:
         raise HTTPException(status_code=result[0], detail=result[1])
-
     return result[0]
 
 
@@ -91,20 +366,163 @@ async def get_all_users(
     )  # fastapi_paginate doesn't support asyncGenerator
 
 
+@users_router.get("/cursor", response_model=UsersCursorPageScheme)
+async def get_all_users_by_cursor(
+    cursor: Optional[str] = Query(None),
+    size: int = Query(10, ge=1, le=100),
+    order_by: Literal[user_operations.USERS_CURSOR_ORDERINGS] = Query("id"),
+    include_total: bool = Query(False),
+    db_session: AsyncSA.AsyncSession = Depends(get_session),
+):
+    """
+    list users with keyset pagination, pass `next_cursor` of a page as `cursor`
+    to get the next one. `total` is only computed if `include_total` is set.
+    """
+    result = await user_operations.get_users_by_cursor(
+        db_session=db_session,
+        size=size,
+        cursor=cursor,
+        order_by=order_by,
+        include_total=include_total,
+    )
+    if len(result) != 1:
+        raise HTTPException(status_code=result[0], detail=result[1])
+    return result[0]
+
+
+def _export_value(value: typing.Any) -> typing.Any:
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+async def _export_users_lines(
+    session_factory: AsyncSA.async_sessionmaker,
+    export_format: str,
+    fields: list[str],
+    **filters,
+) -> typing.AsyncIterator[str]:
+    """render exported users as NDJSON or CSV, one chunk per fetched batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if export_format == "csv":
+        writer.writerow(fields)
+
+    async with session_factory() as db_session:
+        async for rows in user_operations.iter_users_export(
+            db_session=db_session,
+            fields=fields,
+            yield_per=Setting.EXPORT_YIELD_PER,
+            **filters,
+        ):
+            for row in rows:
+                values = [_export_value(value) for value in row]
+                if export_format == "csv":
+                    writer.writerow(values)
+                else:
+                    buffer.write(json.dumps(dict(zip(fields, values))) + "\n")
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+
+@users_router.get("/export", response_class=StreamingResponse)
+async def export_users(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    fields: Optional[str] = Query(
+        None, description="comma separated list of columns, all columns by default"
+    ),
+    is_active: Optional[bool] = Query(None),
+    created_after: Optional[datetime.datetime] = Query(None),
+    created_before: Optional[datetime.datetime] = Query(None),
+    session_factory: AsyncSA.async_sessionmaker = Depends(get_session_factory),
+):
+    """
+    export all (filtered) users as NDJSON or CSV.
+
+    rows are streamed from a server-side cursor, so memory usage does not depend on
+    the number of exported users.
+    """
+    selected_fields = (
+        [field.strip() for field in fields.split(",") if field.strip()]
+        if fields
+        else list(user_operations.USERS_EXPORT_FIELDS)
+    )
+    invalid_fields = set(selected_fields) - set(user_operations.USERS_EXPORT_FIELDS)
+    if invalid_fields or not selected_fields:
+        raise HTTPException(
+            status_code=http_status.HTTP_400_BAD_REQUEST,
+            detail=f"invalid export fields: {sorted(invalid_fields)}, "
+            f"allowed fields: {list(user_operations.USERS_EXPORT_FIELDS)}",
+        )
+
+    return StreamingResponse(
+        _export_users_lines(
+            session_factory,
+            export_format,
+            selected_fields,
+            is_active=is_active,
+            created_after=created_after,
+            created_before=created_before,
+        ),
+        media_type="text/csv" if export_format == "csv" else "application/x-ndjson",
+        headers={
+            "Content-Disposition": f'attachment; filename="users.{export_format}"'
+        },
+    )
+
+
 @users_router.put("/{user_id}", status_code=http_status.HTTP_204_NO_CONTENT)
 async def update_user(
     user_id: int,
     user_data: UpdateUserScheme,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     db_session: AsyncSA.AsyncSession = Depends(get_session),
 ):
-    """Update a specific user"""
+    """
+    Update a specific user.
+
+    send the ETag of the user as `If-Match` to only update it if nobody else did meanwhile
+    (412 otherwise), the ETag of the updated user is returned.
+    """
     result = await user_operations.update_user(
-        user_id=user_id, db_session=db_session, user_data=user_data
+        user_id=user_id,
+        db_session=db_session,
+        user_data=user_data.model_dump(),
+        expected_version=_expected_version(if_match, user_id),
     )
     if len(result) != 1:
         raise HTTPException(status_code=result[0], detail=result[1])
 
-    return result[0]
+    response.headers["ETag"] = _user_etag(user_id, result[0])
+
+
+@users_router.patch("/{user_id}", status_code=http_status.HTTP_204_NO_CONTENT)
+async def patch_user(
+    user_id: int,
+    user_data: PatchUserScheme,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db_session: AsyncSA.AsyncSession = Depends(get_session),
+):
+    """
+    Partially update a specific user, only the sent fields are changed.
+
+    supports `If-Match` like PUT, the ETag of the updated user is returned.
+    """
+    result = await user_operations.patch_user(
+        user_id=user_id,
+        db_session=db_session,
+        user_data=user_data.model_dump(exclude_unset=True),
+        expected_version=_expected_version(if_match, user_id),
+    )
+    if len(result) != 1:
+        raise HTTPException(status_code=result[0], detail=result[1])
+
+    response.headers["ETag"] = _user_etag(user_id, result[0])
 
 
 @users_router.delete("/id/{user_id}", status_code=http_status.HTTP_204_NO_CONTENT)